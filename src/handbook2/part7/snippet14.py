@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-if images.itemsize == 8:
+# Normalization between 0 and 1 of 8 bits per pixel (itemsize is in bytes, so check the dtype)
+if images.dtype == 'uint8':
         images = images / 255.0
 # Normalization between 0 and 1 of 16 bits per pixel
-elif images.itemsize == 16:
+elif images.dtype == 'uint16':
         images = images / 65535.0
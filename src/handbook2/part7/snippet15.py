@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-if images.itemsize == 8:
+if images.dtype == 'uint8':
         images = images / 127.5 - 1
-elif images.itemsize == 16:
+elif images.dtype == 'uint16':
         images = images / 32767.5 - 1
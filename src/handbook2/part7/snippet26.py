@@ -14,8 +14,11 @@
 
 def one_hot(Y, C):
         """ Convert Vector to one-hot encoding """
-        Y = np.eye(C)[Y.reshape(-1)]
-        return Y
+        # set a single element per row (no C x C identity matrix, and float32 instead of float64)
+        Y = Y.reshape(-1)
+        one_hot = np.zeros((len(Y), C), dtype=np.float32)
+        one_hot[np.arange(len(Y)), Y] = 1
+        return one_hot
 
 # one-hot encode the labels
 labels = one_hot(labels, len(classes))
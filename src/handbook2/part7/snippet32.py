@@ -0,0 +1,231 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cv2
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import Pool, RawArray, cpu_count
+
+# the image file extensions in a dataset directory
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
+
+# the decoder-side downscaling (1/2, 1/4 or 1/8 of the JPEG DCT) of the color and grayscale decodes
+REDUCED = { 3: { 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8 },
+            1: { 2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8 } }
+
+# the shared (preallocated) image array, set in each worker process
+_images = None
+
+def listDirectory(parent):
+        ''' List the image files of a dataset, one subdirectory per class, in a single pass '''
+        classes = {}  # list of class to label mappings
+        files   = []  # list of image files
+        labels  = []  # label of each image file
+
+        # sort the subdirectories so the labels are the same on every run
+        for subdir in sorted(os.scandir(parent), key=lambda entry: entry.name):
+                # ignore any entry that is not a subdirectory (e.g., license file)
+                if not subdir.is_dir():
+                        continue
+
+                # maintain mapping of class (subdirectory name) to label (index)
+                label = classes[subdir.name] = len(classes)
+                for file in sorted(os.scandir(subdir.path), key=lambda entry: entry.name):
+                        if file.name.lower().endswith(EXTENSIONS):
+                                files.append(file.path)
+                                labels.append(label)
+
+        return files, np.asarray(labels, dtype=np.uint16), classes
+
+def jpegSize(data):
+        ''' The (width, height) of a JPEG from the start of frame of its header, or None if not a JPEG '''
+        if data[:2] != b'\xff\xd8':
+                return None
+        ix = 2
+        while ix + 9 < len(data):
+                if data[ix] != 0xFF:
+                        return None
+                marker = data[ix + 1]
+                # fill byte
+                if marker == 0xFF:
+                        ix += 1
+                        continue
+                # start of frame markers (C0 - CF), except DHT (C4), JPG (C8) and DAC (CC)
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                        return (data[ix + 7] << 8 | data[ix + 8], data[ix + 5] << 8 | data[ix + 6])
+                ix += 2 + (data[ix + 2] << 8 | data[ix + 3])
+        return None
+
+def reductionFactor(size, shape):
+        ''' The largest JPEG decode downscaling (8, 4, 2 or 1) which is still at least the target shape
+            size : the (width, height) of the JPEG
+            shape: the target (width, height)
+        '''
+        # compare the shortest side to the longest target side, so an EXIF rotation does not matter
+        for factor in (8, 4, 2):
+                if min(size) // factor >= max(shape):
+                        return factor
+        return 1
+
+def readImage(path, channels, shape, reduced=True):
+        ''' Read an image resized to the target shape, or None if it cannot be read
+            path    : the image file
+            channels: number of channels (1 is grayscale, 3 is color)
+            shape   : the target input shape (width, height)
+            reduced : whether a large JPEG is decoded directly at 1/2, 1/4 or 1/8 of its resolution (then
+                      resized for the remainder), instead of decoding the full resolution image
+        '''
+        try:
+                with open(path, 'rb') as f:
+                        data = f.read()
+        except OSError:
+                return None
+        return decodeImage(data, channels, shape, reduced)
+
+def decodeImage(data, channels, shape, reduced=True):
+        ''' Decode the (encoded) bytes of an image resized to the target shape, or None if it cannot be decoded
+            (see readImage())
+        '''
+        if not data:
+                return None
+        flag = cv2.IMREAD_GRAYSCALE if channels == 1 else cv2.IMREAD_COLOR
+        if reduced:
+                size = jpegSize(data)
+                factor = reductionFactor(size, shape) if size else 1
+                if factor > 1:
+                        flag = REDUCED[channels][factor]
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+        if image is None:
+                return None
+        return cv2.resize(image, shape, interpolation=cv2.INTER_AREA)
+
+def _initWorker(images, shape):
+        ''' Attach a worker process to the shared image array (a RawArray or a .npy file) '''
+        global _images
+        if isinstance(images, str):
+                # a memory-mapped .npy file (e.g., a dataset cache)
+                _images = np.load(images, mmap_mode='r+')
+        else:
+                _images = np.frombuffer(images, dtype=np.uint8).reshape(shape)
+        # one decode per process: don't let OpenCV also spawn a thread per core in every process
+        cv2.setNumThreads(1)
+
+def _loadChunk(chunk):
+        ''' Decode and resize a chunk of images straight into their slots of the shared image array '''
+        indices, paths, reduced = chunk
+        n, height, width, channels = _images.shape
+
+        failed = []
+        for ix, path in zip(indices, paths):
+                image = readImage(path, channels, (width, height), reduced)
+                # unreadable or corrupted file: the slot is left as zeros
+                if image is None:
+                        failed.append(ix)
+                        continue
+                # the image resized to the target input shape, into the slot of the image array
+                _images[ix] = image.reshape(height, width, channels)
+        return failed
+
+def loadImagesParallel(files, channels, shape, workers=None, chunksize=64, reduced=True):
+        ''' Load images over a pool of processes into a preallocated uint8 (N, H, W, C) array
+            files    : list of image files
+            channels : number of channels (1 is grayscale, 3 is color)
+            shape    : the target input shape (width, height), as in cv2.resize()
+            workers  : number of processes (default is the number of cores)
+            chunksize: number of images decoded by a process per task
+            reduced  : whether large JPEGs are decoded at a reduced resolution (see readImage())
+            returns the image array and the slots of the files which could not be read: these slots are left as
+            zeros, so the caller must drop (or mask) them
+        '''
+        width, height = shape
+        shape = (len(files), height, width, channels)
+
+        # the image array is allocated once in shared memory: each process writes its decoded
+        # images into their slots, so no images are pickled back or copied into a list
+        buffer = RawArray('B', int(np.prod(shape)))
+        images = np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+
+        return images, decodeImages(buffer, shape, files, workers=workers, chunksize=chunksize, reduced=reduced)
+
+def decodeImages(target, shape, files, indices=None, workers=None, chunksize=64, reduced=True):
+        ''' Decode and resize images over a pool of processes into their slots of a shared image array
+            target   : the shared image array, as a RawArray or the path of a .npy file
+            shape    : shape of the image array (N, H, W, C)
+            files    : list of image files
+            indices  : slot of each image file (default is 0 .. len(files) - 1)
+            workers  : number of processes (default is the number of cores)
+            chunksize: number of images decoded by a process per task
+            reduced  : whether large JPEGs are decoded at a reduced resolution (see readImage())
+            returns the slots of the files which could not be read
+        '''
+        if indices is None:
+                indices = range(len(files))
+        indices = list(indices)
+        chunks = [(indices[start:start + chunksize], files[start:start + chunksize], reduced) for start in range(0, len(files), chunksize)]
+        if not chunks:
+                return []
+
+        failed = []
+        with Pool(workers or cpu_count(), initializer=_initWorker, initargs=(target, shape)) as pool:
+                for slots in pool.imap_unordered(_loadChunk, chunks):
+                        failed.extend(slots)
+        return sorted(failed)
+
+def loadDirectoryParallel(parent, channels, shape, workers=None, chunksize=64, reduced=True):
+        ''' Load a dataset, one subdirectory per class, into a preallocated uint8 (N, H, W, C) array
+            (all the classes are fanned out together instead of one subdirectory at a time)
+            the files which could not be read are dropped from the images and labels
+        '''
+        files, labels, classes = listDirectory(parent)
+        images, failed = loadImagesParallel(files, channels, shape, workers, chunksize, reduced)
+        if failed:
+                print("Failed to read", len(failed), "images, e.g.:", files[failed[0]])
+                # a zero image with the label of its class would be trained on: drop it (a copy, only on failure)
+                images, labels = np.delete(images, failed, axis=0), np.delete(labels, failed)
+        return images, labels, classes
+
+def loadImagesSequential(files, channels, shape):
+        ''' Load images one at a time into a list, then into an array (the baseline) '''
+        images = []
+        for file in files:
+                if channels == 1:
+                        image = cv2.imread(file, cv2.IMREAD_GRAYSCALE)
+                else:
+                        image = cv2.imread(file, cv2.IMREAD_COLOR)
+                # unreadable or corrupted file: skipped
+                if image is None:
+                        continue
+                images.append(cv2.resize(image, shape, interpolation=cv2.INTER_AREA))
+        return np.asarray(images)
+
+if __name__ == '__main__':
+        # images/sec of the sequential loader vs. the parallel loader with an increasing number of processes
+        parent = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs'
+        files, labels, classes = listDirectory(parent)
+        print("Images:", len(files), "Classes:", len(classes))
+
+        start = time.perf_counter()
+        loadImagesSequential(files, 3, (128, 128))
+        baseline = len(files) / (time.perf_counter() - start)
+        print("%-12s %10.1f images/sec" % ('sequential', baseline))
+
+        # 1, 2, 4, ... processes up to the number of cores
+        for workers in sorted(set([2 ** i for i in range(cpu_count().bit_length())] + [cpu_count()])):
+                start = time.perf_counter()
+                images, failed = loadImagesParallel(files, 3, (128, 128), workers)
+                rate = len(files) / (time.perf_counter() - start)
+                print("%-12s %10.1f images/sec %6.2fx %6d failed" % ('%d process' % workers, rate, rate / baseline, len(failed)))
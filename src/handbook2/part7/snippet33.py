@@ -0,0 +1,201 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from snippet32 import listDirectory, decodeImages
+
+# the files of a dataset cache
+IMAGES   = 'images.npy'     # the resized uint8 (N, H, W, C) images, memory-mapped
+LABELS   = 'labels.npy'     # the label of each image
+MANIFEST = 'manifest.json'  # the (path, mtime, size) of the file of each image and of each file which could not be
+                            # read, the mtime of the directories, the target shape and channels
+
+def fileKeys(files):
+        ''' The (mtime, size) of each file: a file is decoded again when either has changed '''
+        keys = []
+        for file in files:
+                stat = os.stat(file)
+                keys.append((stat.st_mtime_ns, stat.st_size))
+        return keys
+
+def directoryKeys(parent):
+        ''' The mtime of the dataset directory and of each class subdirectory: a file (or subdirectory) added,
+            removed or renamed changes the mtime of its directory, but a file modified in place does not
+        '''
+        keys = { parent: os.stat(parent).st_mtime_ns }
+        for entry in os.scandir(parent):
+                if entry.is_dir():
+                        keys[entry.path] = entry.stat().st_mtime_ns
+        return keys
+
+def readManifest(cache, channels, shape):
+        ''' Read the manifest of a cache, if it was built for the same target shape and channels '''
+        try:
+                with open(os.path.join(cache, MANIFEST)) as f:
+                        manifest = json.load(f)
+        except (OSError, ValueError):
+                return None
+        if manifest['shape'] != list(shape) or manifest['channels'] != channels:
+                return None
+        return manifest
+
+def loadCache(cache, manifest):
+        ''' The images (a read-only memory-mapped array) and labels of a cache, or None when either file is
+            missing or does not match the manifest (e.g., truncated)
+        '''
+        width, height = manifest['shape']
+        try:
+                images = np.load(os.path.join(cache, IMAGES), mmap_mode='r')
+                labels = np.load(os.path.join(cache, LABELS))
+        except (OSError, ValueError, EOFError):
+                return None
+        n = len(manifest['files'])
+        if images.shape != (n, height, width, manifest['channels']) or labels.shape != (n,):
+                return None
+        return images, labels
+
+def openCache(parent, cache, channels, shape, workers=None, chunksize=64, validate=False):
+        ''' Open the preprocessed (resized) images of a dataset, one subdirectory per class, from a cache
+            parent   : the root directory of the dataset
+            cache    : the directory of the cache
+            channels : number of channels (1 is grayscale, 3 is color)
+            shape    : the target input shape (width, height), as in cv2.resize()
+            workers  : number of processes to decode the new or changed files
+            chunksize: number of images decoded by a process per task
+            validate : whether to check every file for changes; otherwise the manifest is trusted when the mtime
+                       of the directories has not changed, which skips files modified in place
+            returns the images (a read-only memory-mapped array), labels and classes
+        '''
+        dirs = directoryKeys(parent)
+        manifest = readManifest(cache, channels, shape)
+        loaded = loadCache(cache, manifest) if manifest is not None else None
+        if loaded is None:
+                # a missing or truncated images or labels file is rebuilt
+                manifest = None
+
+        # no file added, removed or renamed: open the cache as is (no listing of the files and no stats)
+        if loaded is not None and not validate and manifest.get('dirs') == dirs:
+                return loaded + (manifest['classes'],)
+
+        files, labels, classes = listDirectory(parent)
+        keys = fileKeys(files)
+
+        # the images of unchanged files are reused, by path
+        cached, unreadable = {}, {}
+        if manifest is not None:
+                for row, (file, mtime, size) in enumerate(manifest['files']):
+                        cached[file] = (row, mtime, size)
+                for file, mtime, size in manifest.get('failed', []):
+                        unreadable[file] = (mtime, size)
+
+        # the files which could not be read are not in the cache, and are only read again once they have changed
+        skipped = [ix for ix, (file, key) in enumerate(zip(files, keys)) if unreadable.get(file) == key]
+        failed = [[files[ix], keys[ix][0], keys[ix][1]] for ix in skipped]
+        if skipped:
+                keep = np.setdiff1d(np.arange(len(files)), skipped)
+                files, labels, keys = [files[ix] for ix in keep], labels[keep], [keys[ix] for ix in keep]
+
+        reused, decode = [], []
+        for ix, (file, key) in enumerate(zip(files, keys)):
+                if file in cached and tuple(cached[file][1:]) == key:
+                        reused.append((ix, cached[file][0]))
+                else:
+                        decode.append(ix)
+
+        # nothing changed: open the cache as is (no decoding and no copies), with the current mtime of the directories
+        if manifest is not None and not decode and len(files) == len(manifest['files']) and \
+           all([ix == row for ix, row in reused]):
+                if manifest.get('dirs') != dirs or manifest.get('failed', []) != failed:
+                        writeManifest(cache, files, classes, keys, dirs, failed, channels, shape)
+                return loaded + (classes,)
+
+        updateCache(cache, files, labels, classes, keys, dirs, failed, reused, decode, channels, shape, workers, chunksize)
+        return np.load(os.path.join(cache, IMAGES), mmap_mode='r'), np.load(os.path.join(cache, LABELS)), classes
+
+def updateCache(cache, files, labels, classes, keys, dirs, failed, reused, decode, channels, shape, workers=None, chunksize=64):
+        ''' Write a new version of the cache: copy the reused images and decode the new or changed files
+            failed: the [path, mtime, size] of the unchanged files which could not be read (not in the cache)
+        '''
+        os.makedirs(cache, exist_ok=True)
+        width, height = shape
+        path = os.path.join(cache, IMAGES)
+        staging = path + '.tmp'
+
+        # the images are written straight into the memory-mapped file
+        images = np.lib.format.open_memmap(staging, mode='w+', dtype=np.uint8, shape=(len(files), height, width, channels))
+        if reused:
+                old = np.load(path, mmap_mode='r')
+                # copy in chunks, so the page cache and not the process holds the images
+                for start in range(0, len(reused), 1024):
+                        rows = np.asarray(reused[start:start + 1024])
+                        images[rows[:, 0]] = old[rows[:, 1]]
+                del old
+        images.flush()
+        del images
+
+        # the processes decode the new or changed files into their slots of the file
+        slots = decodeImages(staging, (len(files), height, width, channels), [files[ix] for ix in decode], decode,
+                             workers, chunksize)
+        if slots:
+                print("Failed to read", len(slots), "images, e.g.:", files[slots[0]])
+                # the files which could not be read are dropped from the cache (instead of zero images with a
+                # label), and recorded with their mtime and size, so they are only read again once changed
+                failed = sorted(failed + [[files[ix], keys[ix][0], keys[ix][1]] for ix in slots])
+                keep = np.setdiff1d(np.arange(len(files)), slots)
+                files, labels, keys = [files[ix] for ix in keep], labels[keep], [keys[ix] for ix in keep]
+                dropStaging(staging, keep)
+
+        # the manifest is removed while the images are replaced, so an interrupted update is rebuilt
+        manifest = os.path.join(cache, MANIFEST)
+        if os.path.exists(manifest):
+                os.remove(manifest)
+        os.replace(staging, path)
+        np.save(os.path.join(cache, LABELS), labels)
+        writeManifest(cache, files, classes, keys, dirs, failed, channels, shape)
+
+def dropStaging(staging, keep):
+        ''' Keep only the rows of the staged images of the files which could be read '''
+        images = np.load(staging, mmap_mode='r')
+        compact = np.lib.format.open_memmap(staging + '.keep', mode='w+', dtype=np.uint8, shape=(len(keep),) + images.shape[1:])
+        for start in range(0, len(keep), 1024):
+                compact[start:start + 1024] = images[keep[start:start + 1024]]
+        compact.flush()
+        del images, compact
+        os.replace(staging + '.keep', staging)
+
+def writeManifest(cache, files, classes, keys, dirs, failed, channels, shape):
+        ''' Write the manifest of a cache (atomically) '''
+        manifest = os.path.join(cache, MANIFEST)
+        with open(manifest + '.tmp', 'w') as f:
+                json.dump({ 'shape': list(shape), 'channels': channels, 'classes': classes, 'dirs': dirs, 'failed': failed,
+                            'files': [[file, mtime, size] for file, (mtime, size) in zip(files, keys)] }, f)
+        os.replace(manifest + '.tmp', manifest)
+
+if __name__ == '__main__':
+        # the first run decodes the dataset, the following runs open the cache
+        parent = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs'
+        cache  = sys.argv[2] if len(sys.argv) > 2 else parent + '.cache'
+        for run in range(2):
+                start = time.perf_counter()
+                images, labels, classes = openCache(parent, cache, 3, (128, 128))
+                print("Run", run, "Images:", images.shape, "Classes:", len(classes), "%.1f ms" % ((time.perf_counter() - start) * 1000))
+
+        # checking every file for changes made in place costs a stat per file
+        start = time.perf_counter()
+        images, labels, classes = openCache(parent, cache, 3, (128, 128), validate=True)
+        print("Validated", "Images:", images.shape, "%.1f ms" % ((time.perf_counter() - start) * 1000))
@@ -0,0 +1,180 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import sqlite3
+import numpy as np
+from snippet32 import EXTENSIONS
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS classes (name TEXT PRIMARY KEY, label INTEGER UNIQUE, mtime INTEGER);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE, label INTEGER,
+                                  size INTEGER, mtime INTEGER, version INTEGER);
+CREATE TABLE IF NOT EXISTS removed (path TEXT, version INTEGER);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE INDEX IF NOT EXISTS files_label ON files (label);
+CREATE INDEX IF NOT EXISTS files_version ON files (version);
+'''
+
+def openIndex(path):
+        ''' Open (or create) the index of a dataset: a SQLite database of the class subdirectories and image files '''
+        db = sqlite3.connect(path)
+        db.executescript(SCHEMA)
+        return db
+
+def indexVersion(db):
+        ''' The version of the index: incremented by each update which changed the index '''
+        row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+def updateIndex(db, parent, full=False):
+        ''' Update the index of a dataset, one subdirectory per class
+            db    : the index
+            parent: the root directory of the dataset
+            full  : whether to check every file for changes; otherwise only the subdirectories whose mtime
+                    changed (files added, removed or renamed) are scanned, which skips files modified in place
+            returns the version of the index and the number of files added, changed and removed
+        '''
+        version = indexVersion(db) + 1
+        added = changed = removed = 0
+        classes = { name: (label, mtime) for name, label, mtime in db.execute("SELECT name, label, mtime FROM classes") }
+
+        subdirs = [entry for entry in sorted(os.scandir(parent), key=lambda entry: entry.name) if entry.is_dir()]
+        for subdir in subdirs:
+                mtime = subdir.stat().st_mtime_ns
+
+                # a new class gets the next label, so the labels of the existing classes never change
+                if subdir.name not in classes:
+                        label = len(classes) if not classes else max([l for l, _ in classes.values()]) + 1
+                        db.execute("INSERT INTO classes VALUES (?, ?, ?)", (subdir.name, label, None))
+                        classes[subdir.name] = (label, None)
+                label, indexed_mtime = classes[subdir.name]
+                if not full and mtime == indexed_mtime:
+                        continue
+
+                # the delta of the subdirectory
+                indexed = { path: (size, mtime) for path, size, mtime in
+                            db.execute("SELECT path, size, mtime FROM files WHERE label = ?", (label,)) }
+                for file in os.scandir(subdir.path):
+                        if not file.name.lower().endswith(EXTENSIONS):
+                                continue
+                        stat = file.stat()
+                        key = (stat.st_size, stat.st_mtime_ns)
+                        if file.path not in indexed:
+                                db.execute("INSERT INTO files (path, label, size, mtime, version) VALUES (?, ?, ?, ?, ?)",
+                                           (file.path, label) + key + (version,))
+                                added += 1
+                        elif indexed.pop(file.path) != key:
+                                db.execute("UPDATE files SET size = ?, mtime = ?, version = ? WHERE path = ?",
+                                           key + (version, file.path))
+                                changed += 1
+
+                # the files left were removed
+                for path in indexed:
+                        db.execute("DELETE FROM files WHERE path = ?", (path,))
+                        db.execute("INSERT INTO removed VALUES (?, ?)", (path, version))
+                        removed += 1
+                db.execute("UPDATE classes SET mtime = ? WHERE name = ?", (mtime, subdir.name))
+
+        # the files of the class subdirectories which were removed (the class keeps its label)
+        names = set([subdir.name for subdir in subdirs])
+        for name, (label, _) in classes.items():
+                if name in names:
+                        continue
+                for path, in db.execute("SELECT path FROM files WHERE label = ?", (label,)).fetchall():
+                        db.execute("INSERT INTO removed VALUES (?, ?)", (path, version))
+                        removed += 1
+                db.execute("DELETE FROM files WHERE label = ?", (label,))
+                db.execute("UPDATE classes SET mtime = NULL WHERE name = ?", (name,))
+
+        if added or changed or removed:
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        else:
+                version -= 1
+        db.commit()
+        return version, added, changed, removed
+
+def indexClasses(db):
+        ''' The mapping of class (subdirectory name) to label '''
+        return dict(db.execute("SELECT name, label FROM classes ORDER BY label"))
+
+def indexLabels(db):
+        ''' The ids and labels of the files in the index, as arrays '''
+        rows = np.asarray(db.execute("SELECT id, label FROM files ORDER BY id").fetchall(), dtype=np.int64).reshape(-1, 2)
+        return rows[:, 0], rows[:, 1].astype(np.uint16)
+
+def indexFiles(db, ids):
+        ''' The paths and labels of files of the index, by id (in the order of the ids) '''
+        paths, labels = {}, {}
+        ids = [int(ix) for ix in ids]
+        # SQLite limits the number of parameters of a statement
+        for start in range(0, len(ids), 900):
+                chunk = ids[start:start + 900]
+                query = "SELECT id, path, label FROM files WHERE id IN (%s)" % ','.join('?' * len(chunk))
+                for ix, path, label in db.execute(query, chunk):
+                        paths[ix], labels[ix] = path, label
+        return [paths[ix] for ix in ids], np.asarray([labels[ix] for ix in ids], dtype=np.uint16)
+
+def deltaFiles(db, since):
+        ''' The files added or changed, and removed, after a version of the index (e.g., for a loader or cache to update)
+            returns a cursor over the (path, label) of the files added or changed, and the paths removed
+        '''
+        removed = [path for path, in db.execute("SELECT path FROM removed WHERE version > ?", (since,))]
+        return db.execute("SELECT path, label FROM files WHERE version > ? ORDER BY id", (since,)), removed
+
+def _byClass(labels):
+        ''' The positions of each label, grouped by a single sort (instead of one scan per class) '''
+        order = np.argsort(labels, kind='stable')
+        values, starts = np.unique(labels[order], return_index=True)
+        return zip(values, np.split(order, starts[1:]))
+
+def stratifiedSample(db, fraction=0.1, seed=101):
+        ''' Sample the ids of a fraction of the files of each class '''
+        ids, labels = indexLabels(db)
+        random = np.random.RandomState(seed)
+        sample = []
+        for _, positions in _byClass(labels):
+                n = max(1, int(round(len(positions) * fraction)))
+                sample.append(ids[random.choice(positions, n, replace=False)])
+        return np.sort(np.concatenate(sample)) if sample else ids
+
+def stratifiedSplit(db, test_size=0.2, seed=101):
+        ''' Split the ids of the files into train and test ids, with the same proportion of each class '''
+        ids, labels = indexLabels(db)
+        random = np.random.RandomState(seed)
+        train, test = [ids[:0]], [ids[:0]]
+        for _, positions in _byClass(labels):
+                positions = random.permutation(positions)
+                pivot = int(round(len(positions) * test_size))
+                test.append(ids[positions[:pivot]])
+                train.append(ids[positions[pivot:]])
+        return np.sort(np.concatenate(train)), np.sort(np.concatenate(test))
+
+if __name__ == '__main__':
+        parent = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs'
+        db = openIndex(sys.argv[2] if len(sys.argv) > 2 else parent + '.index')
+
+        # the first update indexes the dataset, the following updates only scan the changed subdirectories
+        for full in [False, False, True]:
+                start = time.perf_counter()
+                version, added, changed, removed = updateIndex(db, parent, full)
+                print("Version:", version, "Added:", added, "Changed:", changed, "Removed:", removed, "Full:", full,
+                      "%.1f ms" % ((time.perf_counter() - start) * 1000))
+
+        train, test = stratifiedSplit(db, 0.2)
+        print("Classes:", len(indexClasses(db)), "Train:", len(train), "Test:", len(test))
+        paths, labels = indexFiles(db, stratifiedSample(db, 0.1))
+        print("Sample:", len(paths), np.bincount(labels))
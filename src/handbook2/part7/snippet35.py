@@ -0,0 +1,59 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from PIL import Image
+import sys
+import time
+import numpy as np
+from snippet32 import listDirectory, readImage
+
+def readImagePIL(path, channels, shape, reduced=True):
+        ''' Read an image with PIL resized to the target shape
+            reduced: whether a large JPEG is decoded directly at 1/2, 1/4 or 1/8 of its resolution, with draft()
+        '''
+        image = Image.open(path)
+        mode = 'L' if channels == 1 else 'RGB'
+        # draft() picks the largest DCT downscaling where the image is still at least the requested size,
+        # and is ignored by the other image formats
+        if reduced:
+                image.draft(mode, shape)
+        image = image.convert(mode)
+        # resize the image for the remainder to the target input shape
+        return np.asarray(image.resize(shape, Image.LANCZOS))
+
+def psnr(image, reference):
+        ''' The peak signal to noise ratio (dB) of an image against a reference image (8 bits per pixel) '''
+        mse = np.mean((image.astype(np.float32) - reference.astype(np.float32)) ** 2)
+        return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def throughput(read, files, channels, shape, reduced):
+        ''' The images/sec of decoding and resizing a list of files (in this process) '''
+        start = time.perf_counter()
+        images = [read(file, channels, shape, reduced) for file in files]
+        return len(files) / (time.perf_counter() - start), images
+
+if __name__ == '__main__':
+        # decode throughput and quality of the reduced resolution decode vs. the full resolution decode + resize
+        parent = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs'
+        files, labels, classes = listDirectory(parent)
+        files = files[:1000]
+
+        print("%-8s %14s %14s %8s %12s %12s" % ('decoder', 'full (img/s)', 'reduced (img/s)', 'speedup', 'mean PSNR', 'min PSNR'))
+        for name, read in [('cv2', readImage), ('PIL', readImagePIL)]:
+                full_rate, full = throughput(read, files, 3, (128, 128), False)
+                reduced_rate, reduced = throughput(read, files, 3, (128, 128), True)
+                quality = [psnr(image, reference) for image, reference in zip(reduced, full) if reference is not None]
+                finite = [q for q in quality if q != float('inf')] or [float('inf')]
+                print("%-8s %14.1f %14.1f %7.2fx %12.2f %12.2f" % (name, full_rate, reduced_rate, reduced_rate / full_rate,
+                      np.mean(finite), np.min(finite)))
@@ -0,0 +1,213 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import random
+import hashlib
+import asyncio
+import aiohttp
+import threading
+import numpy as np
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from snippet32 import listDirectory, decodeImage
+
+# the responses which are retried (with a backoff): too many requests and server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+class ContentCache(object):
+        ''' An on-disk cache of the content of URLs, with the ETag of each content '''
+        def __init__(self, directory):
+                self.directory = directory
+                os.makedirs(directory, exist_ok=True)
+
+        def _path(self, url):
+                return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+        def etag(self, url):
+                ''' The ETag of the cached content of a URL, or None '''
+                try:
+                        with open(self._path(url) + '.etag') as f:
+                                return f.read()
+                except OSError:
+                        return None
+
+        def read(self, url):
+                ''' The cached content of a URL, or None (e.g., a crash between the writes, or a partial cleanup) '''
+                try:
+                        with open(self._path(url), 'rb') as f:
+                                return f.read()
+                except OSError:
+                        return None
+
+        def discard(self, url):
+                ''' Drop the ETag of a URL, so its content is fetched again '''
+                try:
+                        os.remove(self._path(url) + '.etag')
+                except OSError:
+                        pass
+
+        def write(self, url, etag, data):
+                ''' Cache the content of a URL (only a content with an ETag can be revalidated)
+                    The ETag is dropped first and written last, each file atomically, so an ETag is never
+                    paired with another content.
+                '''
+                path = self._path(url)
+                self.discard(url)
+                self._replace(path, data, 'wb')
+                self._replace(path + '.etag', etag, 'w')
+
+        @staticmethod
+        def _replace(path, data, mode):
+                with open(path + '.tmp', mode) as f:
+                        f.write(data)
+                os.replace(path + '.tmp', path)
+
+async def fetch(session, url, cache=None, retries=3, backoff=0.5):
+        ''' Fetch the content of a URL, or None when it cannot be fetched
+            session: the HTTP session (its connector is the shared connection pool)
+            url    : the URL
+            cache  : the on-disk content cache, revalidated by ETag (a 304 response is read from the cache)
+            retries: number of retries of a connection error, timeout or retryable response
+            backoff: the delay (seconds) before the first retry, doubled (with jitter) on each retry
+        '''
+        headers = {}
+        etag = cache.etag(url) if cache else None
+        if etag:
+                headers['If-None-Match'] = etag
+
+        attempt = 0
+        while attempt <= retries:
+                try:
+                        async with session.get(url, headers=headers) as response:
+                                if response.status == 304 and etag:
+                                        data = cache.read(url)
+                                        if data is not None:
+                                                return data
+                                        # the cached content is missing: drop the stale ETag and fetch the content again
+                                        cache.discard(url)
+                                        etag = None
+                                        del headers['If-None-Match']
+                                        continue
+                                if response.status == 200:
+                                        data = await response.read()
+                                        if cache and response.headers.get('ETag'):
+                                                # the content is returned even when it cannot be cached (e.g., a full disk)
+                                                try:
+                                                        cache.write(url, response.headers['ETag'], data)
+                                                except OSError:
+                                                        pass
+                                        return data
+                                # the other responses (e.g., 404) are not retried
+                                if response.status not in RETRY_STATUS:
+                                        return None
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                        pass
+                if attempt < retries:
+                        await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+                attempt += 1
+        return None
+
+async def fetchImagesAsync(urls, images, channels, shape, cache=None, concurrency=32, retries=3, timeout=30, decoders=None):
+        ''' Fetch and decode images into their slots of an image array, as they arrive
+            returns the slots of the URLs which could not be fetched or decoded
+        '''
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        failed = []
+
+        # the decodes run on a pool of threads (OpenCV releases the GIL), so they do not block the downloads
+        with ThreadPoolExecutor(decoders or os.cpu_count()) as executor:
+                # one connection pool for all the requests, at most the number of concurrent requests
+                connector = aiohttp.TCPConnector(limit=concurrency)
+                async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+                        async def fetchImage(ix, url):
+                                async with semaphore:
+                                        data = await fetch(session, url, cache, retries)
+                                image = None
+                                if data is not None:
+                                        image = await loop.run_in_executor(executor, decodeImage, data, channels, shape)
+                                if image is None:
+                                        failed.append(ix)
+                                else:
+                                        images[ix] = image.reshape(images.shape[1:])
+
+                        await asyncio.gather(*[fetchImage(ix, url) for ix, url in enumerate(urls)])
+        return sorted(failed)
+
+def fetchImages(urls, channels, shape, cache=None, concurrency=32, retries=3, timeout=30):
+        ''' Fetch remote images into a preallocated uint8 (N, H, W, C) array (the layout of the local loader)
+            urls       : list of image URLs
+            channels   : number of channels (1 is grayscale, 3 is color)
+            shape      : the target input shape (width, height), as in cv2.resize()
+            cache      : directory of the on-disk content cache (None is no cache)
+            concurrency: maximum number of requests in flight
+            retries    : number of retries of a request
+            timeout    : timeout (seconds) of a request
+            returns the image array and the slots of the URLs which could not be fetched or decoded
+        '''
+        width, height = shape
+        images = np.zeros((len(urls), height, width, channels), dtype=np.uint8)
+        cache = ContentCache(cache) if cache else None
+        failed = asyncio.run(fetchImagesAsync(urls, images, channels, shape, cache, concurrency, retries, timeout))
+        return images, failed
+
+class ETagHandler(SimpleHTTPRequestHandler):
+        ''' A local stand-in for an image server: static files with an ETag, revalidated by If-None-Match '''
+        def send_head(self):
+                path = self.translate_path(self.path)
+                if os.path.isfile(path):
+                        stat = os.stat(path)
+                        etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+                        if self.headers.get('If-None-Match') == etag:
+                                self.send_response(304)
+                                self.send_header('ETag', etag)
+                                self.end_headers()
+                                return None
+                        self.etag = etag
+                return SimpleHTTPRequestHandler.send_head(self)
+
+        def end_headers(self):
+                if getattr(self, 'etag', None):
+                        self.send_header('ETag', self.etag)
+                        self.etag = None
+                SimpleHTTPRequestHandler.end_headers(self)
+
+        def log_message(self, format, *args):
+                pass
+
+def standInServer(directory, port=0):
+        ''' Serve a directory over HTTP on a local port (in a background thread) '''
+        handler = lambda *args, **kwargs: ETagHandler(*args, directory=directory, **kwargs)
+        server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+if __name__ == '__main__':
+        # fetch a local dataset through a stand-in server: the second run is revalidated from the cache
+        parent = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs'
+        files, labels, classes = listDirectory(parent)
+        server = standInServer(parent)
+        base = 'http://127.0.0.1:%d/' % server.server_address[1]
+        urls = [base + quote(os.path.relpath(file, parent).replace(os.sep, '/')) for file in files]
+
+        for run in ['fetch', 'cached']:
+                start = time.perf_counter()
+                images, failed = fetchImages(urls, 3, (128, 128), cache=parent + '.http')
+                rate = len(urls) / (time.perf_counter() - start)
+                print("%-8s Images: %s Failed: %d %10.1f images/sec" % (run, images.shape, len(failed), rate))
+        server.shutdown()
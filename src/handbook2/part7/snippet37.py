@@ -0,0 +1,144 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import json
+import time
+import numpy as np
+from multiprocessing import Pool, cpu_count
+
+class RunningStats(object):
+        ''' Streaming per channel (and global) mean and standard deviation of images, over batches
+            The statistics of each batch are merged into the running statistics (Chan et al. parallel
+            form of Welford's algorithm), so the dataset is never in memory (or in float64) as a whole,
+            and the statistics of several workers can be merged the same way.
+        '''
+        def __init__(self, channels=3):
+                self.count = 0                                  # number of pixels per channel
+                self.mean  = np.zeros(channels, np.float64)     # per channel mean
+                self.m2    = np.zeros(channels, np.float64)     # per channel sum of squared differences from the mean
+
+        def update(self, batch):
+                ''' Add a batch of images (N, H, W, C) of any dtype '''
+                batch = batch.reshape(-1, batch.shape[-1])
+                if len(batch) == 0:
+                        return self
+                other = RunningStats(batch.shape[-1])
+                other.count = len(batch)
+                other.mean  = np.mean(batch, axis=0, dtype=np.float64)
+                # the differences of the batch (not of the dataset) are computed in float64
+                other.m2    = np.sum(np.square(batch - other.mean), axis=0)
+                return self.merge(other)
+
+        def merge(self, other):
+                ''' Merge the statistics of another set of images (e.g., computed by another process) '''
+                count = self.count + other.count
+                if count == 0:
+                        return self
+                delta = other.mean - self.mean
+                self.mean = self.mean + delta * (other.count / count)
+                self.m2   = self.m2 + other.m2 + np.square(delta) * (self.count * other.count / count)
+                self.count = count
+                return self
+
+        @property
+        def std(self):
+                ''' The per channel (population) standard deviation, as np.std() '''
+                return np.sqrt(self.m2 / max(self.count, 1))
+
+        @property
+        def globalMean(self):
+                ''' The mean across all pixels/channels '''
+                return float(np.mean(self.mean))
+
+        @property
+        def globalStd(self):
+                ''' The standard deviation across all pixels/channels (the channels have the same number of pixels) '''
+                m2 = np.sum(self.m2) + self.count * np.sum(np.square(self.mean - self.globalMean))
+                return float(np.sqrt(m2 / max(self.count * len(self.mean), 1)))
+
+        def save(self, path):
+                ''' Persist the statistics, so training and serving use the same numbers '''
+                with open(path, 'w') as f:
+                        json.dump({ 'count': self.count, 'mean': self.mean.tolist(), 'm2': self.m2.tolist(),
+                                    'std': self.std.tolist(), 'global_mean': self.globalMean, 'global_std': self.globalStd }, f, indent=2)
+
+        @staticmethod
+        def load(path):
+                ''' Load persisted statistics '''
+                with open(path) as f:
+                        saved = json.load(f)
+                stats = RunningStats(len(saved['mean']))
+                stats.count = saved['count']
+                stats.mean  = np.asarray(saved['mean'], np.float64)
+                stats.m2    = np.asarray(saved['m2'], np.float64)
+                return stats
+
+def computeStats(batches, channels=3):
+        ''' The statistics of an iterable of batches of images, in a single pass '''
+        stats = RunningStats(channels)
+        for batch in batches:
+                stats.update(batch)
+        return stats
+
+def batches(images, batch_size=256, start=0, end=None):
+        ''' Iterate over an image array (e.g., a memory-mapped dataset cache) in batches '''
+        end = len(images) if end is None else end
+        for ix in range(start, end, batch_size):
+                yield images[ix:min(ix + batch_size, end)]
+
+def _statsOfRange(task):
+        ''' The statistics of a range of the images of a .npy file (in a worker process) '''
+        path, start, end, batch_size = task
+        images = np.load(path, mmap_mode='r')
+        return computeStats(batches(images, batch_size, start, end), images.shape[-1])
+
+def computeStatsParallel(path, workers=None, batch_size=256):
+        ''' The statistics of the images of a .npy file (e.g., the dataset cache), over a pool of processes
+            path      : the .npy file of the (N, H, W, C) images
+            workers   : number of processes (default is the number of cores)
+            batch_size: number of images per batch
+        '''
+        images = np.load(path, mmap_mode='r')
+        workers = workers or cpu_count()
+        bounds = np.linspace(0, len(images), workers + 1).astype(int)
+        tasks = [(path, start, end, batch_size) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+        stats = RunningStats(images.shape[-1])
+        with Pool(workers) as pool:
+                for other in pool.imap_unordered(_statsOfRange, tasks):
+                        stats.merge(other)
+        return stats
+
+if __name__ == '__main__':
+        # the statistics of a dataset cache (see snippet33), in one process and over a pool of processes
+        path = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs.cache/images.npy'
+        images = np.load(path, mmap_mode='r')
+
+        start = time.perf_counter()
+        stats = computeStats(batches(images), images.shape[-1])
+        print("1 process   %.1f ms" % ((time.perf_counter() - start) * 1000), "mean:", stats.mean, "std:", stats.std)
+
+        start = time.perf_counter()
+        merged = computeStatsParallel(path)
+        print("%d processes %.1f ms" % (cpu_count(), (time.perf_counter() - start) * 1000), "mean:", merged.mean, "std:", merged.std)
+
+        # the same numbers as np.mean/np.std (on a sample which fits in memory)
+        sample = np.asarray(images[:1000], dtype=np.float64)
+        check = computeStats(batches(images, 100, 0, len(sample)), images.shape[-1])
+        print("max error: mean %.2e std %.2e global std %.2e" % (np.max(np.abs(check.mean - np.mean(sample, axis=(0, 1, 2)))),
+              np.max(np.abs(check.std - np.std(sample, axis=(0, 1, 2)))), abs(check.globalStd - np.std(sample))))
+
+        stats.save('stats.json')
+        print("saved: stats.json", RunningStats.load('stats.json').globalStd == stats.globalStd)
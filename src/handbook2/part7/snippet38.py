@@ -0,0 +1,110 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import tracemalloc
+import numpy as np
+
+# the size of the chunks of images normalized at a time
+CHUNK_BYTES = 16 * 2**20
+
+def maxValue(dtype):
+        ''' The maximum pixel value of the images: 255 for uint8, 65535 for uint16 (other dtypes raise TypeError) '''
+        dtype = np.dtype(dtype)
+        if dtype not in (np.uint8, np.uint16):
+                raise TypeError("Expected uint8 or uint16 images, got " + str(dtype))
+        return float(np.iinfo(dtype).max)
+
+def affine(images, scale, shift, out=None, dtype=np.float32, chunk_bytes=CHUNK_BYTES):
+        ''' Compute images * scale + shift into a float32 (or float16) output buffer, a chunk of images at a time
+            images     : the (N, H, W, C) images
+            scale      : a scalar or per channel scale
+            shift      : a scalar or per channel shift
+            out        : the preallocated output buffer (default is allocated once, with dtype)
+            dtype      : dtype of the output, when out is not given
+            chunk_bytes: size of the chunks of the input images
+        '''
+        if out is None:
+                out = np.empty(images.shape, dtype=dtype)
+        if out.shape != images.shape:
+                raise ValueError("The output buffer has shape %s, expected %s" % (out.shape, images.shape))
+
+        # the arithmetic is in float32 (a uint16 pixel overflows float16), with the constants in float32 so they
+        # do not promote the computation to float64
+        scale = np.asarray(scale, dtype=np.float32)
+        shift = np.asarray(shift, dtype=np.float32)
+        per_image = max(1, images[0].nbytes if len(images) else 1)
+        step = max(1, chunk_bytes // per_image)
+
+        # a float16 output is computed in a reusable float32 chunk, then cast once into the output
+        work = None if out.dtype == np.float32 else np.empty((min(step, len(images)),) + images.shape[1:], np.float32)
+        for start in range(0, len(images), step):
+                end = min(start + step, len(images))
+                target = out[start:end] if work is None else work[:end - start]
+                np.multiply(images[start:end], scale, out=target, dtype=np.float32)
+                np.add(target, shift, out=target)
+                if work is not None:
+                        np.copyto(out[start:end], target, casting='same_kind')
+        return out
+
+def rescale(images, out=None, dtype=np.float32):
+        ''' Normalize the pixels between 0 and 1 '''
+        return affine(images, 1.0 / maxValue(images.dtype), 0.0, out, dtype)
+
+def center(images, out=None, dtype=np.float32):
+        ''' Normalize the pixels between -1 and 1 '''
+        return affine(images, 2.0 / maxValue(images.dtype), -1.0, out, dtype)
+
+def standardize(images, mean, std, out=None, dtype=np.float32):
+        ''' Standardize the pixels with a (global or per channel) mean and standard deviation, e.g., the
+            statistics of the dataset (see RunningStats in snippet37), so the images are never in float64
+        '''
+        std = np.asarray(std, dtype=np.float64)
+        return affine(images, 1.0 / std, -np.asarray(mean, dtype=np.float64) / std, out, dtype)
+
+def measure(fn):
+        ''' The time and the peak memory allocated (MB) by a function '''
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, elapsed, peak / 2**20
+
+if __name__ == '__main__':
+        # memory and throughput of images / 255.0 (float64 temporaries) vs. the chunked kernels
+        images = np.random.randint(0, 256, (2000, 128, 128, 3)).astype(np.uint8)
+        out32 = np.empty(images.shape, np.float32)
+        out16 = np.empty(images.shape, np.float16)
+        print("input: %.1f MB" % (images.nbytes / 2**20))
+
+        print("%-28s %10s %14s %12s" % ('method', 'time (ms)', 'peak alloc (MB)', 'images/sec'))
+        results = [('images / 255.0',                  lambda: images / 255.0),
+                   ('(images / 255.0).astype(f32)',    lambda: (images / 255.0).astype(np.float32)),
+                   ('rescale float32 (new buffer)',    lambda: rescale(images)),
+                   ('rescale float32 (preallocated)',  lambda: rescale(images, out32)),
+                   ('rescale float16 (preallocated)',  lambda: rescale(images, out16)),
+                   ('center float32 (preallocated)',   lambda: center(images, out32)),
+                   ('standardize (preallocated)',      lambda: standardize(images, [120.0, 115.0, 100.0], [60.0, 58.0, 57.0], out32))]
+        for name, fn in results:
+                _, elapsed, peak = measure(fn)
+                print("%-28s %10.1f %14.1f %12.0f" % (name, elapsed * 1000, peak, len(images) / elapsed))
+
+        # the same values as the float64 computation
+        print("max error: rescale %.2e center %.2e" % (np.max(np.abs(rescale(images, out32) - images / 255.0)),
+              np.max(np.abs(center(images, out32) - (images / 127.5 - 1)))))
+
+        # uint16 pixels are scaled by 65535
+        print("uint16 max:", rescale(np.asarray([[[[65535]]]], dtype=np.uint16)).max())
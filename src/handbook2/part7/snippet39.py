@@ -0,0 +1,96 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import numpy as np
+
+class DatasetView(object):
+        ''' A view of (a subset of) an image store by index: shuffling and splitting permute the indices,
+            never the images, and batches are gathered into a reusable buffer
+        '''
+        def __init__(self, images, labels, indices=None):
+                ''' images : the image store (N, H, W, C), e.g., an in-memory or memory-mapped array
+                    labels : the label of each image
+                    indices: the indices of the images of the view (default is all the images)
+                '''
+                self.images  = images
+                self.labels  = np.asarray(labels)
+                self.indices = np.arange(len(images)) if indices is None else np.asarray(indices)
+
+        def __len__(self):
+                return len(self.indices)
+
+        def split(self, fractions=(0.8, 0.2), stratified=True, seed=101):
+                ''' Split the view into views, e.g., train/val/test
+                    fractions : the fraction of the images of each split
+                    stratified: whether each split has the same proportion of each class
+                    seed      : the seed of the shuffle before the split
+                '''
+                random = np.random.RandomState(seed)
+                bounds = np.cumsum([0] + list(fractions)) / np.sum(fractions)
+                if not stratified:
+                        groups = [random.permutation(self.indices)]
+                else:
+                        # the indices of each class, grouped by a single sort
+                        labels = self.labels[self.indices]
+                        order = np.argsort(labels, kind='stable')
+                        _, starts = np.unique(labels[order], return_index=True)
+                        groups = [random.permutation(self.indices[group]) for group in np.split(order, starts[1:])]
+
+                splits = [[] for _ in fractions]
+                for group in groups:
+                        pivots = np.round(bounds * len(group)).astype(int)
+                        for ix in range(len(fractions)):
+                                splits[ix].append(group[pivots[ix]:pivots[ix + 1]])
+                return [DatasetView(self.images, self.labels, np.sort(np.concatenate(split))) for split in splits]
+
+        def batches(self, batch_size=32, shuffle=True, seed=None, out=None):
+                ''' Iterate over the view in batches of (images, labels)
+                    batch_size: number of images per batch
+                    shuffle   : whether to visit the images in a random order (a permutation of the indices)
+                    seed      : the seed of the shuffle (e.g., the epoch)
+                    out       : the reusable batch buffer (default is allocated once per call)
+                    The images of a batch are gathered into the buffer, which is overwritten by the next batch:
+                    copy a batch to keep it.
+                '''
+                indices = np.random.RandomState(seed).permutation(self.indices) if shuffle else self.indices
+                if out is None:
+                        out = np.empty((batch_size,) + self.images.shape[1:], dtype=self.images.dtype)
+                for start in range(0, len(indices), batch_size):
+                        # the indices of a batch are sorted, so a memory-mapped store is read in file order
+                        batch = np.sort(indices[start:start + batch_size])
+                        x = out[:len(batch)]
+                        # mode='clip' writes straight into the buffer (mode='raise' buffers the output)
+                        np.take(self.images, batch, axis=0, out=x, mode='clip')
+                        yield x, self.labels[batch]
+
+if __name__ == '__main__':
+        # epochs over a dataset cache (see snippet33) without copying the images
+        path = sys.argv[1] if len(sys.argv) > 1 else 'cats_n_dogs.cache'
+        images = np.load(path + '/images.npy', mmap_mode='r')
+        labels = np.load(path + '/labels.npy')
+
+        dataset = DatasetView(images, labels)
+        train, val, test = dataset.split((0.7, 0.15, 0.15))
+        print("Train:", len(train), np.bincount(train.labels[train.indices]),
+              "Val:", len(val), np.bincount(val.labels[val.indices]),
+              "Test:", len(test), np.bincount(test.labels[test.indices]))
+
+        for epoch in range(2):
+                start = time.perf_counter()
+                n = 0
+                for x, y in train.batches(32, seed=epoch):
+                        n += len(x)
+                print("Epoch", epoch, "Images:", n, "%.1f images/sec" % (n / (time.perf_counter() - start)))
@@ -0,0 +1,87 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tracemalloc
+import numpy as np
+
+def labelType(n_classes):
+        ''' The smallest integer dtype of the labels of a number of classes '''
+        if n_classes <= 256:
+                return np.uint8
+        if n_classes <= 65536:
+                return np.uint16
+        return np.int32
+
+def sparseLabels(labels, n_classes):
+        ''' Encode labels as compact integer (sparse) labels, for the sparse_categorical_crossentropy loss,
+            e.g., one byte per image for up to 256 classes instead of a row of n_classes floats
+        '''
+        labels = np.asarray(labels).reshape(-1)
+        if len(labels) and (labels.min() < 0 or labels.max() >= n_classes):
+                raise ValueError("Labels must be between 0 and %d" % (n_classes - 1))
+        return labels.astype(labelType(n_classes), copy=False)
+
+def oneHotBatch(labels, n_classes, out=None, dtype=np.float32):
+        ''' One-hot encode the labels of a batch, into a reusable (batch_size, n_classes) buffer
+            labels   : the (sparse) labels of the batch
+            n_classes: number of classes
+            out      : the reusable buffer (default is allocated)
+            dtype    : dtype of the buffer, when out is not given
+        '''
+        labels = np.asarray(labels).reshape(-1)
+        if out is None:
+                out = np.empty((len(labels), n_classes), dtype=dtype)
+        out = out[:len(labels)]
+        out.fill(0)
+        out[np.arange(len(labels)), labels] = 1
+        return out
+
+def oneHotBatches(batches, n_classes, dtype=np.float32):
+        ''' One-hot encode the labels of batches of (images, labels) lazily, for a model trained with the
+            categorical_crossentropy loss (e.g., the batches of a DatasetView in snippet39): only one batch of
+            one-hot labels is ever in memory, and it is overwritten by the next batch
+        '''
+        out = None
+        for x, y in batches:
+                if out is None or len(out) < len(y):
+                        out = np.empty((len(y), n_classes), dtype=dtype)
+                yield x, oneHotBatch(y, n_classes, out)
+
+def measure(fn):
+        ''' The peak memory allocated (MB) by a function '''
+        tracemalloc.start()
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, peak / 2**20
+
+if __name__ == '__main__':
+        # memory of the labels of a 1000 class dataset: dense one-hot vs. sparse vs. one-hot per batch
+        n_classes, n_images, batch_size = 1000, 100000, 32
+        labels = np.random.randint(0, n_classes, n_images)
+
+        print("%-36s %14s" % ('encoding', 'peak alloc (MB)'))
+        _, dense = measure(lambda: np.eye(n_classes)[labels.reshape(-1)])
+        print("%-36s %14.1f" % ('np.eye(C)[Y] (float64)', dense))
+        _, vectorized = measure(lambda: oneHotBatch(labels, n_classes))
+        print("%-36s %14.1f" % ('one-hot (float32)', vectorized))
+        sparse, compact = measure(lambda: sparseLabels(labels, n_classes))
+        print("%-36s %14.1f  (%s)" % ('sparse labels', compact, sparse.dtype))
+
+        def epoch():
+                for _, y in oneHotBatches(((None, sparse[ix:ix + batch_size]) for ix in range(0, n_images, batch_size)), n_classes):
+                        pass
+        _, lazy = measure(epoch)
+        print("%-36s %14.1f" % ('one-hot per batch (%d)' % batch_size, lazy))
+        print("reduction: %.0fx (sparse), %.0fx (one-hot per batch)" % (dense / compact, dense / lazy))
@@ -0,0 +1,137 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import numpy as np
+
+class BatchAugmenter(object):
+        ''' Random augmentation of a whole (N, H, W, C) uint8 batch at once, with random parameters per image
+            The flips, shifts and center zooms of a batch are a single gather (the source row and column of each
+            pixel), the 90 degree rotations are strided views of the images with the same rotation, and the
+            brightness/contrast is a lookup table per image.
+        '''
+        def __init__(self, horizontal_flip=True, vertical_flip=False, rotate90=False, shift_range=0.0, zoom_range=0.0,
+                     brightness_range=0, contrast_range=0.0, fill='wrap', seed=None):
+                ''' horizontal_flip : whether to randomly flip the images on the vertical axis (mirror)
+                    vertical_flip   : whether to randomly flip the images on the horizontal axis (upside down)
+                    rotate90        : whether to randomly rotate the (square) images by 0, 90, 180 or 270 degrees
+                    shift_range     : maximum shift, as a fraction of the height/width
+                    zoom_range      : maximum center zoom, e.g., 0.5 is a zoom factor between 1 and 1.5
+                    brightness_range: maximum pixel value added or subtracted
+                    contrast_range  : maximum change of the contrast, e.g., 0.2 is a scale between 0.8 and 1.2
+                    fill            : 'wrap' (roll the shifted pixels around, as np.roll) or 'constant' (black)
+                    seed            : seed of the random parameters
+                '''
+                if fill not in ['wrap', 'constant']:
+                        raise ValueError("fill must be 'wrap' or 'constant'")
+                self.horizontal_flip  = horizontal_flip
+                self.vertical_flip    = vertical_flip
+                self.rotate90         = rotate90
+                self.shift_range      = shift_range
+                self.zoom_range       = zoom_range
+                self.brightness_range = brightness_range
+                self.contrast_range   = contrast_range
+                self.fill             = fill
+                self.random           = np.random.RandomState(seed)
+
+        def _coordinates(self, size, flip, shift, zoom):
+                ''' The source coordinate of each output coordinate of each image (N, size), and whether it is inside the image '''
+                coordinates = np.arange(size)[None, :].repeat(len(flip), axis=0)
+                coordinates[flip] = coordinates[flip, ::-1]
+                # center zoom: the output is the center (size / zoom) of the image, enlarged (nearest neighbor)
+                center = (size - 1) / 2.0
+                coordinates = np.round((coordinates - center) / zoom[:, None] + center).astype(np.int64)
+                coordinates -= shift[:, None]
+                if self.fill == 'wrap':
+                        return coordinates % size, None
+                inside = (coordinates >= 0) & (coordinates < size)
+                return np.clip(coordinates, 0, size - 1), inside
+
+        def __call__(self, batch, out=None):
+                ''' Augment a batch of images
+                    batch: the (N, H, W, C) uint8 images
+                    out  : the reusable output buffer (default is allocated), a C-contiguous uint8 array of the shape
+                           of the batch, since the gathers write into it through a reshaped view
+                '''
+                n, height, width, channels = batch.shape
+                if out is None:
+                        out = np.empty(batch.shape, dtype=np.uint8)
+                elif out.shape != batch.shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+                        raise ValueError("out must be a C-contiguous uint8 array of shape %s" % (batch.shape,))
+                random = self.random
+
+                # the random parameters of each image
+                flip_h = random.rand(n) < 0.5 if self.horizontal_flip else np.zeros(n, bool)
+                flip_v = random.rand(n) < 0.5 if self.vertical_flip else np.zeros(n, bool)
+                dy = random.randint(-int(height * self.shift_range), int(height * self.shift_range) + 1, n)
+                dx = random.randint(-int(width * self.shift_range), int(width * self.shift_range) + 1, n)
+                zoom = 1.0 + random.rand(n) * self.zoom_range
+
+                # flips, shifts and zooms: one gather of the source pixel of each output pixel
+                rows, rows_inside = self._coordinates(height, flip_v, dy, zoom)
+                cols, cols_inside = self._coordinates(width, flip_h, dx, zoom)
+                source = ((np.arange(n)[:, None] * height + rows)[:, :, None] * width + cols[:, None, :]).reshape(-1)
+                np.take(batch.reshape(-1, channels), source, axis=0, out=out.reshape(-1, channels), mode='clip')
+                if rows_inside is not None:
+                        out[~(rows_inside[:, :, None] & cols_inside[:, None, :])] = 0
+
+                # 90 degree rotations: the images with the same rotation are rotated together (a strided view)
+                if self.rotate90:
+                        if height != width:
+                                raise ValueError("90 degree rotations need square images")
+                        k = random.randint(0, 4, n)
+                        for rotation in range(1, 4):
+                                ix = np.nonzero(k == rotation)[0]
+                                if len(ix):
+                                        out[ix] = np.rot90(out[ix], rotation, axes=(1, 2))
+
+                # brightness/contrast: a lookup table of the 256 pixel values per image, so the batch is never in float
+                if self.brightness_range or self.contrast_range:
+                        alpha = 1.0 + random.uniform(-self.contrast_range, self.contrast_range, n)
+                        beta = random.uniform(-self.brightness_range, self.brightness_range, n)
+                        table = np.clip(np.round(alpha[:, None] * np.arange(256)[None, :] + beta[:, None]), 0, 255).astype(np.uint8)
+                        # one gather per image, in place (the pixels are the indices, so there are no index arrays)
+                        for ix in range(n):
+                                np.take(table[ix], out[ix], out=out[ix], mode='clip')
+                return out
+
+if __name__ == '__main__':
+        from keras.preprocessing.image import ImageDataGenerator
+
+        # throughput of the batch augmentation vs. ImageDataGenerator on the same batch
+        batch = np.random.randint(0, 256, (256, 128, 128, 3)).astype(np.uint8)
+        augment = BatchAugmenter(horizontal_flip=True, shift_range=0.2, zoom_range=0.2, brightness_range=40,
+                                 contrast_range=0.2, fill='constant', seed=101)
+        datagen = ImageDataGenerator(horizontal_flip=True, width_shift_range=0.2, height_shift_range=0.2,
+                                     zoom_range=(0.8, 1.0), brightness_range=(0.8, 1.2), fill_mode='constant')
+
+        out = np.empty(batch.shape, dtype=np.uint8)
+        augment(batch, out)
+        steps = 10
+        start = time.perf_counter()
+        for _ in range(steps):
+                augment(batch, out)
+        numpy_rate = steps * len(batch) / (time.perf_counter() - start)
+
+        flow = datagen.flow(batch, batch_size=len(batch), shuffle=False)
+        next(flow)
+        start = time.perf_counter()
+        for _ in range(steps):
+                next(flow)
+        keras_rate = steps * len(batch) / (time.perf_counter() - start)
+
+        print("%-20s %12s" % ('augmentation', 'images/sec'))
+        print("%-20s %12.1f" % ('BatchAugmenter', numpy_rate))
+        print("%-20s %12.1f" % ('ImageDataGenerator', keras_rate))
+        print("speedup: %.1fx" % (numpy_rate / keras_rate))
@@ -15,7 +15,6 @@
 # Keras classes we will use to build models
 from keras import Sequential, Input
 from keras.layers import Flatten, Dense, Activation, ReLU, Conv2D, MaxPooling2D, Dropout
-from keras.utils import to_categorical
 
 # Keras library for the builtin MNIST dataset
 from keras.datasets import mnist
@@ -44,11 +43,12 @@ x_test  = x_test.reshape(-1, 28, 28, 1)
 # this will output (60000, 28, 28, 1) and (10000, 28, 28, 1)
 print("x_train", x_train.shape, "x_test", x_test.shape)
 
-# We need to convert the labels to one-hot-encoding
-y_train = to_categorical(y_train)
-y_test  = to_categorical(y_test)
+# We keep the labels as compact (uint8) integer labels instead of one-hot-encoding them,
+# and train with the sparse_categorical_crossentropy loss
+y_train = y_train.astype(np.uint8)
+y_test  = y_test.astype(np.uint8)
 
-# this will output (60000, 10) and (10000, 10)
+# this will output (60000,) and (10000,)
 print("y_train", y_train.shape, "y_test", y_test.shape)
 
 # This is the inverted test dataset
@@ -80,7 +80,7 @@ def CNN(filters):
 
   # For a multi-class classification problem
   model.compile(optimizer='rmsprop',
-              loss='categorical_crossentropy',
+              loss='sparse_categorical_crossentropy',
               metrics=['accuracy'])
   model.summary()
   return model
@@ -127,7 +127,7 @@ x_train_invert = (x_train_invert / 255.0).astype(np.float32)
 x_train_invert = x_train_invert.reshape(-1, 28, 28, 1)
 
 # Select the same 10% of the corresponding labels
-y_train_invert = x_train[0:6000]
+y_train_invert = y_train[0:6000]
 
 # Next, combine the two training datasets into a single training set
 x_combine = np.append(x_train, x_train_invert, axis=0)
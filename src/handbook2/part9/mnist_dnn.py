@@ -15,7 +15,6 @@
 # Keras classes we will use to build models
 from keras import Sequential, Input
 from keras.layers import Flatten, Dense, Activation, ReLU, Conv2D, MaxPooling2D, Dropout
-from keras.utils import to_categorical
 
 # Keras library for the builtin MNIST dataset
 from keras.datasets import mnist
@@ -44,11 +43,12 @@ x_test  = x_test.reshape(-1, 28, 28, 1)
 # this will output (60000, 28, 28, 1) and (10000, 28, 28, 1)
 print("x_train", x_train.shape, "x_test", x_test.shape)
 
-# We need to convert the labels to one-hot-encoding
-y_train = to_categorical(y_train)
-y_test  = to_categorical(y_test)
+# We keep the labels as compact (uint8) integer labels instead of one-hot-encoding them,
+# and train with the sparse_categorical_crossentropy loss
+y_train = y_train.astype(np.uint8)
+y_test  = y_test.astype(np.uint8)
 
-# this will output (60000, 10) and (10000, 10)
+# this will output (60000,) and (10000,)
 print("y_train", y_train.shape, "y_test", y_test.shape)
 
 # This is the inverted test dataset
@@ -77,7 +77,7 @@ def DNN(nodes, dropout=False):
 
   # For a multi-class classification problem
   model.compile(optimizer='rmsprop',
-              loss='categorical_crossentropy',
+              loss='sparse_categorical_crossentropy',
               metrics=['accuracy'])
   model.summary()
   return model
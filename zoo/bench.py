@@ -0,0 +1,207 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo CPU benchmark
+# Instantiates the composable models and reports the graph build time, number of parameters, FLOPs,
+# peak resident memory, and single image/batched CPU inference latency, as JSON.
+# Each model is measured in its own process, so the peak memory is per model.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.bench                                    # all models, 224x224
+#   python -m zoo.bench --models ResNet50 MobileNetV2 --sizes 224 160 --output bench.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import importlib.util
+
+# Directory of the model zoo
+ZOO = os.path.dirname(os.path.abspath(__file__))
+
+# The composable models: name => (file, class, positional arguments)
+models = {
+    'VGG16'            : ('vgg/vgg_c.py',                       'VGG',               (16,)),
+    'VGG19'            : ('vgg/vgg_c.py',                       'VGG',               (19,)),
+    'ResNet50'         : ('resnet/resnet_v1_c.py',              'ResNetV1',          (50,)),
+    'ResNet101'        : ('resnet/resnet_v1_c.py',              'ResNetV1',          (101,)),
+    'ResNet152'        : ('resnet/resnet_v1_c.py',              'ResNetV1',          (152,)),
+    'ResNet50_v1.5'    : ('resnet/resnet_v1.5_c.py',            'ResNetV1_5',        (50,)),
+    'ResNet50_v2.0'    : ('resnet/resnet_v2_c.py',              'ResNetV2',          (50,)),
+    'SE-ResNet50'      : ('senet/se_resnet_c.py',               'SEResNet',          (50,)),
+    'InceptionV1'      : ('inception/inception_v1_c.py',        'InceptionV1',       ()),
+    'InceptionV2'      : ('inception/inception_v2_c.py',        'InceptionV2',       ()),
+    'ResNeXt50'        : ('resnext/resnext_c.py',               'ResNeXt',           (50,)),
+    'SE-ResNeXt50'     : ('senet/se_resnext_c.py',              'SEResNeXt',         (50,)),
+    'Xception'         : ('xception/xception_c.py',             'Xception',          ()),
+    'DenseNet121'      : ('densenet/densenet_c.py',             'DenseNet',          (121,)),
+    'MobileNetV1'      : ('mobilenet/mobilenet_v1_c.py',        'MobileNetV1',       ()),
+    'MobileNetV2'      : ('mobilenet/mobilenet_v2_c.py',        'MobileNetV2',       ()),
+    'SqueezeNet'       : ('squeezenet/squeezenet_c.py',         'SqueezeNet',        ()),
+    'SqueezeNetBypass' : ('squeezenet/squeezenet_bypass_c.py',  'SqueezeNetBypass',  ()),
+    'SqueezeNetComplex': ('squeezenet/squeezenet_complex_c.py', 'SqueezeNetComplex', ()),
+    'ShuffleNet'       : ('shufflenet/shufflenet_c.py',         'ShuffleNet',        ()),
+}
+
+def load(name):
+    """ Load the composable class of a model in the zoo
+        name: name of the model (see models)
+    """
+    path, cls, _ = models[name]
+    path = os.path.join(ZOO, path)
+    # Some file names are not module names (e.g., resnet_v1.5_c.py), so load by path
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3].replace('.', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, cls)
+
+def build(name, input_shape=(224, 224, 3), **kwargs):
+    """ Instantiate a model in the zoo
+        name       : name of the model (see models)
+        input_shape: the input shape
+    """
+    _, _, args = models[name]
+    return load(name)(*args, input_shape=input_shape, **kwargs).model
+
+def flops(model, batch_size=1):
+    """ Count the floating point operations of a forward pass (multiply and add are 2 FLOPs)
+        model     : the model
+        batch_size: number of images
+    """
+    import tensorflow as tf
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2_as_graph
+
+    forward = tf.function(lambda x: model(x, training=False))
+    concrete = forward.get_concrete_function(tf.TensorSpec((batch_size,) + tuple(model.input_shape[1:]), tf.float32))
+    _, graph_def = convert_variables_to_constants_v2_as_graph(concrete)
+    with tf.Graph().as_default() as graph:
+        tf.graph_util.import_graph_def(graph_def, name='')
+        options = tf.compat.v1.profiler.ProfileOptionBuilder.float_operation()
+        options['output'] = 'none'
+        profile = tf.compat.v1.profiler.profile(graph=graph, run_meta=tf.compat.v1.RunMetadata(), cmd='op', options=options)
+    return profile.total_float_ops
+
+def latency(model, batch_size, steps=10):
+    """ Measure the median CPU inference latency (seconds) of a batch
+        model     : the model
+        batch_size: number of images per batch
+        steps     : number of timed steps
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    forward = tf.function(lambda x: model(x, training=False))
+    # Some models have several outputs (e.g., the auxiliary classifiers of Inception)
+    fetch = lambda x: tf.nest.map_structure(lambda t: t.numpy(), forward(x))
+    x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+
+    # warmup (trace and first run)
+    fetch(x)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        fetch(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def peak_rss():
+    """ Peak resident memory of this process in MB """
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def benchmark(name, size=224, batch_size=32, steps=10):
+    """ Benchmark a model in the zoo (in this process)
+        name      : name of the model (see models)
+        size      : height and width of the input
+        batch_size: number of images for the batched latency
+        steps     : number of timed steps
+    """
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    import tensorflow as tf
+    result = { 'model': name, 'input_shape': [size, size, 3], 'batch_size': batch_size }
+    result['rss_baseline_mb'] = peak_rss()
+
+    start = time.perf_counter()
+    model = build(name, input_shape=(size, size, 3))
+    result['build_s'] = time.perf_counter() - start
+    result['params'] = int(model.count_params())
+    result['layers'] = len(model.layers)
+    result['flops'] = int(flops(model))
+
+    result['latency_1_ms'] = latency(model, 1, steps) * 1000
+    result['latency_batch_ms'] = latency(model, batch_size, steps) * 1000
+    result['throughput_ips'] = batch_size / (result['latency_batch_ms'] / 1000)
+    result['peak_rss_mb'] = peak_rss()
+    return result
+
+def run(name, size=224, batch_size=32, steps=10):
+    """ Benchmark a model in the zoo in a separate process
+        name      : name of the model (see models)
+        size      : height and width of the input
+        batch_size: number of images for the batched latency
+        steps     : number of timed steps
+    """
+    command = [sys.executable, '-m', 'zoo.bench', '--worker', '--models', name, '--sizes', str(size),
+               '--batch-size', str(batch_size), '--steps', str(steps)]
+    process = subprocess.run(command, cwd=os.path.dirname(ZOO), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode:
+        error = process.stderr.strip().splitlines()
+        return { 'model': name, 'input_shape': [size, size, 3], 'error': error[-1] if error else 'failed' }
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def commit():
+    """ The git commit of the model zoo, to track regressions across commits """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ZOO, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model Zoo CPU benchmark')
+    parser.add_argument('--models', nargs='+', default=list(models), help='models to benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[224], help='input heights/widths')
+    parser.add_argument('--batch-size', type=int, default=32, help='batch size for the batched latency')
+    parser.add_argument('--steps', type=int, default=10, help='number of timed steps')
+    parser.add_argument('--output', help='JSON file for the results (default is stdout)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Measure a single model in this process
+    if args.worker:
+        print(json.dumps(benchmark(args.models[0], args.sizes[0], args.batch_size, args.steps)))
+        sys.exit(0)
+
+    results = []
+    for name in args.models:
+        for size in args.sizes:
+            result = run(name, size, args.batch_size, args.steps)
+            results.append(result)
+            if 'error' in result:
+                print("%-18s %4d  error: %s" % (name, size, result['error']), file=sys.stderr)
+            else:
+                print("%-18s %4d  build %6.2fs  params %11d  GFLOPs %7.2f  rss %7.0fMB  1: %8.1fms  %d: %8.1fms" %
+                      (name, size, result['build_s'], result['params'], result['flops'] / 1e9, result['peak_rss_mb'],
+                       result['latency_1_ms'], args.batch_size, result['latency_batch_ms']), file=sys.stderr)
+
+    report = { 'commit': commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
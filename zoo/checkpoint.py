@@ -0,0 +1,84 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Gradient checkpointing of the groups of the composable models
+# A group is built as a nested model wrapped in a GroupCheckpoint layer, which only keeps the input
+# of the group for the backward pass and recomputes the activations inside the group during backprop.
+
+import tensorflow as tf
+from tensorflow.keras import Model, Input
+from tensorflow.keras.layers import Layer, BatchNormalization
+
+class GroupCheckpoint(Layer):
+    """ A group whose activations are recomputed during backprop (gradient checkpointing)
+        Only the input of the group is kept for the backward pass. The moving statistics of the batch
+        normalization layers are updated once, by the forward pass: the recomputation normalizes with
+        the same batch statistics, but with the moving averages frozen.
+    """
+    def __init__(self, group, **kwargs):
+        """ Construct a checkpointed group
+            group: the group (as a model)
+        """
+        super(GroupCheckpoint, self).__init__(**kwargs)
+        self.group = group
+
+    def call(self, inputs, training=None):
+        if not training:
+            return self.group(inputs, training=training)
+
+        # The first call of the function is the forward pass, the next ones are the recomputations during backprop
+        passes = []
+        def group(x):
+            if passes:
+                return self.recompute(x)
+            passes.append(x)
+            return self.group(x, training=True)
+        return tf.recompute_grad(group)(inputs)
+
+    def recompute(self, inputs):
+        """ Run the group again in training mode, without updating the moving statistics
+            inputs: the input of the group
+        """
+        # With a momentum of 1, the moving averages are assigned their current value
+        layers = [layer for layer in self.group.submodules if isinstance(layer, BatchNormalization)]
+        momentums = [layer.momentum for layer in layers]
+        try:
+            for layer in layers:
+                layer.momentum = 1.0
+            return self.group(inputs, training=True)
+        finally:
+            for layer, momentum in zip(layers, momentums):
+                layer.momentum = momentum
+
+    def compute_output_shape(self, input_shape):
+        return self.group.compute_output_shape(input_shape)
+
+    def get_config(self):
+        config = super(GroupCheckpoint, self).get_config()
+        config.update({'group': tf.keras.layers.serialize(self.group)})
+        return config
+
+    @classmethod
+    def from_config(cls, config, custom_objects=None):
+        config['group'] = tf.keras.layers.deserialize(config['group'], custom_objects=custom_objects)
+        return cls(**config)
+
+def checkpoint(group):
+    """ Wrap the construction of a group, so its activations are recomputed during backprop
+        group: the method constructing the group
+    """
+    def checkpointed_group(x, *args, **kwargs):
+        inputs = Input(x.shape[1:])
+        return GroupCheckpoint(Model(inputs, group(inputs, *args, **kwargs)))(x)
+    return checkpointed_group
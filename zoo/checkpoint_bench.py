@@ -0,0 +1,142 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo gradient checkpointing benchmark
+# Trains the deep composable models with and without checkpoint_groups=True on the CPU, and reports
+# the peak resident memory saved vs. the extra compute (training step time) for each depth.
+# Each configuration is trained in its own process, so the peak memory is per configuration.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.checkpoint_bench
+#   python -m zoo.checkpoint_bench --models ResNet SE-ResNeXt --depths 152 --batch-size 16
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from zoo.bench import ZOO, load, peak_rss
+
+# The deep composable models: name => name of the model in the zoo (see zoo.bench.models)
+families = {
+    'ResNet'      : 'ResNet50',
+    'ResNet_v1.5' : 'ResNet50_v1.5',
+    'ResNet_v2.0' : 'ResNet50_v2.0',
+    'SE-ResNet'   : 'SE-ResNet50',
+    'ResNeXt'     : 'ResNeXt50',
+    'SE-ResNeXt'  : 'SE-ResNeXt50',
+}
+
+def train_step(name, n_layers, checkpoint_groups, size=224, batch_size=8, steps=5):
+    """ Measure the training step time and peak memory of a model (in this process)
+        name             : name of the model family (see families)
+        n_layers         : number of layers
+        checkpoint_groups: whether to recompute the activations of each group during backprop
+        size             : height and width of the input
+        batch_size       : number of images per step
+        steps            : number of timed steps
+    """
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    import numpy as np
+    import tensorflow as tf
+
+    model = load(families[name])(n_layers, input_shape=(size, size, 3), checkpoint_groups=checkpoint_groups).model
+    optimizer = tf.keras.optimizers.SGD(0.01)
+    loss_fn = tf.keras.losses.SparseCategoricalCrossentropy()
+
+    @tf.function
+    def step(x, y):
+        with tf.GradientTape() as tape:
+            loss = loss_fn(y, model(x, training=True))
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return loss
+
+    x = np.random.rand(batch_size, size, size, 3).astype(np.float32)
+    y = np.random.randint(0, model.output_shape[-1], (batch_size, 1))
+
+    # warmup (trace and first step)
+    step(x, y).numpy()
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        step(x, y).numpy()
+        times.append(time.perf_counter() - start)
+    return { 'step_ms': float(np.median(times)) * 1000, 'peak_rss_mb': peak_rss() }
+
+def run(name, n_layers, checkpoint_groups, size=224, batch_size=8, steps=5):
+    """ Measure a configuration in a separate process """
+    command = [sys.executable, '-m', 'zoo.checkpoint_bench', '--worker', '--models', name, '--depths', str(n_layers),
+               '--size', str(size), '--batch-size', str(batch_size), '--steps', str(steps)]
+    if checkpoint_groups:
+        command.append('--checkpoint')
+    process = subprocess.run(command, cwd=os.path.dirname(ZOO), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode:
+        error = process.stderr.strip().splitlines()
+        return { 'error': error[-1] if error else 'failed' }
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def compare(name, n_layers, size=224, batch_size=8, steps=5):
+    """ Compare the training of a model with and without checkpointed groups
+        name      : name of the model family (see families)
+        n_layers  : number of layers
+        size      : height and width of the input
+        batch_size: number of images per step
+        steps     : number of timed steps
+    """
+    result = { 'model': name + str(n_layers), 'input_shape': [size, size, 3], 'batch_size': batch_size }
+    baseline = run(name, n_layers, False, size, batch_size, steps)
+    checkpoint = run(name, n_layers, True, size, batch_size, steps)
+    result.update(baseline=baseline, checkpoint=checkpoint)
+    if 'error' not in baseline and 'error' not in checkpoint:
+        result['memory_saved'] = 1 - checkpoint['peak_rss_mb'] / baseline['peak_rss_mb']
+        result['extra_compute'] = checkpoint['step_ms'] / baseline['step_ms'] - 1
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model Zoo gradient checkpointing benchmark')
+    parser.add_argument('--models', nargs='+', default=list(families), choices=list(families), help='model families')
+    parser.add_argument('--depths', nargs='+', type=int, default=[50, 101, 152], help='number of layers')
+    parser.add_argument('--size', type=int, default=224, help='input height/width')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--steps', type=int, default=5, help='number of timed steps')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--checkpoint', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Measure a single configuration in this process
+    if args.worker:
+        print(json.dumps(train_step(args.models[0], args.depths[0], args.checkpoint, args.size, args.batch_size, args.steps)))
+        sys.exit(0)
+
+    print("%-16s %14s %14s %10s %12s %12s %10s" % ('model', 'peak (MB)', 'ckpt (MB)', 'saved', 'step (ms)', 'ckpt (ms)', 'extra'))
+    results = []
+    for name in args.models:
+        for n_layers in args.depths:
+            result = compare(name, n_layers, args.size, args.batch_size, args.steps)
+            results.append(result)
+            if 'memory_saved' not in result:
+                print("%-16s error: %s" % (result['model'], result['baseline'].get('error', result['checkpoint'].get('error'))))
+                continue
+            baseline, checkpoint = result['baseline'], result['checkpoint']
+            print("%-16s %14.0f %14.0f %9.1f%% %12.1f %12.1f %9.1f%%" % (result['model'], baseline['peak_rss_mb'],
+                  checkpoint['peak_rss_mb'], result['memory_saved'] * 100, baseline['step_ms'], checkpoint['step_ms'],
+                  result['extra_compute'] * 100))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,88 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# DenseNet (121, 169, 201) - standard vs. memory-efficient dense blocks
+# Reports the peak resident memory and CPU training step time. Each configuration
+# is trained in its own process, so the peak memory is per configuration.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.densenet.densenet_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import sys
+import json
+import time
+import resource
+import subprocess
+
+def train_step(n_layers, memory_efficient, input_shape=(224, 224, 3), batch_size=16, steps=5):
+    """ Measure the training step time and peak memory of a DenseNet on the CPU (in this process)
+        n_layers        : number of layers
+        memory_efficient: whether to use memory-efficient (recomputed) dense blocks
+        input_shape     : the input shape
+        batch_size      : number of images per step
+        steps           : number of timed steps
+    """
+    import numpy as np
+    import tensorflow as tf
+    from zoo.densenet.densenet_c import DenseNet
+
+    model = DenseNet(n_layers, input_shape=input_shape, memory_efficient=memory_efficient).model
+    optimizer = tf.keras.optimizers.SGD(0.01)
+    loss_fn = tf.keras.losses.SparseCategoricalCrossentropy()
+
+    @tf.function
+    def step(x, y):
+        with tf.GradientTape() as tape:
+            loss = loss_fn(y, model(x, training=True))
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return loss
+
+    x = np.random.rand(batch_size, *input_shape).astype(np.float32)
+    y = np.random.randint(0, 1000, (batch_size, 1))
+
+    # warmup (trace and first step)
+    step(x, y).numpy()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step(x, y).numpy()
+    step_time = (time.perf_counter() - start) / steps
+
+    # ru_maxrss is in KB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return { 'step_ms': step_time * 1000, 'peak_rss_mb': peak }
+
+def run(n_layers, memory_efficient, batch_size):
+    """ Measure a configuration in a separate process """
+    command = [sys.executable, '-m', 'zoo.densenet.densenet_bench', '--worker', str(n_layers), str(int(memory_efficient)), str(batch_size)]
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    output = subprocess.check_output(command, cwd=root, universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--worker':
+        n_layers, memory_efficient, batch_size = int(sys.argv[2]), bool(int(sys.argv[3])), int(sys.argv[4])
+        print(json.dumps(train_step(n_layers, memory_efficient, batch_size=batch_size)))
+        sys.exit(0)
+
+    print("%-12s %6s %-10s %12s %12s" % ('model', 'batch', 'blocks', 'peak (MB)', 'step (ms)'))
+    for n_layers in [121, 169, 201]:
+        for batch_size in [16, 32]:
+            for memory_efficient in [False, True]:
+                result = run(n_layers, memory_efficient, batch_size)
+                print("%-12s %6d %-10s %12.0f %12.1f" % ('DenseNet' + str(n_layers), batch_size,
+                      'efficient' if memory_efficient else 'standard', result['peak_rss_mb'], result['step_ms']))
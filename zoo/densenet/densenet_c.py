@@ -18,7 +18,70 @@
 import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import ZeroPadding2D, Conv2D, MaxPooling2D, BatchNormalization, ReLU
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, AveragePooling2D, Concatenate
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, AveragePooling2D, Concatenate, Layer, Activation
+from zoo.precision import policy_scope
+
+class DenseBottleneck(Layer):
+    """ Memory-Efficient Bottleneck of a Dense Block
+        Concatenate the feature maps of the previous blocks, BN-ReLU and 1x1 convolution (dimensionality expansion).
+        The concatenated and normalized feature maps, which grow with the number of blocks, are not kept for the
+        backward pass; they are recomputed from the (narrow) feature maps of the previous blocks (gradient checkpointing).
+    """
+    def __init__(self, n_filters, momentum=0.99, epsilon=1e-3, kernel_initializer='he_normal', **kwargs):
+        """ Construct a Memory-Efficient Bottleneck
+            n_filters : number of filters of the 1x1 convolution
+            momentum  : momentum of the moving mean/variance of the batch normalization
+            epsilon   : epsilon of the batch normalization
+        """
+        super(DenseBottleneck, self).__init__(**kwargs)
+        self.n_filters = n_filters
+        self.momentum = momentum
+        self.epsilon = epsilon
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+
+    def build(self, input_shape):
+        channels = sum([int(shape[-1]) for shape in input_shape])
+        self.gamma = self.add_weight(name='gamma', shape=(channels,), initializer='ones')
+        self.beta  = self.add_weight(name='beta',  shape=(channels,), initializer='zeros')
+        self.moving_mean = self.add_weight(name='moving_mean', shape=(channels,), initializer='zeros', trainable=False)
+        self.moving_variance = self.add_weight(name='moving_variance', shape=(channels,), initializer='ones', trainable=False)
+        self.kernel = self.add_weight(name='kernel', shape=(1, 1, channels, self.n_filters), initializer=self.kernel_initializer)
+        super(DenseBottleneck, self).build(input_shape)
+
+    def call(self, inputs, training=None):
+        if training:
+            # Batch normalization is per channel, so the statistics of the concatenation are the
+            # concatenation of the statistics of each input; no need to materialize it here
+            moments = [tf.nn.moments(x, axes=[0, 1, 2]) for x in inputs]
+            mean = tf.concat([m for m, _ in moments], axis=0)
+            variance = tf.concat([v for _, v in moments], axis=0)
+            # The moving statistics are float32 variables with mixed precision
+            batch_mean = tf.cast(tf.stop_gradient(mean), self.moving_mean.dtype)
+            batch_variance = tf.cast(tf.stop_gradient(variance), self.moving_variance.dtype)
+            self.moving_mean.assign(self.moving_mean.read_value() * self.momentum + batch_mean * (1 - self.momentum))
+            self.moving_variance.assign(self.moving_variance.read_value() * self.momentum + batch_variance * (1 - self.momentum))
+        else:
+            mean, variance = self.moving_mean, self.moving_variance
+
+        def bottleneck(mean, variance, *features):
+            # BN-RE-Conv on the concatenated feature maps (recomputed during backprop)
+            x = tf.concat(features, axis=-1)
+            x = tf.nn.batch_normalization(x, mean, variance, self.beta, self.gamma, self.epsilon)
+            x = tf.nn.relu(x)
+            return tf.nn.conv2d(x, self.kernel, strides=1, padding='VALID')
+
+        if training:
+            return tf.recompute_grad(bottleneck)(mean, variance, *inputs)
+        return bottleneck(mean, variance, *inputs)
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape[0][:-1]) + (self.n_filters,)
+
+    def get_config(self):
+        config = super(DenseBottleneck, self).get_config()
+        config.update({'n_filters': self.n_filters, 'momentum': self.momentum, 'epsilon': self.epsilon,
+                       'kernel_initializer': tf.keras.initializers.serialize(self.kernel_initializer)})
+        return config
 
 class DenseNet(object):
     """ Construct a Densely Connected Convolution Neural Network """
@@ -30,31 +93,37 @@ class DenseNet(object):
     reduction = 0.5
     # Meta-parameter: number of filters in a convolution block within a residual block (growth rate)
     n_filters = 32
+    # Whether to recompute the concatenated feature maps during backprop instead of storing them
+    memory_efficient = False
     init_weights = 'he_normal'
     _model = None
 
-    def __init__(self, n_layers, n_filters=32, reduction=0.5, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, n_filters=32, reduction=0.5, input_shape=(224, 224, 3), n_classes=1000, memory_efficient=False, dtype_policy=None):
         """ Construct a Densely Connected Convolution Neural Network
-            n_layers   : number of layers
-            n_filters  : number of filters (growth rate)
-            reduction  : anount to reduce feature maps by (compression factor)
-            input_shape: input shape
-            n_classes  : number of output classes
+            n_layers        : number of layers
+            n_filters       : number of filters (growth rate)
+            reduction       : anount to reduce feature maps by (compression factor)
+            input_shape     : input shape
+            n_classes       : number of output classes
+            memory_efficient: whether to use memory-efficient (recomputed) dense blocks
+            dtype_policy    : mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
-        # The input vector
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input vector
+            inputs = Input(shape=input_shape)
 
-        # The Stem Convolution Group
-        x = self.stem(inputs, n_filters)
+            # The Stem Convolution Group
+            x = self.stem(inputs, n_filters)
 
-        # The Learner
-        x = self.learner(x, self.groups[n_layers], n_filters, reduction)
+            # The Learner
+            x = self.learner(x, list(self.groups[n_layers]), n_filters, reduction, memory_efficient)
 
-        # Classifier for 1000 classes
-        outputs = self.classifier(x, n_classes)
+            # Classifier for 1000 classes
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the model
-        self._model = Model(inputs, outputs)
+            # Instantiate the model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -83,35 +152,44 @@ class DenseNet(object):
         x = MaxPooling2D((3, 3), strides=2)(x)
         return x
     
-    def learner(self, x, groups, n_filters, reduction):
+    def learner(self, x, groups, n_filters, reduction, memory_efficient=False):
         """ Construct the Learner
-            x         : input to the learner
-            blocks    : set of number of blocks per group
-            n_filters : number of filters (growth rate)
-            reduction : amount to reduce (compress) feature maps by
+            x               : input to the learner
+            blocks          : set of number of blocks per group
+            n_filters       : number of filters (growth rate)
+            reduction       : amount to reduce (compress) feature maps by
+            memory_efficient: whether to use memory-efficient (recomputed) dense blocks
         """
         # pop off the list the last dense block
         last = groups.pop()
 
         # Create the dense groups and interceding transition blocks
         for n_blocks in groups:
-            x = DenseNet.group(x, n_blocks, n_filters, reduction)
+            x = DenseNet.group(x, n_blocks, n_filters, reduction, memory_efficient=memory_efficient)
 
         # Add the last dense group w/o a following transition block
-        x = DenseNet.group(x, last, n_filters)
+        x = DenseNet.group(x, last, n_filters, memory_efficient=memory_efficient)
         return x
 
     @staticmethod
-    def group(x, n_blocks, n_filters, reduction=None, init_weights=None):
+    def group(x, n_blocks, n_filters, reduction=None, init_weights=None, memory_efficient=False):
         """ Construct a Dense Block
-            x         : input to the block
-            n_blocks  : number of residual blocks in dense block
-            n_filters : number of filters in convolution layer 
-            reduction : amount to reduce (compress) feature maps by
+            x               : input to the block
+            n_blocks        : number of residual blocks in dense block
+            n_filters       : number of filters in convolution layer 
+            reduction       : amount to reduce (compress) feature maps by
+            memory_efficient: whether to use memory-efficient (recomputed) dense blocks
         """
-        # Construct a group of residual blocks
-        for _ in range(n_blocks):
-            x = DenseNet.residual_block(x, n_filters, init_weights=init_weights)
+        if memory_efficient:
+            # Keep the feature maps of each block separate, and concatenate once at the end of the group
+            features = [x]
+            for _ in range(n_blocks):
+                features.append(DenseNet.efficient_block(features, n_filters, init_weights=init_weights))
+            x = Concatenate()(features)
+        else:
+            # Construct a group of residual blocks
+            for _ in range(n_blocks):
+                x = DenseNet.residual_block(x, n_filters, init_weights=init_weights)
 
         # Construct interceding transition block
         if reduction is not None:
@@ -148,6 +226,27 @@ class DenseNet(object):
         x = Concatenate()([shortcut, x])
         return x
 
+    @staticmethod
+    def efficient_block(features, n_filters, init_weights=None):
+        """ Construct a Memory-Efficient Residual Block
+            features : feature maps of the group input and of the previous blocks in the group
+            n_filters: number of filters in convolution layer in residual block
+            Returns the feature maps of this block (the concatenation is deferred to the end of the group)
+        """
+        if init_weights is None:
+            init_weights = DenseNet.init_weights
+
+        # Concatenate-BN-RE-Conv dimensionality expansion, expand filters by 4 (DenseNet-B)
+        # The concatenation and BN-RE are recomputed during backprop
+        x = DenseBottleneck(4 * n_filters, kernel_initializer=init_weights)(features)
+
+        # Bottleneck convolution
+        # 3x3 convolution with padding=same to preserve same shape of feature maps
+        x = BatchNormalization()(x)
+        x = ReLU()(x)
+        x = Conv2D(n_filters, (3, 3), strides=(1, 1), padding='same', use_bias=False, kernel_initializer=init_weights)(x)
+        return x
+
     @staticmethod
     def trans_block(x, reduction, init_weights=None):
         """ Construct a Transition Block
@@ -179,8 +278,13 @@ class DenseNet(object):
         # Global Average Pooling will flatten the 7x7 feature maps into 1D feature maps
         x = GlobalAveragePooling2D()(x)
         # Fully connected output layer (classification)
-        x = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        x = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        x = Activation('softmax', dtype='float32')(x)
         return x
     
 # Example
 # densenet = DenseNet(121)
+
+# Example: memory-efficient dense blocks for training with larger batches
+# densenet = DenseNet(121, memory_efficient=True)
@@ -0,0 +1,317 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Batch Normalization folding for inference
+# Rewrites a trained (functional) model into an inference model, where the BatchNormalization
+# scale and shift are folded into the kernel/bias of the adjacent convolution, and the ReLU
+# following a folded convolution is fused as the activation of the convolution.
+# The export pass also folds explicit ZeroPadding2D layers into the padding of the following
+# convolution and removes the Dropout layers, so there is one op per convolution.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.fold
+
+import tensorflow as tf
+import numpy as np
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import Conv2D, DepthwiseConv2D, SeparableConv2D, BatchNormalization
+from tensorflow.keras.layers import ReLU, Activation, InputLayer, ZeroPadding2D, Dropout
+
+def graph(model):
+    """ Get the layers of a functional model in topological order, with the names of their inbound layers
+        model: the functional model
+    """
+    config = model.get_config()
+    layers = []
+    for layer_config in config['layers']:
+        inbound = []
+        if layer_config['inbound_nodes']:
+            inbound = [inbound_layer[0] for inbound_layer in layer_config['inbound_nodes'][0]]
+        layers.append((model.get_layer(layer_config['name']), inbound))
+
+    # The layers which consume the output of each layer (None is a model output)
+    consumers = { layer.name: [] for layer, _ in layers }
+    for layer, inbound in layers:
+        for name in inbound:
+            consumers[name].append(layer)
+    for name, _, _ in config['output_layers']:
+        consumers[name].append(None)
+    return layers, consumers, [name for name, _, _ in config['output_layers']]
+
+def rebuild(model, layers, weights={}, configs={}, skip={}):
+    """ Rebuild a functional model layer by layer
+        model  : the functional model
+        layers : the layers in topological order with their inbound layers (see graph())
+        weights: replacement weights by layer name
+        configs: replacement layer configurations by layer name
+        skip   : names of the layers which are removed (the output is their first input)
+    """
+    _, _, outputs = graph(model)
+
+    tensors = {}
+    for layer, inbound in layers:
+        if isinstance(layer, InputLayer):
+            tensors[layer.name] = Input(shape=layer.output.shape[1:], dtype=layer.dtype, name=layer.name)
+            continue
+        inputs = [tensors[name] for name in inbound]
+        if layer.name in skip:
+            tensors[layer.name] = inputs[0]
+            continue
+
+        new_layer = layer.__class__.from_config(configs.get(layer.name, layer.get_config()))
+        tensors[layer.name] = new_layer(inputs[0] if len(inputs) == 1 else inputs)
+        new_layer.set_weights(weights.get(layer.name, layer.get_weights()))
+
+    inputs = [tensors[name] for name in model.input_names]
+    return Model(inputs, [tensors[name] for name in outputs] if len(outputs) > 1 else tensors[outputs[0]])
+
+def scale_shift(bn):
+    """ Get the per channel scale and shift of an (inference) Batch Normalization layer
+        bn: the batch normalization layer
+    """
+    mean, variance = bn.moving_mean.numpy(), bn.moving_variance.numpy()
+    gamma = bn.gamma.numpy() if bn.scale  else np.ones_like(mean)
+    beta  = bn.beta.numpy()  if bn.center else np.zeros_like(mean)
+    scale = gamma / np.sqrt(variance + bn.epsilon)
+    return scale, beta - mean * scale
+
+def kernel_bias(conv):
+    """ Get the kernel(s) and bias of a convolution (the bias is zero when use_bias=False)
+        conv: the convolution layer
+    """
+    weights = conv.get_weights()
+    if conv.use_bias:
+        return weights[:-1], weights[-1]
+    return weights, np.zeros(conv.output.shape[-1], dtype=weights[0].dtype)
+
+def fold_backward(conv, kernels, bias, bn):
+    """ Fold a Batch Normalization that follows a convolution: BN(conv(x)) = conv'(x)
+        conv   : the convolution layer
+        kernels: the kernel(s) of the convolution
+        bias   : the bias of the convolution
+        bn     : the batch normalization layer
+    """
+    scale, shift = scale_shift(bn)
+    if isinstance(conv, DepthwiseConv2D):
+        # kernel is (H, W, C, multiplier), output channel c * multiplier + m
+        kernels = [kernels[0] * scale.reshape(kernels[0].shape[2:])]
+    elif isinstance(conv, SeparableConv2D):
+        # scale the pointwise kernel
+        kernels = [kernels[0], kernels[1] * scale]
+    else:
+        kernels = [kernels[0] * scale]
+    return kernels, bias * scale + shift
+
+def fold_forward(conv, kernels, bias, bn):
+    """ Fold a Batch Normalization that precedes a 1x1 convolution: conv(BN(x)) = conv'(x)
+        conv   : the 1x1 convolution layer
+        kernels: the kernel(s) of the convolution
+        bias   : the bias of the convolution
+        bn     : the batch normalization layer
+    """
+    scale, shift = scale_shift(bn)
+    kernel = kernels[0]
+    bias = bias + np.tensordot(shift, kernel[0, 0], axes=1)
+    return [kernel * scale.reshape(1, 1, -1, 1)], bias
+
+def foldable(layer, consumers):
+    """ Whether the output of a convolution only feeds a Batch Normalization (and it has no activation)
+        layer    : the layer
+        consumers: the layers which consume the output of each layer
+    """
+    if not isinstance(layer, (Conv2D, DepthwiseConv2D, SeparableConv2D)):
+        return False
+    if layer.activation is not tf.keras.activations.linear:
+        return False
+    return len(consumers[layer.name]) == 1 and isinstance(consumers[layer.name][0], BatchNormalization)
+
+def relu(layer):
+    """ Get the fused activation equivalent to a ReLU layer (None if not a ReLU)
+        layer: the layer
+    """
+    if isinstance(layer, Activation) and layer.activation is tf.keras.activations.relu:
+        return 'relu'
+    if isinstance(layer, ReLU) and not float(layer.negative_slope) and not float(layer.threshold):
+        if layer.max_value is None:
+            return 'relu'
+        if float(layer.max_value) == 6.0:
+            return tf.nn.relu6
+    return None
+
+def fold_batchnorm(model, fuse_relu=True):
+    """ Fold the Batch Normalization layers of a trained model into the adjacent convolutions
+        model    : the trained (functional) model
+        fuse_relu: whether to fuse the ReLU following a folded convolution into the convolution
+    """
+    layers, consumers, _ = graph(model)
+
+    weights = {}
+    configs = {}
+    skip = set()
+    for layer, inbound in layers:
+        if not isinstance(layer, BatchNormalization) or layer.axis not in ([3], [-1]) or len(inbound) != 1:
+            continue
+        prev = model.get_layer(inbound[0])
+
+        # Conv -> BN: fold into the preceding convolution
+        if foldable(prev, consumers):
+            kernels, bias = weights.get(prev.name, kernel_bias(prev))
+            weights[prev.name] = fold_backward(prev, kernels, bias, layer)
+            config = configs.setdefault(prev.name, prev.get_config())
+            config['use_bias'] = True
+            skip.add(layer.name)
+
+            # Conv -> BN -> ReLU: fuse the activation
+            after = consumers[layer.name]
+            if fuse_relu and len(after) == 1 and after[0] is not None and relu(after[0]):
+                config['activation'] = relu(after[0])
+                skip.add(after[0].name)
+            continue
+
+        # BN -> 1x1 Conv: fold into the following convolution (no padding, so the shift is exact)
+        after = consumers[layer.name]
+        if len(after) == 1 and type(after[0]) is Conv2D and after[0].kernel_size == (1, 1) and after[0].groups == 1:
+            conv = after[0]
+            kernels, bias = weights.get(conv.name, kernel_bias(conv))
+            weights[conv.name] = fold_forward(conv, kernels, bias, layer)
+            configs.setdefault(conv.name, conv.get_config())['use_bias'] = True
+            skip.add(layer.name)
+
+    # Weights are in the layer order: kernel(s) then bias
+    weights = { name: kernels + [bias] for name, (kernels, bias) in weights.items() }
+    return rebuild(model, layers, weights, configs, skip)
+
+def same_padding(size, kernel_size, strides):
+    """ The (before, after) padding of a dimension with padding='same'
+        size       : size of the dimension
+        kernel_size: size of the kernel
+        strides    : stride
+    """
+    out = -(-size // strides)
+    total = max((out - 1) * strides + kernel_size - size, 0)
+    return (total // 2, total - total // 2)
+
+def fold_padding(model):
+    """ Fold the ZeroPadding2D layers which only feed a 'valid' convolution into the convolution,
+        where the explicit padding is the same as the convolution with padding='same'
+        (e.g., ((0, 1), (0, 1)) before a strided 3x3 convolution of even sized feature maps)
+        model: the (functional) model
+    """
+    layers, consumers, _ = graph(model)
+
+    configs = {}
+    skip = set()
+    for layer, inbound in layers:
+        if not isinstance(layer, ZeroPadding2D) or len(consumers[layer.name]) != 1:
+            continue
+        conv = consumers[layer.name][0]
+        if not isinstance(conv, (Conv2D, DepthwiseConv2D, SeparableConv2D)) or conv.padding != 'valid':
+            continue
+        if tuple(conv.dilation_rate) != (1, 1):
+            continue
+        height, width = layer.input.shape[1:3]
+        if height is None or width is None:
+            continue
+        padding = (same_padding(height, conv.kernel_size[0], conv.strides[0]),
+                   same_padding(width,  conv.kernel_size[1], conv.strides[1]))
+        if tuple(map(tuple, layer.padding)) != padding:
+            continue
+        configs.setdefault(conv.name, conv.get_config())['padding'] = 'same'
+        skip.add(layer.name)
+
+    return rebuild(model, layers, configs=configs, skip=skip)
+
+def export(model):
+    """ Export a trained model for inference: fold the zero padding and the batch normalization layers,
+        fuse the ReLU/ReLU6 activations and remove the dropout layers
+        model: the trained (functional) model
+    """
+    layers, _, _ = graph(model)
+    model = rebuild(model, layers, skip=set([layer.name for layer, _ in layers if isinstance(layer, Dropout)]))
+    return fold_batchnorm(fold_padding(model), fuse_relu=True)
+
+def logits(model):
+    """ Get the model whose outputs are the inputs of the final softmax activations (the logits)
+        model: the (functional) model
+    """
+    outputs = []
+    for output in model.outputs:
+        layer = output._keras_history.layer
+        if isinstance(layer, Activation) and layer.get_config()['activation'] == 'softmax':
+            output = layer.input
+        outputs.append(output)
+    return Model(model.inputs, outputs)
+
+def verify(model, folded, x=None, atol=1e-3, rtol=1e-3):
+    """ Verify the logits of the folded model match the logits of the original model, returns the maximum
+        absolute difference
+        The softmax saturates with random weights, so the probabilities can match while the logits differ.
+        model : the original model
+        folded: the folded model
+        x     : input batch (default is a random image)
+        atol  : absolute tolerance
+        rtol  : tolerance relative to the largest logit of the original model
+    """
+    if x is None:
+        x = np.random.rand(1, *model.input_shape[1:]).astype(np.float32)
+    y, y_folded = logits(model)(x, training=False), logits(folded)(x, training=False)
+    if not isinstance(y, (list, tuple)):
+        y, y_folded = [y], [y_folded]
+    error = 0.0
+    for a, b in zip(y, y_folded):
+        a, b = a.numpy().astype(np.float32), b.numpy().astype(np.float32)
+        diff = np.max(np.abs(a - b))
+        if diff > atol + rtol * np.max(np.abs(a)):
+            raise Exception("fold_batchnorm: folded model differs by " + str(diff))
+        error = max(error, diff)
+    return error
+
+def randomize_batchnorm(model):
+    """ Set random moving statistics in the Batch Normalization layers (emulates a trained model)
+        model: the model
+    """
+    for layer in model.layers:
+        if isinstance(layer, BatchNormalization):
+            shape = layer.moving_mean.shape
+            layer.moving_mean.assign(np.random.normal(0, 0.1, shape))
+            layer.moving_variance.assign(np.random.uniform(0.5, 1.5, shape))
+            if layer.scale:
+                layer.gamma.assign(np.random.uniform(0.5, 1.5, shape))
+            if layer.center:
+                layer.beta.assign(np.random.normal(0, 0.1, shape))
+
+if __name__ == '__main__':
+    import os
+    import time
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    from zoo.resnet.resnet_v1_c import ResNetV1
+    from zoo.mobilenet.mobilenet_v2_c import MobileNetV2
+
+    def latency(model, batch_size, steps=10):
+        forward = tf.function(lambda x: model(x, training=False))
+        x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+        forward(x)
+        start = time.perf_counter()
+        for _ in range(steps):
+            forward(x).numpy()
+        return (time.perf_counter() - start) / steps * 1000
+
+    print("%-12s %8s %8s %10s %12s %12s" % ('model', 'layers', 'folded', 'max error', 'batch', 'ms (folded)'))
+    for name, model in [('ResNet50', ResNetV1(50).model), ('MobileNetV2', MobileNetV2().model)]:
+        randomize_batchnorm(model)
+        folded = fold_batchnorm(model)
+        error = verify(model, folded)
+        for batch_size in [1, 8]:
+            print("%-12s %8d %8d %10.2e %12d %6.1f (%.1f)" % (name, len(model.layers), len(folded.layers), error,
+                  batch_size, latency(model, batch_size), latency(folded, batch_size)))
@@ -0,0 +1,84 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Inception v1/v2 - separate vs. fused sibling 1x1 convolutions benchmark
+# Converts the weights to the fused model, checks the outputs match, and reports the CPU latency
+# of the stem and the 9-block learner (without the auxiliary classifiers) and of the whole model
+#
+# Usage (from the root of the repository):
+#   python -m zoo.inception.inception_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Model
+from tensorflow.keras.layers import Concatenate, BatchNormalization
+from zoo.inception.inception_v1_c import InceptionV1
+from zoo.inception.inception_v2_c import InceptionV2
+
+def learner(model):
+    """ The model up to the output of the last inception block """
+    blocks = [layer for layer in model.layers if isinstance(layer, Concatenate)]
+    return Model(model.input, blocks[-1].output)
+
+def latency(model, batch_size, steps=10):
+    """ Median CPU inference latency (seconds) of a batch """
+    forward = tf.function(lambda x: model(x, training=False))
+    x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+    forward(x)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        tf.nest.map_structure(lambda y: y.numpy(), forward(x))
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def benchmark(cls, batch_size, steps=10):
+    """ Compare an Inception model with separate and fused 1x1 convolutions
+        cls       : InceptionV1 or InceptionV2
+        batch_size: number of images per batch
+        steps     : number of timed steps
+    """
+    model = cls().model
+    fused = cls(fused=True).model
+
+    # non-trivial moving statistics, so the conversion of the batch normalization is verified
+    for layer in model.layers:
+        if isinstance(layer, BatchNormalization):
+            layer.moving_mean.assign(np.random.normal(0, 0.1, layer.moving_mean.shape))
+            layer.moving_variance.assign(np.random.uniform(0.5, 1.5, layer.moving_variance.shape))
+    cls.fuse_weights(model, fused)
+
+    x = np.random.rand(1, 224, 224, 3).astype(np.float32)
+    error = max([np.max(np.abs(a.numpy() - b.numpy())) for a, b in zip(model(x, training=False), fused(x, training=False))])
+    features, fused_features = learner(model), learner(fused)
+    error = max(error, np.max(np.abs(features(x).numpy() - fused_features(x).numpy())))
+
+    return { 'layers': (len(model.layers), len(fused.layers)), 'error': float(error),
+             'learner': (latency(features, batch_size, steps), latency(fused_features, batch_size, steps)),
+             'model': (latency(model, batch_size, steps), latency(fused, batch_size, steps)) }
+
+if __name__ == '__main__':
+    print("%-12s %6s %8s %10s %16s %16s %16s %16s" % ('model', 'batch', 'layers', 'error', 'learner (ms)', 'fused (ms)',
+                                                       'model (ms)', 'fused (ms)'))
+    for cls in [InceptionV1, InceptionV2]:
+        for batch_size in [1, 8]:
+            result = benchmark(cls, batch_size)
+            print("%-12s %6d %4d/%-4d %10.2e %16.1f %16.1f %16.1f %16.1f" % (cls.__name__, batch_size,
+                  result['layers'][0], result['layers'][1], result['error'],
+                  result['learner'][0] * 1000, result['learner'][1] * 1000, result['model'][0] * 1000, result['model'][1] * 1000))
+            tf.keras.backend.clear_session()
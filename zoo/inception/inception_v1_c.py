@@ -16,38 +16,44 @@
 # Paper: https://arxiv.org/pdf/1409.4842.pdf
 
 import tensorflow as tf
+import numpy as np
 from tensorflow.keras import Model, Input
 from tensorflow.keras.layers import Conv2D, ReLU, ZeroPadding2D, Flatten, Dropout
-from tensorflow.keras.layers import MaxPooling2D, Dense, Concatenate, AveragePooling2D
+from tensorflow.keras.layers import MaxPooling2D, Dense, Concatenate, AveragePooling2D, Activation, Lambda
+from zoo.precision import policy_scope
 
 class InceptionV1(object):
     """ Construct an Inception Convolutional Neural Network """
     init_weights='glorot_uniform'
     _model = None
 
-    def __init__(self, dropout=0.4, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, dropout=0.4, input_shape=(224, 224, 3), n_classes=1000, fused=False, dtype_policy=None):
         """ Construct an Inception Convolutional Neural Network
-            dropout    : percentage of dropout
-            input_shape: input shape to the neural network
-            n_classes  : number of output classes
+            dropout     : percentage of dropout
+            input_shape : input shape to the neural network
+            n_classes   : number of output classes
+            fused       : whether to fuse the sibling 1x1 convolutions of the inception blocks
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
 	# Meta-parameter: dropout percentage
         dropout = 0.4
 
-	# The input tensor
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input tensor
+            inputs = Input(shape=input_shape)
 
-        # The stem convolutional group
-        x = self.stem(inputs)
+            # The stem convolutional group
+            x = self.stem(inputs)
 
-        # The learner
-        x, aux = self.learner(x, n_classes)
+            # The learner
+            x, aux = self.learner(x, n_classes, fused)
 
-        # The classifier f
-        outputs = self.classifier(x, n_classes, dropout)
+            # The classifier f
+            outputs = self.classifier(x, n_classes, dropout)
 
-        # Instantiate the Model
-        self._model = Model(inputs, [outputs] + aux)
+            # Instantiate the Model
+            self._model = Model(inputs, [outputs] + aux)
 
     @property
     def model(self):
@@ -81,16 +87,18 @@ class InceptionV1(object):
         x = MaxPooling2D((3, 3), strides=(2, 2))(x)
         return x
     
-    def learner(self, x, n_classes):
+    def learner(self, x, n_classes, fused=False):
         """ Construct the Learner
             x        : input to the learner
             n_classes: number of output classes
+            fused    : whether to fuse the sibling 1x1 convolutions of the inception blocks
         """
         aux = [] # Auxiliary Outputs
 
         # Group 3
         x, o = InceptionV1.group(x, [((64,),  (96,128),   (16, 32), (32,)),  # 3a
-                                     ((128,), (128, 192), (32, 96), (64,))]) # 3b
+                                     ((128,), (128, 192), (32, 96), (64,))], # 3b
+                                     fused=fused)
         aux += o
 
         # Group 4
@@ -101,36 +109,39 @@ class InceptionV1(object):
                                      ((112,), (144, 288), (32, 64), (64,)), # 4d
                                      None,                                  # auxiliary classifier
                                      ((256,), (160, 320), (32, 128), (128,))], # 4e
-                                     n_classes=n_classes) 
+                                     n_classes=n_classes, fused=fused)
         aux += o
 
         # Group 5
         x, o = InceptionV1.group(x, [((256,), (160, 320), (32, 128), (128,)), # 5a
                                      ((384,), (192, 384), (48, 128), (128,))],# 5b
-                                     pooling=False) 
+                                     pooling=False, fused=fused)
         aux += o
         return x, aux
 
     @staticmethod
-    def group(x, blocks, pooling=True, n_classes=1000, init_weights=None):
+    def group(x, blocks, pooling=True, n_classes=1000, init_weights=None, fused=False):
         """ Construct an Inception group
             x         : input into the group
             blocks    : filters for each block in the group
             pooling   : whether to end the group with max pooling
             n_classes : number of classes for auxiliary classifier
+            fused     : whether to fuse the sibling 1x1 convolutions of the inception blocks
         """
         if init_weights is None:
             init_weights = InceptionV1.init_weights
 
         aux = [] # Auxiliary Outputs
 
+        inception_block = InceptionV1.fused_inception_block if fused else InceptionV1.inception_block
+
         # Construct the inception blocks (modules)
         for block in blocks:
             # Add auxiliary classifier
             if block is None:
                aux.append(InceptionV1.auxiliary(x, n_classes))
             else:
-                x = InceptionV1.inception_block(x, block[0], block[1], block[2], block[3])           
+                x = inception_block(x, block[0], block[1], block[2], block[3], init_weights)           
 
         if pooling:
             x = ZeroPadding2D(padding=(1, 1))(x)
@@ -173,6 +184,93 @@ class InceptionV1(object):
         x = Concatenate()([b1x1, b3x3, b5x5, bpool])
         return x
 
+    @staticmethod
+    def fused_inception_block(x, f1x1, f3x3, f5x5, fpool, init_weights=None):
+        """ Construct an Inception block (module) with the sibling 1x1 convolutions fused
+            x    : input to the block
+            f1x1 : filters for 1x1 branch
+            f3x3 : filters for 3x3 branch
+            f5x5 : filters for 5x5 branch
+            fpool: filters for pooling branch
+        """
+        if init_weights is None:
+            init_weights = InceptionV1.init_weights
+
+        # 1x1 branch and the 1x1 reductions of the 3x3 and 5x5 branches as one (wider) convolution
+        n1x1, n3x3, n5x5 = f1x1[0], f3x3[0], f5x5[0]
+        x1x1 = Conv2D(n1x1 + n3x3 + n5x5, (1, 1), strides=1, padding='same', activation='relu', kernel_initializer=init_weights)(x)
+
+        # Split the feature maps (channels) into the branches, as one op
+        b1x1, b3x3, b5x5 = Lambda(InceptionV1.split, arguments={'sizes': [n1x1, n3x3, n5x5]})(x1x1)
+
+        # 3x3 branch
+        b3x3 = ZeroPadding2D((1,1))(b3x3)
+        b3x3 = Conv2D(f3x3[1], (3, 3), strides=1, padding='valid', activation='relu', kernel_initializer=init_weights)(b3x3)
+
+        # 5x5 branch
+        b5x5 = ZeroPadding2D((1,1))(b5x5)
+        b5x5 = Conv2D(f5x5[1], (3, 3), strides=1, padding='valid', activation='relu', kernel_initializer=init_weights)(b5x5)
+
+        # Pooling branch
+        bpool = MaxPooling2D((3, 3), strides=1, padding='same')(x)
+        # 1x1 projection
+        bpool = Conv2D(fpool[0], (1, 1), strides=1, padding='same', activation='relu', kernel_initializer=init_weights)(bpool)
+
+        # Concatenate the outputs (filters) of the branches
+        x = Concatenate()([b1x1, b3x3, b5x5, bpool])
+        return x
+
+    @staticmethod
+    def split(x, sizes):
+        """ Split the feature maps (channels) into consecutive groups of sizes
+            The channels are the innermost dimension, so each group is still a copy
+        """
+        return tf.split(x, sizes, axis=-1)
+
+    @staticmethod
+    def fuse_weights(model, fused_model):
+        """ Copy the weights of a model into the same model built with fused 1x1 convolutions (fused=True)
+            model      : model with the separate 1x1 convolutions
+            fused_model: model with the fused 1x1 convolutions
+        """
+        def back(layer, n):
+            # The layer n layers back along the (first) input
+            for _ in range(n):
+                layer = layer.input._keras_history[0]
+            return layer
+
+        # The names of the layers of the inception blocks
+        converted, fused_converted = set(), set()
+        def copy(weights, layer, layers=None):
+            layer.set_weights(weights)
+            fused_converted.add(layer.name)
+            converted.update([l.name for l in layers or []])
+
+        blocks = [layer for layer in model.layers if isinstance(layer, Concatenate)]
+        fused_blocks = [layer for layer in fused_model.layers if isinstance(layer, Concatenate)]
+        if len(blocks) != len(fused_blocks):
+            raise Exception("InceptionV1: models do not match")
+
+        # The (first) layer of each branch feeding the concatenation of each block
+        for block, fused_block in zip(blocks, fused_blocks):
+            b1x1, b3x3, b5x5, bpool = [t._keras_history[0] for t in block.input]
+            f1x1, f3x3, f5x5, fpool = [t._keras_history[0] for t in fused_block.input]
+
+            # the 1x1 branch and the 1x1 reductions are concatenated along the output channels
+            reductions = [b1x1, back(b3x3, 2), back(b5x5, 2)]
+            weights = [np.concatenate(w, axis=-1) for w in zip(*[layer.get_weights() for layer in reductions])]
+            copy(weights, back(f1x1, 1), reductions)
+
+            # the other layers are the same
+            for src, dst in [(b3x3, f3x3), (b5x5, f5x5), (bpool, fpool)]:
+                copy(src.get_weights(), dst, [src])
+
+        # The other layers (stem, auxiliary classifiers and classifier) are the same
+        others = [layer for layer in model.layers if layer.weights and layer.name not in converted]
+        fused_others = [layer for layer in fused_model.layers if layer.weights and layer.name not in fused_converted]
+        for src, dst in zip(others, fused_others):
+            dst.set_weights(src.get_weights())
+
     @staticmethod
     def auxiliary(x, n_classes, init_weights=None):
         """ Construct the auxiliary classier
@@ -187,7 +285,9 @@ class InceptionV1(object):
         x = Flatten()(x)
         x = Dense(1024, activation='relu', kernel_initializer=init_weights)(x)
         x = Dropout(0.7)(x)
-        output = Dense(n_classes, activation='softmax', kernel_initializer=init_weights)(x)
+        output = Dense(n_classes, kernel_initializer=init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        output = Activation('softmax', dtype='float32')(output)
         return output
 
     def classifier(self, x, n_classes, dropout=0.4):
@@ -202,7 +302,9 @@ class InceptionV1(object):
         x = Dropout(dropout)(x)
 
         # Final Dense Outputting Layer for the outputs
-        outputs = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        outputs = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        outputs = Activation('softmax', dtype='float32')(outputs)
         return outputs
 
 # Example
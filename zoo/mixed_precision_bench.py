@@ -0,0 +1,123 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo mixed precision benchmark
+# Trains a CIFAR-10 ResNet (as in resnet/resnet_cifar10.py, built from the composable ResNetV1 groups)
+# in float32 and with a mixed precision policy (bfloat16 compute, float32 variables and softmax)
+# on the CPU, and reports the training throughput and the test accuracy of each policy.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.mixed_precision_bench
+#   python -m zoo.mixed_precision_bench --n 6 --epochs 5 --train-size 50000
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import Conv2D, BatchNormalization, ReLU, GlobalAveragePooling2D, Dense, Activation
+from zoo.resnet.resnet_v1_c import ResNetV1
+from zoo.precision import policy_scope
+
+def resnet_cifar10(n, dtype_policy=None):
+    """ Construct a CIFAR-10 ResNet (depth 9n+2) from the composable ResNetV1 groups
+        n           : number of blocks per group (ResNet20: 2, ResNet56: 6, ResNet110: 12)
+        dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
+    """
+    with policy_scope(dtype_policy):
+        inputs = Input((32, 32, 3))
+
+        # Stem: 3x3 convolution, no pooling
+        x = Conv2D(16, (3, 3), strides=(1, 1), padding='same', use_bias=False, kernel_initializer='he_normal')(inputs)
+        x = BatchNormalization()(x)
+        x = ReLU()(x)
+
+        # Learner: 3 groups of n bottleneck blocks (a projection block and n - 1 identity blocks)
+        x = ResNetV1.group(x, 16, n - 1, strides=(1, 1))
+        x = ResNetV1.group(x, 32, n - 1)
+        x = ResNetV1.group(x, 64, n - 1)
+
+        # Classifier: the softmax is computed in float32
+        x = GlobalAveragePooling2D()(x)
+        x = Dense(10, kernel_initializer='he_normal')(x)
+        outputs = Activation('softmax', dtype='float32')(x)
+        model = Model(inputs, outputs)
+    return model
+
+class Throughput(tf.keras.callbacks.Callback):
+    """ Record the wall time of each training epoch """
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self.start)
+
+def train(dtype_policy, data, n=2, epochs=3, batch_size=128, seed=42):
+    """ Train and evaluate a CIFAR-10 ResNet with a dtype policy
+        dtype_policy: mixed precision policy (e.g., 'float32' or 'mixed_bfloat16')
+        data        : the (x_train, y_train), (x_test, y_test) datasets
+        n           : number of blocks per group
+        epochs      : number of epochs (the first epoch is a warmup for the throughput)
+        batch_size  : batch size
+        seed        : random seed (the same initial weights for each policy)
+    """
+    (x_train, y_train), (x_test, y_test) = data
+    tf.keras.backend.clear_session()
+    tf.random.set_seed(seed)
+    np.random.seed(seed)
+
+    model = resnet_cifar10(n, dtype_policy)
+    model.compile(optimizer=tf.keras.optimizers.SGD(0.05, momentum=0.9), loss='sparse_categorical_crossentropy', metrics=['acc'])
+    throughput = Throughput()
+    model.fit(x_train, y_train, epochs=epochs, batch_size=batch_size, callbacks=[throughput], verbose=0)
+    _, accuracy = model.evaluate(x_test, y_test, batch_size=batch_size, verbose=0)
+
+    times = throughput.times[1:] if len(throughput.times) > 1 else throughput.times
+    return { 'dtype_policy': dtype_policy, 'model': 'ResNet%d' % (9 * n + 2), 'epochs': epochs,
+             'images_per_sec': len(x_train) / float(np.median(times)), 'test_acc': float(accuracy),
+             'output_dtype': model.output.dtype.name }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model Zoo mixed precision benchmark')
+    parser.add_argument('--policies', nargs='+', default=['float32', 'mixed_bfloat16'], help='dtype policies')
+    parser.add_argument('--n', type=int, default=2, help='blocks per group (depth is 9n+2)')
+    parser.add_argument('--epochs', type=int, default=3, help='number of epochs')
+    parser.add_argument('--batch-size', type=int, default=128, help='batch size')
+    parser.add_argument('--train-size', type=int, default=10000, help='number of training images')
+    parser.add_argument('--output', help='JSON file for the results')
+    args = parser.parse_args()
+
+    (x_train, y_train), (x_test, y_test) = tf.keras.datasets.cifar10.load_data()
+    x_train = (x_train[:args.train_size] / 255.0).astype(np.float32)
+    y_train = y_train[:args.train_size]
+    x_test  = (x_test / 255.0).astype(np.float32)
+    data = (x_train, y_train), (x_test, y_test)
+
+    results = [train(policy, data, args.n, args.epochs, args.batch_size) for policy in args.policies]
+
+    print("%-16s %-10s %14s %10s %10s %10s" % ('policy', 'model', 'images/sec', 'speedup', 'test acc', 'delta'))
+    for result in results:
+        print("%-16s %-10s %14.1f %9.2fx %10.4f %+10.4f" % (result['dtype_policy'], result['model'], result['images_per_sec'],
+              result['images_per_sec'] / results[0]['images_per_sec'], result['test_acc'], result['test_acc'] - results[0]['test_acc']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
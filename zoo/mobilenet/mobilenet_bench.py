@@ -0,0 +1,61 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# MobileNet v1.0 - export pass benchmark
+# Exports MobileNetV1 for each width multiplier (alpha): the explicit zero padding is folded into the
+# strided convolutions, the batch normalization layers are folded and the ReLU6 fused, so there
+# is one op per convolution. Reports the number of layers and ops and the CPU latency before/after.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.mobilenet.mobilenet_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import numpy as np
+import tensorflow as tf
+from zoo.fold import export, verify, randomize_batchnorm
+from zoo.mobilenet.mobilenet_v1_c import MobileNetV1
+
+def n_ops(model, batch_size=1):
+    """ Number of ops in the traced inference graph """
+    forward = tf.function(lambda x: model(x, training=False))
+    graph = forward.get_concrete_function(tf.TensorSpec((batch_size,) + tuple(model.input_shape[1:]), tf.float32)).graph
+    return len(graph.get_operations())
+
+def latency(model, batch_size, steps=20):
+    """ Median CPU inference latency (seconds) of a batch """
+    forward = tf.function(lambda x: model(x, training=False))
+    x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+    forward(x)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        forward(x).numpy()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+if __name__ == '__main__':
+    print("%-6s %14s %12s %10s %6s %10s %12s %8s" % ('alpha', 'layers', 'ops', 'max error', 'batch', 'ms', 'exported', 'change'))
+    for alpha in [0.25, 0.5, 0.75, 1.0]:
+        model = MobileNetV1(alpha=alpha).model
+        randomize_batchnorm(model)
+        exported = export(model)
+        error = verify(model, exported)
+        for batch_size in [1, 8]:
+            t, t_exported = latency(model, batch_size), latency(exported, batch_size)
+            print("%-6s %6d => %-4d %5d => %-4d %10.2e %6d %10.2f %12.2f %7.1f%%" % (alpha, len(model.layers), len(exported.layers),
+                  n_ops(model), n_ops(exported), error, batch_size, t * 1000, t_exported * 1000, (t_exported / t - 1) * 100))
+        tf.keras.backend.clear_session()
@@ -20,7 +20,8 @@
 import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import ZeroPadding2D, Conv2D, BatchNormalization, ReLU
-from tensorflow.keras.layers import DepthwiseConv2D, GlobalAveragePooling2D, Reshape, Dropout
+from tensorflow.keras.layers import DepthwiseConv2D, GlobalAveragePooling2D, Reshape, Dropout, Activation
+from zoo.precision import policy_scope
 
 class MobileNetV1(object):
     """ Construct a Mobile Convolution Neural Network """
@@ -33,12 +34,13 @@ class MobileNetV1(object):
     init_weights='glorot_uniform'
     _model = None
 
-    def __init__(self, alpha=1, pho=1, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, alpha=1, pho=1, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000, dtype_policy=None):
         """ Construct a Mobile Convolution Neural Network
-            alpha      : width multipler
-            pho        :
-            input_shape: the input shape
-            n_classes  : number of output classes
+            alpha       : width multipler
+            pho         :
+            input_shape : the input shape
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if alpha < 0 or alpha > 1:
             raise Exception("MobileNet: alpha out of range")
@@ -47,19 +49,21 @@ class MobileNetV1(object):
         if dropout < 0 or dropout > 1:
             raise Exception("MobileNet: alpha out of range")
         
-        inputs = Input(shape=(int(input_shape[0] * pho), int(input_shape[1] * pho), 3))
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            inputs = Input(shape=(int(input_shape[0] * pho), int(input_shape[1] * pho), 3))
 
-        # The Stem Group
-        x = self.stem(inputs, alpha)    
+            # The Stem Group
+            x = self.stem(inputs, alpha)    
 
-        # The Learner
-        x = self.learner(x, alpha)
+            # The Learner
+            x = self.learner(x, alpha)
 
-        # The classifier 
-        outputs = self.classifier(x, alpha, dropout, n_classes)
+            # The classifier 
+            outputs = self.classifier(x, alpha, dropout, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -167,9 +171,11 @@ class MobileNetV1(object):
         x = Dropout(dropout)(x)
 
         # Use convolution for classifying (emulates a fully connected layer)
-        x = Conv2D(n_classes, (1, 1), padding='same', activation='softmax', kernel_initializer=self.init_weights)(x)
+        x = Conv2D(n_classes, (1, 1), padding='same', kernel_initializer=self.init_weights)(x)
         # Reshape the resulting output to 1D vector of number of classes
         x = Reshape((n_classes, ))(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        x = Activation('softmax', dtype='float32')(x)
         return x
 
 # Example
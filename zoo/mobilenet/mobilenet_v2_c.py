@@ -20,7 +20,8 @@
 import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import ZeroPadding2D, Conv2D, BatchNormalization, ReLU
-from tensorflow.keras.layers import DepthwiseConv2D, Add, GlobalAveragePooling2D, Dense
+from tensorflow.keras.layers import DepthwiseConv2D, Add, GlobalAveragePooling2D, Dense, Activation
+from zoo.precision import policy_scope
 
 class MobileNetV2(object):
     """ Construct a Mobile Convolution Neural Network """
@@ -31,26 +32,29 @@ class MobileNetV2(object):
     init_weights = 'glorot_uniform'
     _model = None
 
-    def __init__(self, alpha=1, expansion=6, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, alpha=1, expansion=6, input_shape=(224, 224, 3), n_classes=1000, dtype_policy=None):
         """ Construct a Mobile Convolution Neural Network
-            alpha      : width multiplier
-            expansion  : multiplier to expand the number of filters
-            input_shape: the input shape
-            n_classes  : number of output classes
+            alpha       : width multiplier
+            expansion   : multiplier to expand the number of filters
+            input_shape : the input shape
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
-        inputs = Input(shape=(224, 224, 3))
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            inputs = Input(shape=input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs, alpha)    
+            # The Stem Group
+            x = self.stem(inputs, alpha)    
 
-        # The Learner
-        x = self.learner(x, alpha, expansion)
+            # The Learner
+            x = self.learner(x, alpha, expansion)
 
-        # The classifier 
-        outputs = self.classifier(x, n_classes)
+            # The classifier 
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -185,7 +189,9 @@ class MobileNetV2(object):
         x = GlobalAveragePooling2D()(x)
 
         # Dense layer for final classification
-        x = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        x = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        x = Activation('softmax', dtype='float32')(x)
         return x
 
 # Example
@@ -0,0 +1,36 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Mixed precision of the composable models
+# The layers of a model are built under the dtype policy of the model (e.g., 'mixed_bfloat16': bfloat16
+# compute with float32 variables), then the global Keras policy is restored.
+
+import contextlib
+import tensorflow as tf
+
+@contextlib.contextmanager
+def policy_scope(dtype_policy=None):
+    """ Build the layers in the scope with a dtype policy, and restore the global policy on exit (also on an error)
+        dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), None keeps the global policy
+    """
+    if dtype_policy is None:
+        yield
+        return
+
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy(dtype_policy)
+    try:
+        yield
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
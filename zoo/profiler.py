@@ -0,0 +1,251 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo analytic profiler
+# Attributes the parameters, multiply-accumulates (MACs) and activation memory of a composable
+# model to its stem, learner, groups, blocks and classifier, without training or running the model.
+#
+# The stem/learner/group/block/classifier methods of the composable class are instrumented while
+# the model is built. A scope is the layers between the inputs and outputs of the call, so the
+# costs of a group include the costs of its blocks.
+#
+#   params         : number of weights
+#   macs           : multiply-accumulates of a forward pass (convolutions and dense layers)
+#   forward_bytes  : peak inference activation memory (largest input + output of a layer, which are freed as we go)
+#   training_bytes : activation memory kept for the backward pass (the output of every layer)
+#
+# Usage (from the root of the repository):
+#   python -m zoo.profiler DenseNet121 --depth 2
+#   python -m zoo.profiler MobileNetV1 --sweep alpha 0.25 0.5 0.75 1.0 --max-macs 300e6
+
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Conv2D, DepthwiseConv2D, SeparableConv2D, Dense, InputLayer
+from zoo.bench import models, load
+from zoo.fold import graph
+
+# The methods of a composable class which construct a scope
+SCOPES = ('stem', 'learner', 'classifier', 'group', 'auxiliary')
+
+def is_scope(name):
+    """ Whether a method of a composable class constructs a stem, learner, group, block or classifier
+        name: name of the method
+    """
+    return not name.startswith('_') and (name in SCOPES or name.endswith('block') or name.endswith('Flow'))
+
+def tensors(value):
+    """ Flatten the (nested) outputs of a method into a list of tensors """
+    if isinstance(value, (list, tuple)):
+        return [t for v in value for t in tensors(v)]
+    return [value] if hasattr(value, '_keras_history') else []
+
+def record(cls, *args, **kwargs):
+    """ Build a composable model, recording the calls to its scope methods
+        cls: the composable class
+        args, kwargs: arguments of the composable class
+    """
+    calls = []
+    stack = []
+    counters = {}
+
+    def instrument(name, fn, static):
+        def wrapper(*a, **kw):
+            x = a[0] if static else a[1]
+            parent = stack[-1] if stack else ''
+            counters[(parent, name)] = counters.get((parent, name), 0) + 1
+            path = name
+            if name not in ('stem', 'learner', 'classifier'):
+                path += str(counters[(parent, name)])
+            path = parent + '/' + path if parent else path
+
+            # Calls are kept in construction order (a scope before its sub-scopes)
+            index = len(calls)
+            calls.append(None)
+            stack.append(path)
+            try:
+                outputs = fn(*a, **kw)
+            finally:
+                stack.pop()
+            calls[index] = (path, [t._keras_history[0].name for t in tensors(x)],
+                                  [t._keras_history[0].name for t in tensors(outputs)])
+            return outputs
+        return staticmethod(wrapper) if static else wrapper
+
+    # Instrument the scope methods of the class, and restore them after the model is built
+    originals = { name: attr for name, attr in vars(cls).items() if is_scope(name) and callable(getattr(cls, name)) }
+    for name, attr in originals.items():
+        setattr(cls, name, instrument(name, getattr(cls, name), isinstance(attr, staticmethod)))
+    try:
+        model = cls(*args, **kwargs).model
+    finally:
+        for name, attr in originals.items():
+            setattr(cls, name, attr)
+    return model, [call for call in calls if call is not None]
+
+def nbytes(shape, dtype):
+    """ Number of bytes of a tensor of one example
+        shape: shape of the tensor (including the batch dimension)
+        dtype: data type
+    """
+    return int(np.prod([d for d in shape[1:]])) * tf.as_dtype(dtype).size
+
+def layer_cost(layer):
+    """ The parameters, MACs and activation bytes of a layer (for one example)
+        layer: the layer
+    """
+    inputs = layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+    out = layer.output.shape
+    in_bytes = sum([nbytes(t.shape, t.dtype) for t in inputs])
+    out_bytes = nbytes(out, layer.output.dtype)
+
+    macs = 0
+    if isinstance(layer, DepthwiseConv2D):
+        kh, kw = layer.kernel_size
+        macs = out[1] * out[2] * out[3] * kh * kw
+    elif isinstance(layer, SeparableConv2D):
+        kh, kw = layer.kernel_size
+        channels = inputs[0].shape[-1] * layer.depth_multiplier
+        macs = out[1] * out[2] * channels * (kh * kw + out[3])
+    elif isinstance(layer, Conv2D):
+        kh, kw = layer.kernel_size
+        macs = out[1] * out[2] * out[3] * kh * kw * inputs[0].shape[-1] // getattr(layer, 'groups', 1)
+    elif isinstance(layer, Dense):
+        macs = int(np.prod(out[1:])) * inputs[0].shape[-1]
+    elif getattr(layer, 'kernel', None) is not None and len(out) == 4:
+        # Other (custom) pointwise layers with a kernel, e.g., PointwiseGroupConv: one MAC per weight per pixel
+        macs = out[1] * out[2] * int(np.prod(layer.kernel.shape))
+
+    return { 'params': int(layer.count_params()), 'macs': int(macs),
+             'forward_bytes': in_bytes + out_bytes, 'training_bytes': out_bytes }
+
+def profile_model(cls, *args, **kwargs):
+    """ Profile a composable model by stem/learner/group/block/classifier
+        cls: the composable class
+        args, kwargs: arguments of the composable class
+    """
+    model, calls = record(cls, *args, **kwargs)
+    layers, _, _ = graph(model)
+    inbound = { layer.name: names for layer, names in layers }
+
+    # The layers of each scope: from the outputs back to (but excluding) the inputs of the call
+    members = {}
+    for path, inputs, outputs in calls:
+        scope, stack = set(), list(outputs)
+        while stack:
+            name = stack.pop()
+            if name in scope or name in inputs:
+                continue
+            scope.add(name)
+            stack.extend(inbound[name])
+        members[path] = scope
+
+    costs = { layer.name: layer_cost(layer) for layer, _ in layers if not isinstance(layer, InputLayer) }
+    report = { 'total': total(costs.values()), 'scopes': [] }
+    for path, _, _ in calls:
+        scope = [costs[name] for name in members[path] if name in costs]
+        report['scopes'].append(dict(scope=path, depth=path.count('/'), layers=len(scope), **total(scope)))
+    return report
+
+def total(costs):
+    """ Aggregate the costs of a set of layers """
+    costs = list(costs)
+    return { 'params': sum([c['params'] for c in costs]),
+             'macs': sum([c['macs'] for c in costs]),
+             'forward_bytes': max([c['forward_bytes'] for c in costs] + [0]),
+             'training_bytes': sum([c['training_bytes'] for c in costs]) }
+
+def profile(name, input_shape=(224, 224, 3), **kwargs):
+    """ Profile a model in the zoo (see zoo.bench.models)
+        name       : name of the model
+        input_shape: the input shape
+        kwargs     : meta-parameters of the composable class (e.g., alpha=0.5)
+    """
+    _, _, args = models[name]
+    return profile_model(load(name), *args, input_shape=input_shape, **kwargs)
+
+def within_budget(report, batch_size=1, max_params=None, max_macs=None, max_training_bytes=None):
+    """ Whether a profiled model is within a budget
+        report            : the profile of the model
+        batch_size        : batch size for the activation memory
+        max_params        : maximum number of parameters
+        max_macs          : maximum number of MACs per example
+        max_training_bytes: maximum activation memory for training a batch
+    """
+    cost = report['total']
+    if max_params is not None and cost['params'] > max_params:
+        return False
+    if max_macs is not None and cost['macs'] > max_macs:
+        return False
+    if max_training_bytes is not None and cost['training_bytes'] * batch_size > max_training_bytes:
+        return False
+    return True
+
+def sweep(name, param, values, input_shape=(224, 224, 3), batch_size=1, **budget):
+    """ Profile a model in the zoo for each value of a meta-parameter, and check it against a budget
+        name       : name of the model
+        param      : name of the meta-parameter (e.g., 'alpha', 'reduction', 'cardinality')
+        values     : values of the meta-parameter
+        input_shape: the input shape
+        batch_size : batch size for the activation memory
+        budget     : max_params, max_macs and/or max_training_bytes
+    """
+    results = []
+    for value in values:
+        report = profile(name, input_shape, **{param: value})
+        results.append(dict(value=value, fits=within_budget(report, batch_size, **budget), **report['total']))
+        tf.keras.backend.clear_session()
+    return results
+
+def display(rows, batch_size=1, max_depth=None):
+    """ Print the scopes of a profile as a table """
+    print("%-44s %8s %12s %10s %14s %14s" % ('scope', 'layers', 'params', 'MMACs', 'forward (MB)', 'training (MB)'))
+    for row in rows:
+        if max_depth is not None and row.get('depth', 0) > max_depth:
+            continue
+        label = '  ' * row.get('depth', 0) + str(row.get('scope', row.get('value')))
+        print("%-44s %8s %12d %10.1f %14.2f %14.2f" % (label[:44], row.get('layers', ''), row['params'], row['macs'] / 1e6,
+              row['forward_bytes'] * batch_size / 2**20, row['training_bytes'] * batch_size / 2**20))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model Zoo analytic profiler')
+    parser.add_argument('model', choices=list(models), help='model to profile')
+    parser.add_argument('--size', type=int, default=224, help='input height/width')
+    parser.add_argument('--batch-size', type=int, default=1, help='batch size for the activation memory')
+    parser.add_argument('--depth', type=int, default=None, help='maximum scope depth to display')
+    parser.add_argument('--sweep', nargs='+', metavar=('PARAM', 'VALUE'), help='meta-parameter and values to sweep')
+    parser.add_argument('--max-params', type=float, help='budget: maximum number of parameters')
+    parser.add_argument('--max-macs', type=float, help='budget: maximum MACs per example')
+    parser.add_argument('--max-training-mb', type=float, help='budget: maximum training activation memory (MB) per batch')
+    parser.add_argument('--json', action='store_true', help='output JSON')
+    args = parser.parse_args()
+
+    input_shape = (args.size, args.size, 3)
+    if args.sweep:
+        param, values = args.sweep[0], [json.loads(v) for v in args.sweep[1:]]
+        budget = { 'max_params': args.max_params, 'max_macs': args.max_macs,
+                   'max_training_bytes': args.max_training_mb * 2**20 if args.max_training_mb else None }
+        rows = sweep(args.model, param, values, input_shape, args.batch_size, **budget)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            display([dict(row, value='%s=%s%s' % (param, row['value'], '' if row['fits'] else ' (over budget)')) for row in rows],
+                    args.batch_size)
+    else:
+        report = profile(args.model, input_shape)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            display(report['scopes'] + [dict(scope='total', **report['total'])], args.batch_size, args.depth)
@@ -0,0 +1,308 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo structured channel pruning
+# Prunes the channels of the groups of a (trained) composable residual model (ResNetV1, ResNetV1_5, ResNeXt).
+#
+# The thinner model is built with the same composable stem, group/block builders and classifier, with the
+# number of filters of each group reduced. The channels kept are scored by the magnitude of the gamma of
+# the batch normalization following each convolution:
+#   - inside a block: the channels of the reduction and bottleneck (or cardinality) convolutions, per block,
+#     and for ResNeXt the same number of channels in each group of the group convolution
+#   - the residual channels: the channels added together through the identity links of a group are kept
+#     (or pruned) together, scored by the sum of the gammas of the batch normalizations feeding the adds
+# The surviving weights are copied into the thinner model, which is then fine-tuned.
+#
+# The pre-activation ResNetV2 (batch normalization before the convolutions) and models built with
+# checkpoint_groups=True are not supported.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.prune ResNet50 --ratios 0.25 0.5 --epochs 3 --fine-tune-epochs 1 --train-size 10000
+
+import os
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import Conv2D, Dense, BatchNormalization, Add, ReLU, Activation, Concatenate, Lambda, InputLayer
+from tensorflow.keras.layers import ZeroPadding2D, MaxPooling2D, GlobalAveragePooling2D
+from zoo.fold import graph
+
+# The models in the zoo (see zoo.bench.models) which can be pruned
+PRUNABLE = ['ResNet50', 'ResNet101', 'ResNet152', 'ResNet50_v1.5', 'ResNeXt50']
+
+# The layers which keep the channels of their input
+CHANNEL_WISE = (BatchNormalization, ReLU, Activation, ZeroPadding2D, MaxPooling2D, GlobalAveragePooling2D)
+
+def thin_groups(groups, ratio=0.5, cardinality=1):
+    """ The groups of the thinner model
+        groups     : the groups of the model: (n_filters, n_blocks) or, for ResNeXt, (filters_in, filters_out, n_blocks)
+        ratio      : fraction of the filters pruned in each group, or a list of fractions (one per group)
+        cardinality: width of the group convolution (the filters inside a ResNeXt block are a multiple of it)
+    """
+    if not isinstance(ratio, (list, tuple)):
+        ratio = [ratio] * len(groups)
+    if len(ratio) != len(groups):
+        raise Exception("prune: one ratio per group")
+
+    thin = []
+    for group, r in zip(groups, ratio):
+        if len(group) == 2:
+            n_filters, n_blocks = group
+            thin.append((max(1, int(round(n_filters * (1 - r)))), n_blocks))
+        else:
+            filters_in, filters_out, n_blocks = group
+            filters_in = max(cardinality, int(round(filters_in * (1 - r) / cardinality)) * cardinality)
+            thin.append((filters_in, max(1, int(round(filters_out * (1 - r)))), n_blocks))
+    return thin
+
+def build(cls, groups, input_shape=(224, 224, 3), n_classes=1000, **kwargs):
+    """ Build a composable residual model with the given groups
+        cls        : the composable class
+        groups     : the groups of the learner
+        input_shape: the input shape
+        n_classes  : number of output classes
+        kwargs     : arguments of the learner (e.g., cardinality and group_impl for ResNeXt)
+    """
+    # The same stem, learner and classifier as the constructor, but not restricted to the groups of n_layers
+    composable = cls.__new__(cls)
+    inputs = Input(input_shape)
+    x = composable.stem(inputs)
+    x = composable.learner(x, list(groups), **kwargs)
+    outputs = composable.classifier(x, n_classes)
+    return Model(inputs, outputs)
+
+def residual_channels(layers):
+    """ The sets of batch normalizations whose outputs are added together (a group), by layer name
+        layers: the layers in topological order with their inbound layers (see graph())
+    """
+    # Union the adds with their inputs, and the ReLU following an add (the identity link of the next block)
+    parent = {}
+    def find(name):
+        while parent.get(name, name) != name:
+            name = parent[name]
+        return name
+
+    by_name = { layer.name: layer for layer, _ in layers }
+    for layer, inbound in layers:
+        if isinstance(layer, Add) or (isinstance(layer, ReLU) and isinstance(by_name[inbound[0]], Add)):
+            for name in inbound:
+                parent[find(name)] = find(layer.name)
+
+    members = {}
+    for layer, _ in layers:
+        if isinstance(layer, BatchNormalization) and layer.name in parent:
+            members.setdefault(find(layer.name), []).append(layer)
+    return { bn.name: bns for bns in members.values() for bn in bns }
+
+def top_channels(scores, n_channels, chunks=1):
+    """ The (sorted) indices of the channels with the largest scores
+        scores    : the score of each channel
+        n_channels: number of channels kept
+        chunks    : number of equal chunks of channels (e.g., groups of a group convolution) which keep the same number of channels
+    """
+    size, n = len(scores) // chunks, n_channels // chunks
+    keep = [i * size + np.argsort(-scores[i * size:(i + 1) * size], kind='stable')[:n] for i in range(chunks)]
+    return np.sort(np.concatenate(keep))
+
+def select_channels(model, thin_model, cardinality=1):
+    """ Choose the channels of the model kept in the thinner model
+        model      : the (trained) model
+        thin_model : the thinner model (built by the same composable class)
+        cardinality: width of the group convolution
+    Returns the indices of the output channels kept for each layer of the model
+    """
+    layers, _, _ = graph(model)
+    thin_layers, _, _ = graph(thin_model)
+    if len(layers) != len(thin_layers):
+        raise Exception("prune: the models do not match")
+    residual = residual_channels(layers)
+    by_name = { layer.name: layer for layer, _ in layers }
+    inbound_names = { layer.name: inbound for layer, inbound in layers }
+
+    # The channels kept by each batch normalization: the number of channels of the thinner model
+    required = {}
+    for (layer, inbound), (thin, _) in zip(layers, thin_layers):
+        if layer.__class__ != thin.__class__:
+            raise Exception("prune: the models do not match")
+        if not isinstance(layer, BatchNormalization):
+            continue
+        n_channels = thin.output.shape[-1]
+        if layer.name in residual:
+            scores = np.sum([np.abs(bn.get_weights()[0]) for bn in residual[layer.name]], axis=0)
+            keep = top_channels(scores, n_channels)
+        else:
+            # Inside a ResNeXt block, each group of the group convolution keeps the same number of channels
+            keep = top_channels(np.abs(layer.get_weights()[0]), n_channels, cardinality)
+
+        # The layer before the batch normalization outputs the same channels
+        producer = by_name[inbound[0]]
+        if isinstance(producer, Concatenate):
+            offset = 0
+            for name in inbound_names[producer.name]:
+                width = by_name[name].output.shape[-1]
+                required[name] = keep[(keep >= offset) & (keep < offset + width)] - offset
+                offset += width
+        else:
+            required[producer.name] = keep
+
+    # Propagate the channels kept from the inputs to the outputs
+    channels = {}
+    for layer, inbound in layers:
+        width = layer.output.shape[-1]
+        inputs = [channels[name] for name in inbound]
+        if isinstance(layer, InputLayer):
+            channels[layer.name] = np.arange(width)
+        elif isinstance(layer, (Conv2D, Dense)):
+            channels[layer.name] = required.get(layer.name, np.arange(width))
+        elif isinstance(layer, Concatenate):
+            offsets = np.cumsum([0] + [by_name[name].output.shape[-1] for name in inbound])
+            channels[layer.name] = np.concatenate([keep + offset for keep, offset in zip(inputs, offsets)])
+        elif isinstance(layer, Lambda):
+            # The slice of a group of a (split) group convolution
+            if 'i' not in layer.arguments:
+                raise Exception("prune: unsupported Lambda layer " + layer.name)
+            begin = layer.arguments['i'] * width
+            channels[layer.name] = inputs[0][(inputs[0] >= begin) & (inputs[0] < begin + width)] - begin
+        elif isinstance(layer, Add):
+            if any([not np.array_equal(inputs[0], keep) for keep in inputs[1:]]):
+                raise Exception("prune: the residual channels do not match at " + layer.name)
+            channels[layer.name] = inputs[0]
+        elif isinstance(layer, CHANNEL_WISE):
+            channels[layer.name] = inputs[0]
+        else:
+            raise Exception("prune: unsupported layer " + layer.name)
+    return channels
+
+def slice_weights(layer, in_channels, out_channels):
+    """ The weights of the channels kept of a layer
+        layer       : the layer
+        in_channels : indices of the input channels kept
+        out_channels: indices of the output channels kept
+    """
+    weights = layer.get_weights()
+    if isinstance(layer, BatchNormalization):
+        return [w[out_channels] for w in weights]
+    if isinstance(layer, Conv2D):
+        kernel = weights[0]
+        groups = getattr(layer, 'groups', 1)
+        if groups > 1:
+            # The kernel of a group convolution is (kh, kw, C_in / groups, C_out), ordered by group
+            per_in, per_out = kernel.shape[2], kernel.shape[3] // groups
+            kernels = []
+            for g in range(groups):
+                local_in = in_channels[(in_channels >= g * per_in) & (in_channels < (g + 1) * per_in)] - g * per_in
+                local_out = out_channels[(out_channels >= g * per_out) & (out_channels < (g + 1) * per_out)]
+                kernels.append(kernel[:, :, local_in][..., local_out])
+            kernel = np.concatenate(kernels, axis=-1)
+        else:
+            kernel = kernel[:, :, in_channels][..., out_channels]
+        return [kernel] + [bias[out_channels] for bias in weights[1:]]
+    if isinstance(layer, Dense):
+        return [weights[0][in_channels][:, out_channels]] + [bias[out_channels] for bias in weights[1:]]
+    return weights
+
+def transfer(model, thin_model, cardinality=1):
+    """ Copy the weights of the channels kept of a model into the thinner model
+        model      : the (trained) model
+        thin_model : the thinner model (built by the same composable class)
+        cardinality: width of the group convolution
+    """
+    channels = select_channels(model, thin_model, cardinality)
+    layers, _, _ = graph(model)
+    thin_layers, _, _ = graph(thin_model)
+    for (layer, inbound), (thin, _) in zip(layers, thin_layers):
+        if not layer.weights:
+            continue
+        weights = slice_weights(layer, channels[inbound[0]], channels[layer.name])
+        if [w.shape for w in weights] != [w.shape for w in thin.get_weights()]:
+            raise Exception("prune: the weights of %s do not match" % layer.name)
+        thin.set_weights(weights)
+    return thin_model
+
+def prune(model, cls, groups, ratio=0.5, **kwargs):
+    """ Prune the channels of the groups of a composable residual model
+        model : the (trained) model, built by the composable class
+        cls   : the composable class (ResNetV1, ResNetV1_5 or ResNeXt)
+        groups: the groups of the model (e.g., ResNetV1.groups[50])
+        ratio : fraction of the filters pruned in each group, or a list of fractions (one per group)
+        kwargs: arguments of the learner (e.g., cardinality and group_impl for ResNeXt)
+    Returns the pruned model (the weights of the channels kept) and its groups
+    """
+    cardinality = kwargs.get('cardinality', getattr(cls, 'cardinality', 1))
+    pruned_groups = thin_groups(groups, ratio, cardinality)
+    thin_model = build(cls, pruned_groups, model.input_shape[1:], model.output_shape[-1], **kwargs)
+    return transfer(model, thin_model, cardinality), pruned_groups
+
+def cost(model, steps=10):
+    """ The parameters, FLOPs and CPU latency (batch of 1) of a model """
+    from zoo.bench import flops, latency
+    return { 'params': int(model.count_params()), 'flops': int(flops(model)), 'latency_ms': latency(model, 1, steps) * 1000 }
+
+def compile_model(model, learning_rate=0.05):
+    """ Compile a model for (fine-)tuning """
+    model.compile(optimizer=tf.keras.optimizers.SGD(learning_rate, momentum=0.9), loss='sparse_categorical_crossentropy', metrics=['acc'])
+    return model
+
+if __name__ == '__main__':
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    from zoo.bench import models, load
+
+    parser = argparse.ArgumentParser(description='Model Zoo structured channel pruning')
+    parser.add_argument('model', choices=PRUNABLE, help='model to prune')
+    parser.add_argument('--ratios', nargs='+', type=float, default=[0.25, 0.5], help='fractions of the filters pruned')
+    parser.add_argument('--epochs', type=int, default=3, help='epochs of training of the model (CIFAR-10)')
+    parser.add_argument('--fine-tune-epochs', type=int, default=1, help='epochs of fine-tuning of the pruned model')
+    parser.add_argument('--batch-size', type=int, default=64, help='batch size')
+    parser.add_argument('--train-size', type=int, default=10000, help='number of training images')
+    parser.add_argument('--size', type=int, default=224, help='input height/width for the FLOPs and latency')
+    parser.add_argument('--output', help='JSON file for the results')
+    args = parser.parse_args()
+
+    (x_train, y_train), (x_test, y_test) = tf.keras.datasets.cifar10.load_data()
+    x_train = (x_train[:args.train_size] / 255.0).astype(np.float32)
+    y_train = y_train[:args.train_size]
+    x_test  = (x_test / 255.0).astype(np.float32)
+
+    cls = load(args.model)
+    _, _, (n_layers,) = models[args.model]
+    groups = cls.groups[n_layers]
+
+    # Train the model on CIFAR-10 (the FLOPs and latency are of the same architecture at --size)
+    model = compile_model(build(cls, groups, (32, 32, 3), 10))
+    model.fit(x_train, y_train, epochs=args.epochs, batch_size=args.batch_size, verbose=0)
+    _, accuracy = model.evaluate(x_test, y_test, batch_size=args.batch_size, verbose=0)
+    baseline = dict(ratio=0.0, test_acc=float(accuracy), pruned_acc=float(accuracy),
+                    **cost(build(cls, groups, (args.size, args.size, 3))))
+
+    results = [baseline]
+    for ratio in args.ratios:
+        pruned, pruned_groups = prune(model, cls, groups, ratio)
+        _, pruned_acc = compile_model(pruned).evaluate(x_test, y_test, batch_size=args.batch_size, verbose=0)
+        pruned.fit(x_train, y_train, epochs=args.fine_tune_epochs, batch_size=args.batch_size, verbose=0)
+        _, accuracy = pruned.evaluate(x_test, y_test, batch_size=args.batch_size, verbose=0)
+        results.append(dict(ratio=ratio, groups=pruned_groups, test_acc=float(accuracy), pruned_acc=float(pruned_acc),
+                            **cost(build(cls, pruned_groups, (args.size, args.size, 3)))))
+
+    print("%-8s %12s %10s %8s %12s %8s %12s %10s" % ('ratio', 'params', 'GFLOPs', 'saved', 'latency (ms)', 'saved',
+                                                     'pruned acc', 'tuned acc'))
+    for result in results:
+        print("%-8.2f %12d %10.2f %7.1f%% %12.1f %7.1f%% %12.4f %10.4f" % (result['ratio'], result['params'], result['flops'] / 1e9,
+              100 * (1 - result['flops'] / baseline['flops']), result['latency_ms'],
+              100 * (1 - result['latency_ms'] / baseline['latency_ms']), result['pruned_acc'], result['test_acc']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,230 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Model Zoo post-training int8 quantization
+# Converts a (trained) composable model into an int8 TFLite model, calibrated on a stream of
+# representative images (read one at a time, never loaded into memory as a whole), and reports
+# the accuracy delta, model size and CPU latency of the int8 model versus float32.
+#
+# The model is converted from a traced concrete function of the inference pass, so the Lambda
+# layers (e.g., the group slices of ShuffleNet and ResNeXt) and custom layers are converted as
+# the TensorFlow ops they run; no (de)serialization of the Lambda functions is needed.
+#
+# Usage (from the root of the repository):
+#   python -m zoo.quantize MobileNetV2 --calibration images/ --steps 200
+#   python -m zoo.quantize ShuffleNet --calibration images/ --eval validation/ --output shufflenet_int8.tflite
+
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Model
+
+# The image file extensions of a directory of images
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+def directory_images(directory, input_shape=(224, 224, 3), scale=1 / 255.0, limit=None, labels=False):
+    """ Stream the images of a directory (one at a time), resized to the input shape
+        directory  : the directory of images, or of class subdirectories when labels=True
+        input_shape: the input shape of the model
+        scale      : scaling of the pixel values
+        limit      : maximum number of images
+        labels     : whether to yield (image, label), where the label is the index of the sorted subdirectory
+    """
+    if labels:
+        classes = sorted([d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))])
+        per_class = [[(os.path.join(directory, c, f), label) for f in sorted(os.listdir(os.path.join(directory, c)))
+                      if f.lower().endswith(EXTENSIONS)] for label, c in enumerate(classes)]
+        # interleave the classes, so a limit keeps all the classes
+        files = [file for files in itertools.zip_longest(*per_class) for file in files if file is not None]
+    else:
+        files = [(os.path.join(directory, f), None) for f in sorted(os.listdir(directory)) if f.lower().endswith(EXTENSIONS)]
+
+    for path, label in files[:limit]:
+        image = tf.io.decode_image(tf.io.read_file(path), channels=input_shape[2], expand_animations=False)
+        image = tf.image.resize(image, input_shape[:2]).numpy() * scale
+        yield (image.astype(np.float32), label) if labels else image.astype(np.float32)
+
+def random_images(input_shape=(224, 224, 3), limit=100):
+    """ Stream random images (calibration when no images are available: the accuracy is not meaningful) """
+    for _ in range(limit):
+        yield np.random.rand(*input_shape).astype(np.float32)
+
+def inference_function(model):
+    """ The traced inference pass of a model for a single image (the main output of a multi-output model)
+        model: the Keras model
+    """
+    if len(model.outputs) > 1:
+        model = Model(model.inputs, model.outputs[0])
+    forward = tf.function(lambda x: model(x, training=False))
+    return forward.get_concrete_function(tf.TensorSpec((1,) + tuple(model.input_shape[1:]), tf.float32))
+
+def converter(model):
+    """ The TFLite converter of the inference pass of a model
+        model: the Keras model
+    """
+    function = inference_function(model)
+    try:
+        return tf.lite.TFLiteConverter.from_concrete_functions([function], model)
+    except TypeError:
+        # TF < 2.7: no trackable object argument
+        return tf.lite.TFLiteConverter.from_concrete_functions([function])
+
+def float_tflite(model):
+    """ Convert a model to a float32 TFLite model (the baseline of the int8 model)
+        model: the Keras model
+    """
+    return converter(model).convert()
+
+def quantize(model, calibration_iter, steps=100, int8_io=False, allow_float_fallback=True):
+    """ Quantize a model to an int8 TFLite model (post-training, full integer quantization)
+        model               : the (trained) Keras model
+        calibration_iter    : iterable of representative images (H, W, C), e.g., directory_images(),
+                              which are read as the converter consumes them
+        steps               : maximum number of calibration images
+        int8_io             : whether the input and output tensors are int8 (instead of float32)
+        allow_float_fallback: whether ops without an int8 kernel run in float32 (else the conversion fails)
+    """
+    def representative_dataset():
+        for image in itertools.islice(calibration_iter, steps):
+            yield [np.expand_dims(image, 0).astype(np.float32)]
+
+    tflite = converter(model)
+    tflite.optimizations = [tf.lite.Optimize.DEFAULT]
+    tflite.representative_dataset = representative_dataset
+    if allow_float_fallback:
+        tflite.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    else:
+        tflite.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    if int8_io:
+        tflite.inference_input_type = tf.int8
+        tflite.inference_output_type = tf.int8
+    return tflite.convert()
+
+class TFLiteModel(object):
+    """ Run a TFLite model on single images """
+    def __init__(self, tflite_model, num_threads=None):
+        """ Construct the interpreter
+            tflite_model: the TFLite flatbuffer
+            num_threads : number of CPU threads
+        """
+        self.interpreter = tf.lite.Interpreter(model_content=tflite_model, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+    def __call__(self, image):
+        """ The output (float) for an image (H, W, C) """
+        x = np.expand_dims(image, 0)
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] != np.float32:
+            # saturate to the range of the input type, instead of wrapping around in the cast
+            info = np.iinfo(self.input['dtype'])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max)
+        self.interpreter.set_tensor(self.input['index'], x.astype(self.input['dtype']))
+        self.interpreter.invoke()
+        y = self.interpreter.get_tensor(self.output['index'])[0]
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] != np.float32:
+            y = (y.astype(np.float32) - zero_point) * scale
+        return y
+
+def latency(predict, image, steps=50):
+    """ Median CPU latency (seconds) of a single image """
+    predict(image)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        predict(image)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def evaluate(model, int8_model, eval_iter, float_model=None):
+    """ Compare the int8 model with the float32 model
+        model      : the Keras model
+        int8_model : the int8 TFLite flatbuffer
+        eval_iter  : iterable of (image, label) or of images (then only the top-1 agreement is reported)
+        float_model: the float32 TFLite flatbuffer (default is converted from the model)
+    """
+    if float_model is None:
+        float_model = float_tflite(model)
+    float32, int8 = TFLiteModel(float_model), TFLiteModel(int8_model)
+
+    n = agree = correct_float = correct_int8 = 0
+    labeled = None
+    image = None
+    for sample in eval_iter:
+        image, label = sample if isinstance(sample, tuple) else (sample, None)
+        labeled = label is not None
+        y_float, y_int8 = np.argmax(float32(image)), np.argmax(int8(image))
+        n += 1
+        agree += int(y_float == y_int8)
+        if labeled:
+            correct_float += int(y_float == label)
+            correct_int8 += int(y_int8 == label)
+
+    report = { 'images': n, 'top1_agreement': agree / max(n, 1),
+               'size_float32': len(float_model), 'size_int8': len(int8_model) }
+    if labeled:
+        report['accuracy_float32'] = correct_float / n
+        report['accuracy_int8'] = correct_int8 / n
+        report['accuracy_delta'] = report['accuracy_int8'] - report['accuracy_float32']
+    if image is None:
+        image = np.random.rand(*model.input_shape[1:]).astype(np.float32)
+    # the traced forward pass, as the TFLite models (not the eager per-op dispatch of model())
+    forward = inference_function(model)
+    report['latency_keras_ms'] = latency(lambda x: forward(tf.constant(np.expand_dims(x, 0))).numpy(), image) * 1000
+    report['latency_float32_ms'] = latency(float32, image) * 1000
+    report['latency_int8_ms'] = latency(int8, image) * 1000
+    return report
+
+if __name__ == '__main__':
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    from zoo.bench import models, build
+
+    parser = argparse.ArgumentParser(description='Model Zoo post-training int8 quantization')
+    parser.add_argument('model', choices=list(models), help='model to quantize')
+    parser.add_argument('--weights', help='weights of the trained model')
+    parser.add_argument('--size', type=int, default=224, help='input height/width')
+    parser.add_argument('--calibration', help='directory of representative images (default is random images)')
+    parser.add_argument('--steps', type=int, default=100, help='number of calibration images')
+    parser.add_argument('--eval', help='directory of class subdirectories of labeled images')
+    parser.add_argument('--eval-limit', type=int, default=500, help='maximum number of evaluation images')
+    parser.add_argument('--int8-io', action='store_true', help='int8 input and output tensors')
+    parser.add_argument('--output', help='file for the int8 TFLite model')
+    args = parser.parse_args()
+
+    input_shape = (args.size, args.size, 3)
+    model = build(args.model, input_shape=input_shape)
+    if args.weights:
+        model.load_weights(args.weights)
+
+    if args.calibration:
+        calibration = directory_images(args.calibration, input_shape)
+    else:
+        calibration = random_images(input_shape, args.steps)
+    int8_model = quantize(model, calibration, args.steps, args.int8_io)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(int8_model)
+
+    if args.eval:
+        samples = directory_images(args.eval, input_shape, limit=args.eval_limit, labels=True)
+    else:
+        samples = random_images(input_shape, 20)
+    report = dict(model=args.model, **evaluate(model, int8_model, samples))
+    print(json.dumps(report, indent=2))
@@ -20,7 +20,9 @@
 import tensorflow as tf
 from tensorflow.keras import Model, Input
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, ZeroPadding2D, BatchNormalization
-from tensorflow.keras.layers import ReLU, Dense, GlobalAveragePooling2D, Add
+from tensorflow.keras.layers import ReLU, Dense, GlobalAveragePooling2D, Add, Activation
+from zoo.checkpoint import checkpoint
+from zoo.precision import policy_scope
 
 class ResNetV1_5(object):
     """ Construct a Residual Convoluntional Network V1.5 """
@@ -32,29 +34,33 @@ class ResNetV1_5(object):
     _model = None
     init_weights = 'he_normal'
     
-    def __init__(self, n_layers, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, input_shape=(224, 224, 3), n_classes=1000, checkpoint_groups=False, dtype_policy=None):
         """ Construct a Residual Convolutional Neural Network V1.5
-            n_layers   : number of layers
-            input_shape: input shape
-            n_classes  : number of output classes
+            n_layers         : number of layers
+            input_shape      : input shape
+            n_classes        : number of output classes
+            checkpoint_groups: whether to recompute the activations of each group during backprop
+            dtype_policy     : mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if n_layers not in [50, 101, 152]:
             raise Exception("ResNet: Invalid value for n_layers")
 
-        # The input tensor
-        inputs = Input(input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input tensor
+            inputs = Input(input_shape)
 
-        # The stem convolutional group
-        x = self.stem(inputs)
+            # The stem convolutional group
+            x = self.stem(inputs)
 
-        # The learner
-        x = self.learner(x, self.groups[n_layers])
+            # The learner
+            x = self.learner(x, list(self.groups[n_layers]), checkpoint_groups=checkpoint_groups)
 
-        # The classifier for 1000 classes
-        outputs = self.classifier(x, n_classes)
+            # The classifier for 1000 classes
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -81,18 +87,22 @@ class ResNetV1_5(object):
         x = MaxPooling2D((3, 3), strides=(2, 2))(x)
         return x
 
-    def learner(self, x, groups):
+    def learner(self, x, groups, checkpoint_groups=False):
         """ Construct the Learner
             x     : input to the learner
             groups: list of groups: number of filters and blocks
+            checkpoint_groups: whether to recompute the activations of each group during backprop
         """
+        # Recompute the activations of each group during backprop
+        group = checkpoint(ResNetV1_5.group) if checkpoint_groups else ResNetV1_5.group
+
         # First Residual Block Group (not strided)
-        group = groups.pop(0)
-        x = ResNetV1_5.group(x, group[0], group[1], strides=(1, 1))
+        n_filters, n_blocks = groups.pop(0)
+        x = group(x, n_filters, n_blocks, strides=(1, 1))
 
         # Remaining Residual Block Groups (strided)
         for n_filters, n_blocks in groups:
-            x = ResNetV1_5.group(x, n_filters, n_blocks)
+            x = group(x, n_filters, n_blocks)
         return x
 
     @staticmethod
@@ -191,7 +201,9 @@ class ResNetV1_5(object):
         x = GlobalAveragePooling2D()(x)
 
         # Final Dense Outputting Layer for the outputs
-        outputs = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        outputs = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        outputs = Activation('softmax', dtype='float32')(outputs)
         return outputs
 
 
@@ -0,0 +1,63 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# ResNeXt (50, 101, 152) - split vs. native group convolution benchmark
+# Reports graph build time, number of layers and graph ops, and CPU step latency
+#
+# Usage (from the root of the repository):
+#   python -m zoo.resnext.resnext_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import numpy as np
+import tensorflow as tf
+from zoo.resnext.resnext_c import ResNeXt
+
+def benchmark(n_layers, group_impl, input_shape=(224, 224, 3), batch_size=8, steps=10):
+    """ Benchmark a ResNeXt model on the CPU
+        n_layers   : number of layers
+        group_impl : implementation of the group convolution ('split' or 'native')
+        input_shape: the input shape
+        batch_size : number of images per step
+        steps      : number of timed steps
+    """
+    # Graph build time
+    start = time.perf_counter()
+    model = ResNeXt(n_layers, input_shape=input_shape, group_impl=group_impl).model
+    build = time.perf_counter() - start
+
+    # Number of ops in the traced inference graph
+    forward = tf.function(lambda x: model(x, training=False))
+    graph = forward.get_concrete_function(tf.TensorSpec((batch_size,) + input_shape, tf.float32)).graph
+    n_ops = len(graph.get_operations())
+
+    # Step latency (the first call is a warmup)
+    x = np.random.rand(batch_size, *input_shape).astype(np.float32)
+    forward(x)
+    start = time.perf_counter()
+    for _ in range(steps):
+        forward(x).numpy()
+    latency = (time.perf_counter() - start) / steps
+
+    return build, len(model.layers), n_ops, latency
+
+if __name__ == '__main__':
+    print("%-12s %-8s %10s %8s %8s %12s" % ('model', 'impl', 'build (s)', 'layers', 'ops', 'step (ms)'))
+    for n_layers in [50, 101, 152]:
+        for group_impl in ['split', 'native']:
+            build, n_nodes, n_ops, latency = benchmark(n_layers, group_impl)
+            print("%-12s %-8s %10.2f %8d %8d %12.1f" % ('ResNeXt' + str(n_layers), group_impl, build, n_nodes, n_ops, latency * 1000))
+            tf.keras.backend.clear_session()
@@ -16,9 +16,12 @@
 # Paper: https://arxiv.org/pdf/1611.05431.pdf
 
 import tensorflow as tf
+import numpy as np
 from tensorflow.keras import Model, Input
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, ReLU, BatchNormalization, Add
-from tensorflow.keras.layers import Concatenate, Dense, GlobalAveragePooling2D, Lambda
+from tensorflow.keras.layers import Concatenate, Dense, GlobalAveragePooling2D, Lambda, Activation
+from zoo.checkpoint import checkpoint
+from zoo.precision import policy_scope
 
 class ResNeXt(object):
     """ Construct a Residual Next Convolution Neural Network """
@@ -31,33 +34,45 @@ class ResNeXt(object):
     # Meta-parameter: width of group convolution
     cardinality = 32
 
+    # Implementation of the group convolution:
+    #   'split' : slice the feature maps and convolve each group separately (as in the paper)
+    #   'native': a single Conv2D with groups=cardinality
+    group_impl = 'split'
+
     _model=None
     init_weights='he_normal'
 
-    def __init__(self, n_layers, cardinality=32, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, cardinality=32, input_shape=(224, 224, 3), n_classes=1000, group_impl='split', checkpoint_groups=False, dtype_policy=None):
         """ Construct a Residual Next Convolution Neural Network
-            n_layers   : number of layers
-            cardinality: width of group convolution
-            input_shape: the input shape
-            n_classes  : number of output classes
+            n_layers         : number of layers
+            cardinality      : width of group convolution
+            input_shape      : the input shape
+            n_classes        : number of output classes
+            checkpoint_groups: whether to recompute the activations of each group during backprop
+            group_impl       : implementation of the group convolution ('split' or 'native')
+            dtype_policy     : mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if n_layers not in [50, 101, 152]:
             raise Exception("ResNeXt: Invalid value for n_layers")
+        if group_impl not in ['split', 'native']:
+            raise Exception("ResNeXt: Invalid value for group_impl")
         
-        # The input tensor
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input tensor
+            inputs = Input(shape=input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs)
+            # The Stem Group
+            x = self.stem(inputs)
 
-        # The Learner
-        x = self.learner(x, self.groups[n_layers], cardinality)
+            # The Learner
+            x = self.learner(x, list(self.groups[n_layers]), cardinality, group_impl, checkpoint_groups=checkpoint_groups)
 
-        # The Classifier for 1000 classes
-        outputs = self.classifier(x, n_classes)
+            # The Classifier for 1000 classes
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -77,46 +92,53 @@ class ResNeXt(object):
         x = MaxPooling2D(pool_size=(3, 3), strides=(2, 2), padding='same')(x)
         return x
     
-    def learner(self, x, groups, cardinality=32):
+    def learner(self, x, groups, cardinality=32, group_impl='split', checkpoint_groups=False):
         """ Construct the Learner
             x          : input to the learner
             groups     : list of groups: filters in, filters out, number of blocks
             cardinality: width of group convolution
+            group_impl : implementation of the group convolution ('split' or 'native')
+            checkpoint_groups: whether to recompute the activations of each group during backprop
         """
+        # Recompute the activations of each group during backprop
+        group = checkpoint(ResNeXt.group) if checkpoint_groups else ResNeXt.group
+
         # First ResNeXt Group (not-strided)
         filters_in, filters_out, n_blocks = groups.pop(0)
-        x = ResNeXt.group(x, filters_in, filters_out, n_blocks, strides=(1, 1), cardinality=cardinality)
+        x = group(x, filters_in, filters_out, n_blocks, strides=(1, 1), cardinality=cardinality, group_impl=group_impl)
 
         # Remaining ResNeXt groups
         for filters_in, filters_out, n_blocks in groups:
-            x = ResNeXt.group(x, filters_in, filters_out, n_blocks, cardinality=cardinality)
+            x = group(x, filters_in, filters_out, n_blocks, cardinality=cardinality, group_impl=group_impl)
         return x
 
     @staticmethod
-    def group(x, filters_in, filters_out, n_blocks, cardinality=32, strides=(2, 2), init_weights=None):
+    def group(x, filters_in, filters_out, n_blocks, cardinality=32, strides=(2, 2), init_weights=None, group_impl='split'):
         """ Construct a Residual group
             x          : input to the group
             filters_in : number of filters  (channels) at the input convolution
             filters_out: number of filters (channels) at the output convolution
             cardinality: width of group convolution
             strides    : whether its a strided convolution
+            group_impl : implementation of the group convolution ('split' or 'native')
         """
         # Double the size of filters to fit the first Residual Group
         # Reduce feature maps by 75% (strides=2, 2) to fit the next Residual Group
-        x = ResNeXt.projection_block(x, filters_in, filters_out, strides=strides, cardinality=cardinality, init_weights=init_weights)
+        x = ResNeXt.projection_block(x, filters_in, filters_out, strides=strides, cardinality=cardinality, init_weights=init_weights, group_impl=group_impl)
 
         # Remaining blocks
         for _ in range(n_blocks):
-            x = ResNeXt.identity_block(x, filters_in, filters_out, cardinality=cardinality, init_weights=init_weights)	
+            x = ResNeXt.identity_block(x, filters_in, filters_out, cardinality=cardinality, init_weights=init_weights, group_impl=group_impl)
         return x
 
     @staticmethod
-    def identity_block(x, filters_in, filters_out, cardinality=32, init_weights=None):
+    def identity_block(x, filters_in, filters_out, cardinality=32, init_weights=None, group_impl='split'):
         """ Construct a ResNeXT block with identity link
             x          : input to block
             filters_in : number of filters  (channels) at the input convolution
             filters_out: number of filters (channels) at the output convolution
             cardinality: width of group convolution
+            group_impl : implementation of the group convolution ('split' or 'native')
         """
         if init_weights is None:
             init_weights = ResNeXt.init_weights
@@ -130,16 +152,8 @@ class ResNeXt(object):
         x = BatchNormalization()(x)
         x = ReLU()(x)
 
-        # Cardinality (Wide) Layer (split-transform)
-        filters_card = filters_in // cardinality
-        groups = []
-        for i in range(cardinality):
-            group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-            groups.append(Conv2D(filters_card, (3, 3), strides=(1, 1),
-                                 padding='same', kernel_initializer=init_weights, use_bias=False)(group))
-
-        # Concatenate the outputs of the cardinality layer together (merge)
-        x = Concatenate()(groups)
+        # Cardinality (Wide) Layer (split-transform-merge)
+        x = ResNeXt.group_conv(x, filters_in, cardinality, strides=(1, 1), init_weights=init_weights, group_impl=group_impl)
         x = BatchNormalization()(x)
         x = ReLU()(x)
 
@@ -154,13 +168,14 @@ class ResNeXt(object):
         return x
 
     @staticmethod
-    def projection_block(x, filters_in, filters_out, cardinality=32, strides=(2, 2), init_weights=None):
+    def projection_block(x, filters_in, filters_out, cardinality=32, strides=(2, 2), init_weights=None, group_impl='split'):
         """ Construct a ResNeXT block with projection shortcut
             x          : input to the block
             filters_in : number of filters  (channels) at the input convolution
             filters_out: number of filters (channels) at the output convolution
             cardinality: width of group convolution
             strides    : whether entry convolution is strided (i.e., (2, 2) vs (1, 1))
+            group_impl : implementation of the group convolution ('split' or 'native')
         """
         if init_weights is None:
             init_weights = ResNeXt.init_weights
@@ -177,16 +192,8 @@ class ResNeXt(object):
         x = BatchNormalization()(x)
         x = ReLU()(x)
 
-        # Cardinality (Wide) Layer (split-transform)
-        filters_card = filters_in // cardinality
-        groups = []
-        for i in range(cardinality):
-            group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-            groups.append(Conv2D(filters_card, (3, 3), strides=strides,
-                                 padding='same', kernel_initializer=init_weights, use_bias=False)(group))
-
-        # Concatenate the outputs of the cardinality layer together (merge)
-        x = Concatenate()(groups)
+        # Cardinality (Wide) Layer (split-transform-merge)
+        x = ResNeXt.group_conv(x, filters_in, cardinality, strides=strides, init_weights=init_weights, group_impl=group_impl)
         x = BatchNormalization()(x)
         x = ReLU()(x)
 
@@ -200,6 +207,62 @@ class ResNeXt(object):
         x = ReLU()(x)
         return x
     
+    @staticmethod
+    def group_conv(x, filters_in, cardinality=32, strides=(1, 1), init_weights=None, group_impl='split'):
+        """ Construct the Cardinality (Wide) Layer
+            x          : input to the layer
+            filters_in : number of filters (channels) at the input convolution
+            cardinality: width of group convolution
+            strides    : whether the group convolution is strided
+            group_impl : implementation of the group convolution ('split' or 'native')
+        """
+        if init_weights is None:
+            init_weights = ResNeXt.init_weights
+
+        # Single grouped convolution: one kernel launch and one layer per block
+        if group_impl == 'native':
+            return Conv2D(filters_in, (3, 3), strides=strides, groups=cardinality,
+                          padding='same', kernel_initializer=init_weights, use_bias=False)(x)
+
+        # Split the feature maps into groups and convolve each group separately
+        filters_card = filters_in // cardinality
+        groups = []
+        for i in range(cardinality):
+            # Bind the group index as an argument, otherwise every slice uses the last index when the model is re-run
+            group = Lambda(lambda z, i: z[:, :, :, i * filters_card:i * filters_card + filters_card], arguments={'i': i})(x)
+            groups.append(Conv2D(filters_card, (3, 3), strides=strides,
+                                 padding='same', kernel_initializer=init_weights, use_bias=False)(group))
+
+        # Concatenate the outputs of the cardinality layer together (merge)
+        return Concatenate()(groups)
+
+    @staticmethod
+    def split_to_native(split_model, native_model):
+        """ Copy the weights of a model built with group_impl='split' into the same model built with group_impl='native'
+            split_model : model with the split (per group) convolutions
+            native_model: model with the grouped convolutions
+        """
+        # Layers with weights are in the same order in both models, except each grouped
+        # convolution corresponds to a run of cardinality convolutions in the split model
+        split_layers  = [layer for layer in split_model.layers if layer.weights]
+        native_layers = [layer for layer in native_model.layers if layer.weights]
+
+        ix = 0
+        for layer in native_layers:
+            if isinstance(layer, Conv2D) and layer.groups > 1:
+                # The output filters of a grouped convolution are ordered by group, so the
+                # per group kernels (3, 3, filters_card, filters_card) stack on the output axis
+                kernels = [group.get_weights()[0] for group in split_layers[ix:ix + layer.groups]]
+                layer.set_weights([np.concatenate(kernels, axis=-1)])
+                ix += layer.groups
+            else:
+                layer.set_weights(split_layers[ix].get_weights())
+                ix += 1
+
+        if ix != len(split_layers):
+            raise Exception("ResNeXt: split and native models do not match")
+        return native_model
+    
     def classifier(self, x, n_classes):
         """ Construct the Classifier
             x         : input to the classifier
@@ -207,9 +270,16 @@ class ResNeXt(object):
         """
         # Final Dense Outputting Layer 
         x = GlobalAveragePooling2D()(x)
-        outputs = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        outputs = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        outputs = Activation('softmax', dtype='float32')(outputs)
         return outputs
 
 
 # Example
 # resnext = ResNeXt(50)
+
+# Example: single grouped convolution per block, with weights converted from the split form
+# split  = ResNeXt(50)
+# native = ResNeXt(50, group_impl='native')
+# ResNeXt.split_to_native(split.model, native.model)
@@ -18,7 +18,9 @@
 import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import ZeroPadding2D, Conv2D, MaxPooling2D, BatchNormalization, ReLU
-from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Reshape, Multiply, Add
+from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Reshape, Multiply, Add, Activation
+from zoo.checkpoint import checkpoint
+from zoo.precision import policy_scope
 
 class SEResNet(object):
     """ Construct a Squeeze & Excite Residual Convolution Neural Network """
@@ -31,29 +33,33 @@ class SEResNet(object):
     init_weights = 'he_normal'
     _model = None
 
-    def __init__(self, n_layers, ratio=16, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, ratio=16, input_shape=(224, 224, 3), n_classes=1000, checkpoint_groups=False, dtype_policy=None):
         """ Construct a Residual Convolutional Neural Network V1
-            n_layers   : number of layers
-            input_shape: input shape
-            n_classes  : number of output classes
+            n_layers         : number of layers
+            input_shape      : input shape
+            n_classes        : number of output classes
+            checkpoint_groups: whether to recompute the activations of each group during backprop
+            dtype_policy     : mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if n_layers not in [50, 101, 152]:
             raise Exception("ResNet: Invalid value for n_layers")
 
-        # The input tensor
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input tensor
+            inputs = Input(shape=input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs)
+            # The Stem Group
+            x = self.stem(inputs)
 
-        # The Learner
-        x = self.learner(x, self.groups[n_layers], ratio)
+            # The Learner
+            x = self.learner(x, list(self.groups[n_layers]), ratio, checkpoint_groups=checkpoint_groups)
 
-        # The Classifier for 1000 classes
-        outputs = self.classifier(x, 1000)
+            # The Classifier for 1000 classes
+            outputs = self.classifier(x, 1000)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
         
     @property
     def model(self):
@@ -80,19 +86,23 @@ class SEResNet(object):
         x = MaxPooling2D((3, 3), strides=(2, 2))(x)
         return x
 
-    def learner(self, x, groups, ratio):
+    def learner(self, x, groups, ratio, checkpoint_groups=False):
         """ Construct the Learner
             x     : input to the learner
             groups: list of groups: number of filters and blocks
             ratio : amount of filter reduction in squeeze
+            checkpoint_groups: whether to recompute the activations of each group during backprop
         """
+        # Recompute the activations of each group during backprop
+        group = checkpoint(SEResNet.group) if checkpoint_groups else SEResNet.group
+
         # First Residual Block Group (not strided)
         n_filters, n_blocks = groups.pop(0)
-        x = SEResNet.group(x, n_filters, n_blocks, ratio, strides=(1, 1))
+        x = group(x, n_filters, n_blocks, ratio, strides=(1, 1))
 
         # Remaining Residual Block Groups (strided)
         for n_filters, n_blocks in groups:
-            x = SEResNet.group(x, n_filters, n_blocks, ratio)
+            x = group(x, n_filters, n_blocks, ratio)
         return x	
 
     @staticmethod
@@ -233,7 +243,9 @@ class SEResNet(object):
       x = GlobalAveragePooling2D()(x)
 
       # Final Dense Outputting Layer for the outputs
-      outputs = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+      outputs = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+      # The softmax is computed in float32 (for numerical stability with mixed precision)
+      outputs = Activation('softmax', dtype='float32')(outputs)
       return outputs
 
 # Example
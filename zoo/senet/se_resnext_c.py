@@ -18,7 +18,9 @@
 import tensorflow as tf
 from tensorflow.keras import Model, Input
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, ReLU, Dense, Add
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Reshape, Multiply, Lambda, Concatenate
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Reshape, Multiply, Lambda, Concatenate, Activation
+from zoo.checkpoint import checkpoint
+from zoo.precision import policy_scope
 
 class SEResNeXt(object):
     """ Construct a Squeeze & Excite Residual Next Convolution Neural Network """
@@ -34,31 +36,35 @@ class SEResNeXt(object):
     init_weights = 'he_normal'
     _model = None
 
-    def __init__(self, n_layers, cardinality=32, ratio=16, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, cardinality=32, ratio=16, input_shape=(224, 224, 3), n_classes=1000, checkpoint_groups=False, dtype_policy=None):
         """ Construct a Residual Next Convolution Neural Network
-            n_layers   : number of layers
-            cardinality: width of group convolution
-            ratio      : amount of filter reduction in squeeze operation
-            input_shape: the input shape
-            n_classes  : number of output classes
+            n_layers         : number of layers
+            cardinality      : width of group convolution
+            ratio            : amount of filter reduction in squeeze operation
+            input_shape      : the input shape
+            n_classes        : number of output classes
+            checkpoint_groups: whether to recompute the activations of each group during backprop
+            dtype_policy     : mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if n_layers not in [50, 101, 152]:
             raise Exception("SE-ResNeXt: Invalid value for n_layers")
 
-        # The input tensor
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input tensor
+            inputs = Input(shape=input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs)
+            # The Stem Group
+            x = self.stem(inputs)
 
-        # The Learner
-        x = self.learner(x, self.groups[n_layers], cardinality, ratio)
+            # The Learner
+            x = self.learner(x, list(self.groups[n_layers]), cardinality, ratio, checkpoint_groups=checkpoint_groups)
 
-        # The Classifier for 1000 classes
-        outputs = self.classifier(x, n_classes)
+            # The Classifier for 1000 classes
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -78,20 +84,24 @@ class SEResNeXt(object):
         x = MaxPooling2D((3, 3), strides=(2, 2), padding='same')(x)
         return x
 
-    def learner(self, x, groups, cardinality, ratio, init_weights=None):
+    def learner(self, x, groups, cardinality, ratio, init_weights=None, checkpoint_groups=False):
         """ Construct the Learner
             x          : input to the learner
             groups     : list of groups: filters in, filters out, number of blocks
             cardinality: width of group convolution
             ratio      : amount of filter reduction during squeeze
+            checkpoint_groups: whether to recompute the activations of each group during backprop
         """
+        # Recompute the activations of each group during backprop
+        group = checkpoint(SEResNeXt.group) if checkpoint_groups else SEResNeXt.group
+
         # First ResNeXt Group (not strided)
         filters_in, filters_out, n_blocks = groups.pop(0)
-        x = SEResNeXt.group(x, n_blocks, filters_in, filters_out, cardinality, ratio, strides=(1, 1), init_weights=init_weights)
+        x = group(x, n_blocks, filters_in, filters_out, cardinality, ratio, strides=(1, 1), init_weights=init_weights)
 
         # Remaining ResNeXt Groups
         for filters_in, filters_out, n_blocks in groups:
-            x = SEResNeXt.group(x, n_blocks, filters_in, filters_out, cardinality, ratio, init_weights=init_weights)
+            x = group(x, n_blocks, filters_in, filters_out, cardinality, ratio, init_weights=init_weights)
         return x
 
     @staticmethod
@@ -250,7 +260,9 @@ class SEResNeXt(object):
         """
         # Final Dense Outputting Layer 
         x = GlobalAveragePooling2D()(x)
-        outputs = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        outputs = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        outputs = Activation('softmax', dtype='float32')(outputs)
         return outputs
 
 # Example
@@ -0,0 +1,103 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# ShuffleNet v1.0 - channel shuffle and pointwise group convolution micro-benchmarks
+# Compares the reshape/permute/reshape Lambda chain with the ChannelShuffle layer, and
+# the split with the batched pointwise group convolution on the CPU
+#
+# Usage (from the root of the repository):
+#   python -m zoo.shufflenet.shufflenet_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import Lambda
+from tensorflow.keras import backend as K
+from zoo.shufflenet.shufflenet_c import ShuffleNet
+
+def lambda_shuffle(x, n_partitions):
+    ''' The channel shuffle as three Lambda layers (previous implementation)
+        x            : input tensor
+        n_partitions : number of groups to partition feature maps (channels) into.
+    '''
+    batch, height, width, n_filters = x.shape
+    grp_in_filters  = n_filters // n_partitions
+    x = Lambda(lambda z: K.reshape(z, [-1, height, width, n_partitions, grp_in_filters]))(x)
+    x = Lambda(lambda z: K.permute_dimensions(z, (0, 1, 2, 4, 3)))(x)
+    x = Lambda(lambda z: K.reshape(z, [-1, height, width, n_filters]))(x)
+    return x
+
+def benchmark(shuffle, x, n_partitions, steps=100):
+    ''' Time the channel shuffle on a batch of feature maps
+        shuffle     : function constructing the channel shuffle
+        x           : batch of feature maps (N, H, W, C)
+        n_partitions: number of groups to partition feature maps (channels) into.
+        steps       : number of timed steps
+    '''
+    inputs = Input(x.shape[1:])
+    model = Model(inputs, shuffle(inputs, n_partitions))
+    forward = tf.function(lambda x: model(x, training=False))
+
+    y = forward(x).numpy()
+    start = time.perf_counter()
+    for _ in range(steps):
+        forward(x).numpy()
+    return (time.perf_counter() - start) / steps, y
+
+def benchmark_model(n_partitions, batch_size=8, steps=10):
+    ''' Time a ShuffleNet built with split and with batched pointwise group convolutions
+        n_partitions: number of groups to partition feature maps (channels) into.
+        batch_size  : number of images per step
+        steps       : number of timed steps
+    '''
+    split   = ShuffleNet(n_partitions=n_partitions).model
+    batched = ShuffleNet(n_partitions=n_partitions, group_impl='batched').model
+    ShuffleNet.split_to_batched(split, batched)
+
+    x = np.random.rand(batch_size, 224, 224, 3).astype(np.float32)
+    results = []
+    for model in [split, batched]:
+        forward = tf.function(lambda x: model(x, training=False))
+        y = forward(x).numpy()
+        start = time.perf_counter()
+        for _ in range(steps):
+            forward(x).numpy()
+        results.append(((time.perf_counter() - start) / steps, len(model.layers), y))
+
+    assert np.allclose(results[0][2], results[1][2], atol=1e-5)
+    return results[0][:2], results[1][:2]
+
+if __name__ == '__main__':
+    print("%-12s %-16s %12s %12s" % ('partitions', 'shape', 'lambda (ms)', 'layer (ms)'))
+    for n_partitions, filters in ShuffleNet.filters.items():
+        # feature maps at the entry of each shuffle group (after the reduction)
+        for size, n_filters in zip([56, 28, 14], filters[1:]):
+            shape = (size, size, int(ShuffleNet.reduction * n_filters) // n_partitions * n_partitions)
+            # the same feature maps for both, so the outputs are compared
+            x = np.random.rand(32, *shape).astype(np.float32)
+            t_lambda, y_lambda = benchmark(lambda_shuffle, x, n_partitions)
+            t_layer,  y_layer  = benchmark(ShuffleNet.channel_shuffle, x, n_partitions)
+            assert np.array_equal(y_lambda, y_layer)
+            print("%-12d %-16s %12.3f %12.3f" % (n_partitions, shape, t_lambda * 1000, t_layer * 1000))
+
+    print()
+    print("%-12s %14s %14s %12s %12s" % ('partitions', 'split layers', 'batched layers', 'split (ms)', 'batched (ms)'))
+    for n_partitions in ShuffleNet.filters:
+        (t_split, n_split), (t_batched, n_batched) = benchmark_model(n_partitions)
+        print("%-12d %14d %14d %12.1f %12.1f" % (n_partitions, n_split, n_batched, t_split * 1000, t_batched * 1000))
+        tf.keras.backend.clear_session()
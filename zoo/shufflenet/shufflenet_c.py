@@ -16,10 +16,96 @@
 # Paper: https://arxiv.org/pdf/1707.01083.pdf
 
 import tensorflow as tf
+import numpy as np
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import Dense, Conv2D, BatchNormalization, ReLU, MaxPooling2D, GlobalAveragePooling2D
-from tensorflow.keras.layers import Add, Concatenate, AveragePooling2D, DepthwiseConv2D, Lambda
-from tensorflow.keras import backend as K
+from tensorflow.keras.layers import Add, Concatenate, AveragePooling2D, DepthwiseConv2D, Lambda, Layer, Activation
+from zoo.precision import policy_scope
+
+class ChannelShuffle(Layer):
+    ''' Channel Shuffle Layer
+        Interleaves the channels of the groups, i.e., for 2 groups of 3 channels [a0, a1, a2, b0, b1, b2]
+        the output channels are [a0, b0, a1, b1, a2, b2]: a reshape to (groups, channels per group), a transposition and
+        a reshape back, in one layer. The height and width are read from the input at run time, so they may be variable.
+    '''
+    def __init__(self, n_partitions, **kwargs):
+        ''' Construct a Channel Shuffle Layer
+            n_partitions : number of groups to partition feature maps (channels) into.
+        '''
+        super(ChannelShuffle, self).__init__(**kwargs)
+        self.n_partitions = n_partitions
+
+    def build(self, input_shape):
+        n_filters = int(input_shape[-1])
+        if n_filters % self.n_partitions:
+            raise Exception("ChannelShuffle: number of channels not divisible by n_partitions")
+
+        # Derive the number of input filters (channels) per group
+        self.grp_in_filters = n_filters // self.n_partitions
+        super(ChannelShuffle, self).build(input_shape)
+
+    def call(self, inputs):
+        # (group, channel) transposed to (channel, group): a transposition is a copy, where a gather on the
+        # channel axis is an indexed read per element
+        shape = tf.shape(inputs)
+        x = tf.reshape(inputs, [shape[0], shape[1], shape[2], self.n_partitions, self.grp_in_filters])
+        x = tf.transpose(x, [0, 1, 2, 4, 3])
+        return tf.reshape(x, shape)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
+
+    def get_config(self):
+        config = super(ChannelShuffle, self).get_config()
+        config.update({'n_partitions': self.n_partitions})
+        return config
+
+class PointwiseGroupConv(Layer):
+    ''' Pointwise Group Convolution Layer
+        Computes the 1x1 convolution of each channel group as a single grouped convolution with a
+        (n_partitions, grp_in_filters, grp_out_filters) kernel, i.e., the block diagonal of the
+        equivalent 1x1 convolution, without slicing the input into per group tensors.
+    '''
+    def __init__(self, n_partitions, grp_out_filters, kernel_initializer='glorot_uniform', **kwargs):
+        ''' Construct a Pointwise Group Convolution Layer
+            n_partitions   : number of groups to partition feature maps (channels) into.
+            grp_out_filters: number of output filters per group
+        '''
+        super(PointwiseGroupConv, self).__init__(**kwargs)
+        self.n_partitions = n_partitions
+        self.grp_out_filters = grp_out_filters
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+
+    def build(self, input_shape):
+        # Derive the number of input filters (channels) per group (remaining channels are dropped, as in the split form)
+        self.grp_in_filters = int(input_shape[-1]) // self.n_partitions
+        self.kernel = self.add_weight(name='kernel',
+                                      shape=(self.n_partitions, self.grp_in_filters, self.grp_out_filters),
+                                      initializer=self.kernel_initializer,
+                                      trainable=True)
+        super(PointwiseGroupConv, self).build(input_shape)
+
+    def call(self, inputs):
+        in_filters = self.n_partitions * self.grp_in_filters
+        if inputs.shape[-1] != in_filters:
+            inputs = inputs[..., :in_filters]
+
+        # The grouped 1x1 kernel (1, 1, channels per group, filters): the filters of group g are the columns
+        # g * grp_out_filters ... (g + 1) * grp_out_filters - 1. A batched matrix multiply over a (..., groups,
+        # channels per group) view would transpose the feature maps to put the groups first, and back.
+        kernel = tf.reshape(tf.transpose(self.kernel, [1, 0, 2]),
+                            [1, 1, self.grp_in_filters, self.n_partitions * self.grp_out_filters])
+        return tf.nn.conv2d(inputs, kernel, strides=1, padding='VALID')
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape[:-1]) + (self.n_partitions * self.grp_out_filters,)
+
+    def get_config(self):
+        config = super(PointwiseGroupConv, self).get_config()
+        config.update({'n_partitions': self.n_partitions,
+                       'grp_out_filters': self.grp_out_filters,
+                       'kernel_initializer': tf.keras.initializers.serialize(self.kernel_initializer)})
+        return config
 
 class ShuffleNet(object):
     ''' Construct a Shuffle Convolution Neural Network '''
@@ -41,30 +127,42 @@ class ShuffleNet(object):
 
     # meta-parameter: number of shuffle blocks per shuffle group
     groups = [4, 8, 4 ]
+
+    # Implementation of the pointwise group convolution:
+    #   'split'  : slice the feature maps and convolve each group separately
+    #   'batched': a single grouped convolution over the groups (PointwiseGroupConv)
+    group_impl = 'split'
     
     init_weights='glorot_uniform'
     _model = None
 
-    def __init__(self, groups=[4, 8, 4], n_partitions=2, reduction=0.25, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, groups=[4, 8, 4], n_partitions=2, reduction=0.25, input_shape=(224, 224, 3), n_classes=1000, group_impl='split', dtype_policy=None):
         ''' Construct a Shuffle Convolution Neural Network
             groups      : number of shuffle blocks per shuffle group
             n_partitions: number of groups to partition the filters (channels)
             reduction   : dimensionality reduction on entry to a shuffle block
             input_shape : the input shape to the model
             n_classes   : number of output classes
+            group_impl  : implementation of the pointwise group convolution ('split' or 'batched')
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         '''
-        # input tensor
-        inputs = Input(shape=input_shape)
+        if group_impl not in ['split', 'batched']:
+            raise Exception("ShuffleNet: Invalid value for group_impl")
 
-        # The Stem convolution group (referred to as Stage 1)
-        x = self.stem(inputs)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # input tensor
+            inputs = Input(shape=input_shape)
 
-        # The Learner
-        x = self.learner(x, groups, n_partitions, self.filters[n_partitions], reduction)
+            # The Stem convolution group (referred to as Stage 1)
+            x = self.stem(inputs)
 
-        # The Classifier
-        outputs = self.classifier(x, n_classes)
-        self._model = Model(inputs, outputs)
+            # The Learner
+            x = self.learner(x, groups, n_partitions, self.filters[n_partitions], reduction, group_impl)
+
+            # The Classifier
+            outputs = self.classifier(x, n_classes)
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -84,46 +182,49 @@ class ShuffleNet(object):
         x = MaxPooling2D((3, 3), strides=2, padding='same')(x)
         return x
 
-    def learner(self, x, blocks, n_partitions, filters, reduction):
+    def learner(self, x, blocks, n_partitions, filters, reduction, group_impl='split'):
         ''' Construct the Learner
             x            : input to the learner
             groups       : number of shuffle blocks per shuffle group
             n_parttitions: number of groups to partition feature maps (channels) into.
             filters      : number of filters per shuffle group
             reduction    : dimensionality reduction on entry to a shuffle block
+            group_impl   : implementation of the pointwise group convolution ('split' or 'batched')
         '''
         # Assemble the shuffle groups
         for i in range(3):
-            x = ShuffleNet.group(x, n_partitions, blocks[i], filters[i+1], reduction)
+            x = ShuffleNet.group(x, n_partitions, blocks[i], filters[i+1], reduction, group_impl=group_impl)
         return x
 
     @staticmethod
-    def group(x, n_partitions, n_blocks, n_filters, reduction, init_weights=None):
+    def group(x, n_partitions, n_blocks, n_filters, reduction, init_weights=None, group_impl='split'):
         ''' Construct a Shuffle Group 
             x           : input to the group
             n_partitions: number of groups to partition feature maps (channels) into.
             n_blocks    : number of shuffle blocks for this group
             n_filters   : number of output filters
             reduction   : dimensionality reduction
+            group_impl  : implementation of the pointwise group convolution ('split' or 'batched')
         '''
         if init_weights is None:
             init_weights = ShuffleNet.init_weights
             
         # first block is a strided shuffle block
-        x = ShuffleNet.strided_shuffle_block(x, n_partitions, n_filters, reduction, init_weights=init_weights)
+        x = ShuffleNet.strided_shuffle_block(x, n_partitions, n_filters, reduction, init_weights=init_weights, group_impl=group_impl)
     
         # remaining shuffle blocks in group
         for _ in range(n_blocks-1):
-            x = ShuffleNet.shuffle_block(x, n_partitions, n_filters, reduction, init_weights=init_weights)
+            x = ShuffleNet.shuffle_block(x, n_partitions, n_filters, reduction, init_weights=init_weights, group_impl=group_impl)
         return x
     
     @staticmethod
-    def strided_shuffle_block(x, n_partitions, n_filters, reduction, init_weights=None):
+    def strided_shuffle_block(x, n_partitions, n_filters, reduction, init_weights=None, group_impl='split'):
         ''' Construct a Strided Shuffle Block 
             x           : input to the block
             n_partitions: number of groups to partition feature maps (channels) into.
             n_filters   : number of filters
             reduction   : dimensionality reduction factor (e.g, 0.25)
+            group_impl  : implementation of the pointwise group convolution ('split' or 'batched')
         '''
         if init_weights is None:
             init_weights = ShuffleNet.init_weights
@@ -138,7 +239,7 @@ class ShuffleNet(object):
         n_filters -= int(x.shape[3])
     
         # pointwise group convolution, with dimensionality reduction
-        x = ShuffleNet.pw_group_conv(x, n_partitions, int(reduction * n_filters), init_weights=init_weights)
+        x = ShuffleNet.pw_group_conv(x, n_partitions, int(reduction * n_filters), init_weights=init_weights, group_impl=group_impl)
         x = ReLU()(x)
     
         # channel shuffle layer
@@ -149,7 +250,7 @@ class ShuffleNet(object):
         x = BatchNormalization()(x)
 
         # pointwise group convolution, with dimensionality restoration
-        x = ShuffleNet.pw_group_conv(x, n_partitions, n_filters)
+        x = ShuffleNet.pw_group_conv(x, n_partitions, n_filters, init_weights=init_weights, group_impl=group_impl)
     
         # Concatenate the projection shortcut to the output
         x = Concatenate()([shortcut, x])
@@ -157,12 +258,13 @@ class ShuffleNet(object):
         return x
 
     @staticmethod
-    def shuffle_block(x, n_partitions, n_filters, reduction, init_weights=None):
+    def shuffle_block(x, n_partitions, n_filters, reduction, init_weights=None, group_impl='split'):
         ''' Construct a shuffle Shuffle block  
             x           : input to the block
             n_partitions: number of groups to partition feature maps (channels) into.
             n_filters   : number of filters
             reduction   : dimensionality reduction factor (e.g, 0.25)
+            group_impl  : implementation of the pointwise group convolution ('split' or 'batched')
         '''
         if init_weights is None:
             init_weights = ShuffleNet.init_weights
@@ -171,7 +273,7 @@ class ShuffleNet(object):
         shortcut = x
     
         # pointwise group convolution, with dimensionality reduction
-        x = ShuffleNet.pw_group_conv(x, n_partitions, int(reduction * n_filters), init_weights=init_weights)
+        x = ShuffleNet.pw_group_conv(x, n_partitions, int(reduction * n_filters), init_weights=init_weights, group_impl=group_impl)
         x = ReLU()(x)
     
         # channel shuffle layer
@@ -182,7 +284,7 @@ class ShuffleNet(object):
         x = BatchNormalization()(x)
     
         # pointwise group convolution, with dimensionality restoration
-        x = ShuffleNet.pw_group_conv(x, n_partitions, n_filters, init_weights=init_weights)
+        x = ShuffleNet.pw_group_conv(x, n_partitions, n_filters, init_weights=init_weights, group_impl=group_impl)
     
         # Add the identity shortcut (input added to output)
         x = Add()([shortcut, x])
@@ -190,11 +292,12 @@ class ShuffleNet(object):
         return x
 
     @staticmethod
-    def pw_group_conv(x, n_partitions, n_filters, init_weights=None):
+    def pw_group_conv(x, n_partitions, n_filters, init_weights=None, group_impl='split'):
         ''' A Pointwise Group Convolution  
             x           : input tensor
             n_partitions: number of groups to partition feature maps (channels) into.
             n_filers    : number of filters
+            group_impl  : implementation of the pointwise group convolution ('split' or 'batched')
         '''
         if init_weights is None:
             init_weights = ShuffleNet.init_weights
@@ -206,12 +309,18 @@ class ShuffleNet(object):
         grp_in_filters  = in_filters // n_partitions
         # Derive the number of output filters per group (Note the rounding up)
         grp_out_filters = int(n_filters / n_partitions + 0.5)
+
+        # Perform convolution across all channel groups as a single grouped convolution
+        if group_impl == 'batched':
+            x = PointwiseGroupConv(n_partitions, grp_out_filters, kernel_initializer=init_weights)(x)
+            x = BatchNormalization()(x)
+            return x
       
         # Perform convolution across each channel group
         groups = []
         for i in range(n_partitions):
-            # Slice the input across channel group
-            group = Lambda(lambda x: x[:, :, :, grp_in_filters * i: grp_in_filters * (i + 1)])(x)
+            # Slice the input across channel group (bind the group index, otherwise every slice uses the last index when the model is re-run)
+            group = Lambda(lambda x, i: x[:, :, :, grp_in_filters * i: grp_in_filters * (i + 1)], arguments={'i': i})(x)
 
             # Perform convolution on channel group
             conv = Conv2D(grp_out_filters, (1,1), padding='same', strides=1, use_bias=False, kernel_initializer=init_weights)(group)
@@ -230,20 +339,34 @@ class ShuffleNet(object):
             x            : input tensor
             n_partitions : number of groups to partition feature maps (channels) into.
         '''
-        # Get dimensions of the input tensor
-        batch, height, width, n_filters = x.shape
-
-        # Derive the number of input filters (channels) per group
-        grp_in_filters  = n_filters // n_partitions
-
-        # Separate out the channel groups
-        x = Lambda(lambda z: K.reshape(z, [-1, height, width, n_partitions, grp_in_filters]))(x)
-        # Transpose the order of the channel groups (i.e., 3, 4 => 4, 3)
-        x = Lambda(lambda z: K.permute_dimensions(z, (0, 1, 2, 4, 3)))(x)
-        # Restore shape
-        x = Lambda(lambda z: K.reshape(z, [-1, height, width, n_filters]))(x)
-        return x
+        return ChannelShuffle(n_partitions)(x)
     
+    @staticmethod
+    def split_to_batched(split_model, batched_model):
+        ''' Copy the weights of a model built with group_impl='split' into the same model built with group_impl='batched'
+            split_model  : model with the split (per group) pointwise convolutions
+            batched_model: model with the PointwiseGroupConv layers
+        '''
+        # Layers with weights are in the same order in both models, except each PointwiseGroupConv
+        # corresponds to a run of n_partitions 1x1 convolutions in the split model
+        split_layers   = [layer for layer in split_model.layers if layer.weights]
+        batched_layers = [layer for layer in batched_model.layers if layer.weights]
+
+        ix = 0
+        for layer in batched_layers:
+            if isinstance(layer, PointwiseGroupConv):
+                # Each per group kernel (1, 1, grp_in_filters, grp_out_filters) is one slice of the batched kernel
+                kernels = [group.get_weights()[0][0, 0] for group in split_layers[ix:ix + layer.n_partitions]]
+                layer.set_weights([np.stack(kernels)])
+                ix += layer.n_partitions
+            else:
+                layer.set_weights(split_layers[ix].get_weights())
+                ix += 1
+
+        if ix != len(split_layers):
+            raise Exception("ShuffleNet: split and batched models do not match")
+        return batched_model
+
     def classifier(self, x, n_classes):
         ''' Construct the Classifier Group 
             x         : input to the classifier
@@ -252,8 +375,18 @@ class ShuffleNet(object):
         # Use global average pooling to flatten feature maps to 1D vector, where
         # each feature map is a single averaged value (pixel) in flatten vector
         x = GlobalAveragePooling2D()(x)
-        x = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        x = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        x = Activation('softmax', dtype='float32')(x)
         return x
     
 # Example
 # shufflenet = ShuffleNet()
+
+# Example: pointwise group convolutions as batched matrix multiplies, with weights converted from the split form
+# split   = ShuffleNet()
+# batched = ShuffleNet(group_impl='batched')
+# ShuffleNet.split_to_batched(split.model, batched.model)
+
+# Example: load a saved ShuffleNet
+# model = tf.keras.models.load_model('shufflenet.h5', custom_objects={'ChannelShuffle': ChannelShuffle, 'PointwiseGroupConv': PointwiseGroupConv})
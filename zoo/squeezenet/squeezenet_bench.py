@@ -0,0 +1,66 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# SqueezeNet (+ bypass, complex) - fire block expand fusion benchmark
+# Rewrites each model with SqueezeNet.fuse_expand, checks the outputs match (parity),
+# and reports the CPU inference latency of the original and fused models
+#
+# Usage (from the root of the repository):
+#   python -m zoo.squeezenet.squeezenet_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import numpy as np
+import tensorflow as tf
+from zoo.squeezenet.squeezenet_c import SqueezeNet
+from zoo.squeezenet.squeezenet_bypass_c import SqueezeNetBypass
+from zoo.squeezenet.squeezenet_complex_c import SqueezeNetComplex
+
+def parity(model, fused, batch_size=4, atol=1e-4):
+    ''' Check the fused model matches the original model, returns the maximum absolute difference
+        model     : the original model
+        fused     : the fused model
+        batch_size: number of random images
+        atol      : tolerance (of the softmax outputs)
+    '''
+    x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+    error = float(np.max(np.abs(model(x, training=False).numpy() - fused(x, training=False).numpy())))
+    if error > atol:
+        raise Exception("SqueezeNet: fused model differs by " + str(error))
+    return error
+
+def latency(model, batch_size, steps=20):
+    ''' Median CPU inference latency (seconds) of a batch '''
+    forward = tf.function(lambda x: model(x, training=False))
+    x = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+    forward(x)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        forward(x).numpy()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+if __name__ == '__main__':
+    print("%-18s %8s %8s %10s %6s %12s %12s" % ('model', 'layers', 'fused', 'max error', 'batch', 'ms', 'fused (ms)'))
+    for cls in [SqueezeNet, SqueezeNetBypass, SqueezeNetComplex]:
+        model = cls().model
+        fused = SqueezeNet.fuse_expand(model)
+        error = parity(model, fused)
+        for batch_size in [1, 8, 32]:
+            print("%-18s %8d %8d %10.2e %6d %12.2f %12.2f" % (cls.__name__, len(model.layers), len(fused.layers), error,
+                  batch_size, latency(model, batch_size) * 1000, latency(fused, batch_size) * 1000))
+        tf.keras.backend.clear_session()
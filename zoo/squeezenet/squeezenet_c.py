@@ -16,35 +16,41 @@
 # Paper: https://arxiv.org/pdf/1602.07360.pdf
 
 import tensorflow as tf
+import numpy as np
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Concatenate, Dropout
 from tensorflow.keras.layers import GlobalAveragePooling2D, Activation
+from zoo.fold import graph, rebuild
+from zoo.precision import policy_scope
 
 class SqueezeNet(object):
     ''' Construct a SqueezeNet Convolutional Neural Network '''
     init_weights = 'glorot_uniform'
     _model = None
 
-    def __init__(self, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000, dtype_policy=None):
         ''' Construct a SqueezeNet Convolutional Neural Network
-            dropout    : percent of dropout
-            input_shape: input shape to the model
-            n_classes  : number of output classes
+            dropout     : percent of dropout
+            input_shape : input shape to the model
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         '''
-        # The input shape
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input shape
+            inputs = Input(shape=input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs)
+            # The Stem Group
+            x = self.stem(inputs)
 
-        # The Learner
-        x = self.learner(x, dropout)
+            # The Learner
+            x = self.learner(x, dropout)
 
-        # The classifier
-        outputs = self.classifier(x, n_classes)
+            # The classifier
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -122,6 +128,60 @@ class SqueezeNet(object):
         x = Concatenate()([expand1x1, expand3x3])
         return x
 
+    @staticmethod
+    def fuse_expand(model):
+        ''' Rewrite a (trained) model for inference, where the 1x1 and 3x3 expand convolutions of each
+            fire block are a single 3x3 convolution (the 1x1 kernel is embedded in the center of a 3x3
+            kernel of zeros), so there is no concatenation. Works for the bypass and complex variants.
+            model: the (trained) SqueezeNet model
+        '''
+        layers, consumers, _ = graph(model)
+        inbound = { layer.name: names for layer, names in layers }
+
+        # The expand convolutions: a 1x1 and a 3x3 convolution of the same (squeeze) input, concatenated
+        fire = {}
+        for layer, names in layers:
+            if not isinstance(layer, Concatenate) or layer.axis not in (-1, 3) or len(names) != 2:
+                continue
+            expand1x1, expand3x3 = [model.get_layer(name) for name in names]
+            if type(expand1x1) is not Conv2D or type(expand3x3) is not Conv2D:
+                continue
+            if expand1x1.kernel_size != (1, 1) or expand3x3.kernel_size != (3, 3) or expand3x3.padding != 'same':
+                continue
+            if expand1x1.strides != (1, 1) or expand3x3.strides != (1, 1) or expand3x3.dilation_rate != (1, 1):
+                continue
+            if expand1x1.activation is not expand3x3.activation or not (expand1x1.use_bias and expand3x3.use_bias):
+                continue
+            if inbound[expand1x1.name] != inbound[expand3x3.name]:
+                continue
+            # The expand convolutions are removed, so they must only feed the concatenation
+            if len(consumers[expand1x1.name]) != 1 or len(consumers[expand3x3.name]) != 1:
+                continue
+            fire[layer.name] = (expand1x1, expand3x3)
+        expands = set([conv.name for convs in fire.values() for conv in convs])
+
+        # Each concatenation is replaced by a 3x3 convolution of the squeeze output
+        fused = []
+        weights = {}
+        for layer, names in layers:
+            if layer.name in expands:
+                continue
+            if layer.name in fire:
+                expand1x1, expand3x3 = fire[layer.name]
+                kernel1x1, bias1x1 = expand1x1.get_weights()
+                kernel3x3, bias3x3 = expand3x3.get_weights()
+
+                # embed the 1x1 kernel in the center of a 3x3 kernel
+                kernel = np.zeros(kernel3x3.shape[:3] + kernel1x1.shape[3:], dtype=kernel1x1.dtype)
+                kernel[1, 1] = kernel1x1[0, 0]
+
+                config = expand3x3.get_config()
+                config.update({'name': layer.name, 'filters': expand1x1.filters + expand3x3.filters})
+                layer, names = Conv2D.from_config(config), inbound[expand1x1.name]
+                weights[layer.name] = [np.concatenate([kernel, kernel3x3], axis=-1), np.concatenate([bias1x1, bias3x3])]
+            fused.append((layer, names))
+        return rebuild(model, fused, weights)
+
     def classifier(self, x, n_classes):
         ''' Construct the Classifier 
             x        : input to the classifier
@@ -133,9 +193,12 @@ class SqueezeNet(object):
 
         # reduce each filter (class) to a single value
         x = GlobalAveragePooling2D()(x)
-        x = Activation('softmax')(x)
+        x = Activation('softmax', dtype='float32')(x)
         return x
 
 # Example
 # squeezenet = SqueezeNet()
 
+# Example: single 3x3 expand convolution per fire block for inference
+# fused = SqueezeNet.fuse_expand(squeezenet.model)
+
@@ -19,31 +19,35 @@ import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Concatenate, Add, Dropout
 from tensorflow.keras.layers import GlobalAveragePooling2D, Activation
+from zoo.precision import policy_scope
 
 class SqueezeNetComplex(object):
     ''' Construct a SqueezeNet Complex Bypass Convolution Neural Network '''
     init_weights = 'glorot_uniform'
     _model = None
 
-    def _init__(self, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, dropout=0.5, input_shape=(224, 224, 3), n_classes=1000, dtype_policy=None):
         ''' Construct a SqueezeNet Complex Bypass Convolution Neural Network
-            dropout: percent of dropoput
-            input_shape: input shape to model
-            n_classes  : number of output classes
+            dropout     : percent of dropoput
+            input_shape : input shape to model
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         '''
-        # The input shape
-        inputs = Input((224, 224, 3))
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input shape
+            inputs = Input(input_shape)
 
-        # The Stem Group
-        x = self.stem(inputs)
+            # The Stem Group
+            x = self.stem(inputs)
 
-        # The Learner
-        x = self.learner(x, dropout)
+            # The Learner
+            x = self.learner(x, dropout)
 
-        # The Classifier
-        outputs = self.classifier(x, n_classes)
+            # The Classifier
+            outputs = self.classifier(x, n_classes)
 
-        self._model = Model(inputs, outputs)
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -143,7 +147,7 @@ class SqueezeNetComplex(object):
                    kernel_initializer=self.init_weights)(x)
         # reduce each filter (class) to a single value
         x = GlobalAveragePooling2D()(x)
-        x = Activation('softmax')(x)
+        x = Activation('softmax', dtype='float32')(x)
         return x
 
 # Example
@@ -0,0 +1,86 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# VGG (16, 19) - fully convolutional vs. crop loop sliding window inference benchmark
+# Classifies every 224x224 window (stride 32) of a large image, by cropping the image and running
+# the VGG model on batches of crops, and by a single forward pass of the fully convolutional model
+#
+# Usage (from the root of the repository):
+#   python -m zoo.vgg.vgg_bench
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from zoo.vgg.vgg_c import VGG
+
+def crop_loop(model, image, stride=32, batch_size=32):
+    """ Classify each window of an image by cropping it
+        model     : the VGG model
+        image     : the image (H, W, C)
+        stride    : stride of the windows
+        batch_size: number of crops per forward pass
+    """
+    size = model.input_shape[1]
+    rows = (image.shape[0] - size) // stride + 1
+    cols = (image.shape[1] - size) // stride + 1
+    forward = tf.function(lambda x: model(x, training=False))
+
+    scores = []
+    windows = [(i * stride, j * stride) for i in range(rows) for j in range(cols)]
+    for n in range(0, len(windows), batch_size):
+        crops = np.stack([image[y:y + size, x:x + size] for y, x in windows[n:n + batch_size]])
+        scores.append(forward(crops).numpy())
+    return np.concatenate(scores).reshape(rows, cols, -1)
+
+def benchmark(n_layers, size=1024, batch_size=32):
+    """ Time the crop loop and the fully convolutional model on an image
+        n_layers  : number of layers (16 or 19)
+        size      : height and width of the image
+        batch_size: number of crops per forward pass
+    """
+    model = VGG(n_layers).model
+    fcn = VGG.fully_convolutional(model)
+    image = np.random.rand(size, size, 3).astype(np.float32)
+
+    # warmup (trace and first run)
+    forward = tf.function(lambda x: fcn(x, training=False))
+    forward(image[None]).numpy()
+    crop_loop(model, image[:224, :224], batch_size=batch_size)
+
+    start = time.perf_counter()
+    scores = forward(image[None]).numpy()[0]
+    t_fcn = time.perf_counter() - start
+
+    start = time.perf_counter()
+    crop_scores = crop_loop(model, image, batch_size=batch_size)
+    t_crops = time.perf_counter() - start
+
+    error = float(np.max(np.abs(scores - crop_scores)))
+    return scores.shape, error, t_crops, t_fcn
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='VGG sliding window inference benchmark')
+    parser.add_argument('--size', type=int, default=1024, help='height and width of the image')
+    parser.add_argument('--batch-size', type=int, default=32, help='number of crops per forward pass')
+    args = parser.parse_args()
+
+    print("%-8s %-16s %10s %14s %10s %10s" % ('model', 'score map', 'max error', 'crop loop (s)', 'fcn (s)', 'speedup'))
+    for n_layers in [16, 19]:
+        shape, error, t_crops, t_fcn = benchmark(n_layers, args.size, args.batch_size)
+        print("%-8s %-16s %10.2e %14.2f %10.2f %9.1fx" % ('VGG' + str(n_layers), shape, error, t_crops, t_fcn, t_crops / t_fcn))
+        tf.keras.backend.clear_session()
@@ -17,7 +17,8 @@
 
 import tensorflow as tf
 from tensorflow.keras import Input, Model
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Activation, InputLayer
+from zoo.precision import policy_scope
 
 class VGG(object):
     """ VGG (composable)
@@ -30,29 +31,32 @@ class VGG(object):
     _model = None
  
 
-    def __init__(self, n_layers, input_shape=(224, 224, 3), n_classes=1000):
+    def __init__(self, n_layers, input_shape=(224, 224, 3), n_classes=1000, dtype_policy=None):
         """ Construct a VGG model
             n_layers    : number of layers (16 or 19)
             input_shape : input shape to the model
-            n_classes:  : number of output classes
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
         if n_layers not in [16, 19]:
             raise Exception("VGG: Invalid value for n_layers")
             
-        # The input vector 
-        inputs = Input( input_shape )
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # The input vector 
+            inputs = Input( input_shape )
 
-        # The stem group
-        x = self.stem(inputs)
+            # The stem group
+            x = self.stem(inputs)
 
-        # The learner
-        x = self.learner(x, self.groups[n_layers])
+            # The learner
+            x = self.learner(x, self.groups[n_layers])
 
-        # The classifier
-        outputs = self.classifier(x, n_classes)
+            # The classifier
+            outputs = self.classifier(x, n_classes)
 
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+            # Instantiate the Model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -111,10 +115,50 @@ class VGG(object):
         x = Dense(4096, activation='relu', kernel_initializer=self.init_weights)(x)
 
         # Output layer for classification 
-        x = Dense(n_classes, activation='softmax', kernel_initializer=self.init_weights)(x)
+        x = Dense(n_classes, kernel_initializer=self.init_weights)(x)
+        # The softmax is computed in float32 (for numerical stability with mixed precision)
+        x = Activation('softmax', dtype='float32')(x)
         return x
 
+    @staticmethod
+    def fully_convolutional(model, input_shape=(None, None, 3)):
+        """ Convert a (trained) VGG model to a fully convolutional model for sliding window inference
+            The first dense layer is an equivalent convolution with the kernel size of the flattened feature
+            maps (7x7) and the other dense layers are equivalent 1x1 convolutions, so a forward pass over a
+            larger image outputs a score map: the class probabilities for each 224x224 window (stride 32).
+            The scores are exact for a 224x224 input. For a larger image, the 'same' padding of the convolutions
+            sees the neighboring pixels instead of zeros at the window edges, so the scores are close to the
+            scores of the crops for the interior windows, but differ for the windows on the border of the image.
+            model      : the (trained) VGG model
+            input_shape: input shape of the fully convolutional model (default is any height and width)
+        """
+        inputs = Input(input_shape)
+        x = inputs
+        kernel_size = None
+        for layer in model.layers:
+            if isinstance(layer, InputLayer):
+                continue
+            # The flattened feature maps are the window of the first dense layer
+            if isinstance(layer, Flatten):
+                kernel_size = tuple(layer.input.shape[1:3])
+                continue
+            if isinstance(layer, Dense):
+                kernel, bias = layer.get_weights()
+                conv = Conv2D(layer.units, kernel_size, strides=(1, 1), padding='valid', activation=layer.activation)
+                x = conv(x)
+                # The dense kernel is (H * W * C, units), flattened in (H, W, C) order
+                conv.set_weights([kernel.reshape(kernel_size + (-1, layer.units)), bias])
+                kernel_size = (1, 1)
+                continue
+            new_layer = layer.__class__.from_config(layer.get_config())
+            x = new_layer(x)
+            new_layer.set_weights(layer.get_weights())
+        return Model(inputs, x)
+
 # Example of constructing a VGG 16
 # vgg = VGG(16)
 # model = vgg.model
 
+# Example: score map of a 1024x1024 image
+# fcn = VGG.fully_convolutional(vgg.model)
+# scores = fcn.predict(image)	# (1, 26, 26, 1000)
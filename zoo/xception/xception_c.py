@@ -18,32 +18,36 @@
 import tensorflow as tf
 from tensorflow.keras import Input, Model
 from tensorflow.keras.layers import Conv2D, BatchNormalization, ReLU, Dense, GlobalAveragePooling2D
-from tensorflow.keras.layers import SeparableConv2D, MaxPooling2D, Add
+from tensorflow.keras.layers import SeparableConv2D, MaxPooling2D, Add, Activation
+from zoo.precision import policy_scope
 
 class Xception(object):
     """ Construct an Xception Convolution Neural Network """
     init_weights = 'glorot_uniform'
     _model = None
 
-    def __init__(self, input_shape=(229, 229, 3), n_classes=1000):
+    def __init__(self, input_shape=(229, 229, 3), n_classes=1000, dtype_policy=None):
         """ Construct an Xception Convolution Neural Network
-            input_shape: the input shape
-            n_classes  : number of output classes
+            input_shape : the input shape
+            n_classes   : number of output classes
+            dtype_policy: mixed precision policy of the layers (e.g., 'mixed_bfloat16'), default is float32
         """
-        # Create the input vector
-        inputs = Input(shape=input_shape)
+        # Build the layers with the mixed precision policy: e.g., bfloat16 compute with float32 variables
+        with policy_scope(dtype_policy):
+            # Create the input vector
+            inputs = Input(shape=input_shape)
 
-	# Create entry section with three blocks
-        x = Xception.entryFlow(inputs, [128, 256, 728])
+    	# Create entry section with three blocks
+            x = Xception.entryFlow(inputs, [128, 256, 728])
 
-	# Create the middle section with eight blocks
-        x = Xception.middleFlow(x, [728, 728, 728, 728, 728, 728, 728, 728 ])
+    	# Create the middle section with eight blocks
+            x = Xception.middleFlow(x, [728, 728, 728, 728, 728, 728, 728, 728 ])
 
-	# Create the exit section 
-        outputs = Xception.exitFlow(x, n_classes)
+    	# Create the exit section 
+            outputs = Xception.exitFlow(x, n_classes)
 
-	# Instantiate the model
-        self._model = Model(inputs, outputs)
+    	# Instantiate the model
+            self._model = Model(inputs, outputs)
 
     @property
     def model(self):
@@ -119,7 +123,9 @@ class Xception(object):
             x = GlobalAveragePooling2D()(x)
         
             # Fully connected output layer (classification)
-            x = Dense(n_classes, activation='softmax', kernel_initializer=init_weights)(x)
+            x = Dense(n_classes, kernel_initializer=init_weights)(x)
+            # The softmax is computed in float32 (for numerical stability with mixed precision)
+            x = Activation('softmax', dtype='float32')(x)
             return x
 
         if init_weights is None: